@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Parity and speed check of the ONNX embedding backend against PyTorch
+
+Usage:
+    python benchmarks/embedding_parity.py
+    python benchmarks/embedding_parity.py --corpus manuscript.txt --no-quantize
+    python benchmarks/embedding_parity.py --min-mean-cosine 0.995 --output parity.json
+
+Exits non-zero when cosine agreement falls below the thresholds, so it can
+gate a deploy that switches EMBEDDING_BACKEND to onnx.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.indexing.embedding_backend import (
+    TorchEmbeddingBackend, OnnxEmbeddingBackend, check_parity
+)
+from services.indexing.vector_store import EMBEDDING_MODEL_NAME
+
+SAMPLE_TEXTS = [
+    "The rain had not stopped for three days, and the river was climbing the garden wall.",
+    "Mara folded the letter twice before hiding it beneath the loose floorboard.",
+    "\"You promised you'd come back,\" she said, not looking up from the fire.",
+    "The captain studied the map while the crew argued about the missing supplies.",
+    "Chapter Four: The Lighthouse Keeper",
+    "Nobody in the village remembered when the clock tower had last chimed the hour.",
+    "He ran. Behind him the dogs were barking, closer now, and the torches bobbed between the trees.",
+    "Her grandmother's recipe called for saffron, which they could no longer afford.",
+    "The detective noticed that the window latch had been forced from the inside.",
+    "Spring arrived late that year, the orchards bare until the first week of May.",
+    "A short one.",
+    "They signed the treaty at dawn, each side certain the other would break it by winter.",
+]
+
+
+def load_corpus(path: str, limit: int):
+    with open(path, encoding='utf-8') as f:
+        paragraphs = [p.strip() for p in f.read().split('\n\n') if p.strip()]
+    return paragraphs[:limit]
+
+
+def throughput(backend, texts, repeats: int) -> float:
+    backend.encode(texts[:8])  # warm up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        backend.encode(texts)
+    elapsed = time.perf_counter() - started
+    return len(texts) * repeats / elapsed if elapsed > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='Text file whose paragraphs are embedded')
+    parser.add_argument('--limit', type=int, default=512, help='Max paragraphs taken from --corpus')
+    parser.add_argument('--export-dir', default='./onnx_models/' + EMBEDDING_MODEL_NAME.replace('/', '_'))
+    parser.add_argument('--no-quantize', action='store_true', help='Compare the float32 ONNX graph')
+    parser.add_argument('--threads', type=int, default=0, help='Intra-op threads (0 = physical cores)')
+    parser.add_argument('--repeats', type=int, default=3, help='Timing repetitions')
+    parser.add_argument('--min-mean-cosine', type=float, default=0.99)
+    parser.add_argument('--min-cosine', type=float, default=0.95)
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, args.limit) if args.corpus else SAMPLE_TEXTS
+
+    reference = TorchEmbeddingBackend(EMBEDDING_MODEL_NAME, num_threads=args.threads or None)
+    candidate = OnnxEmbeddingBackend(EMBEDDING_MODEL_NAME, args.export_dir,
+                                     quantize=not args.no_quantize, num_threads=args.threads or None)
+
+    report = check_parity(reference, candidate, texts)
+    report['texts_per_second'] = {
+        reference.name: throughput(reference, texts, args.repeats),
+        candidate.name: throughput(candidate, texts, args.repeats)
+    }
+    report['passed'] = (report['mean_cosine'] >= args.min_mean_cosine and
+                        report['min_cosine'] >= args.min_cosine)
+
+    print(f"📊 {candidate.name} vs {reference.name} on {report['texts']} texts")
+    print(f"   mean cosine:   {report['mean_cosine']:.4f} (>= {args.min_mean_cosine})")
+    print(f"   min cosine:    {report['min_cosine']:.4f} (>= {args.min_cosine})")
+    print(f"   neighbour agreement: {report['nearest_neighbour_agreement']:.3f}")
+    for name, rate in report['texts_per_second'].items():
+        print(f"   {name:<10} {rate:8.1f} texts/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+    if not report['passed']:
+        print("❌ Parity check failed")
+        sys.exit(1)
+    print("✅ Parity check passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Ingestion and retrieval benchmark for services/indexing
+
+Usage:
+    python benchmarks/indexing_benchmark.py --sizes 10,50,200 --output results.json
+    python benchmarks/indexing_benchmark.py --baseline baseline.json --fail-on-regression
+    python benchmarks/indexing_benchmark.py --embeddings hash --words 20000 --dialogue 0.6
+
+Synthetic manuscripts are indexed into a throwaway Chroma directory in
+growing increments; after each increment the corpus is measured at that
+size:
+
+    chunk_document throughput      chunks/sec and MB/sec
+    add_document throughput        docs/sec for the increment
+    search / keyword_search        p50/p95/p99 latency
+    PathRetriever.retrieve_paths   p50/p95/p99 latency
+    memory                         current and peak RSS
+
+Before that, one paragraph is inserted near the top of a --edit-words
+manuscript and re-synced; the run exits 1 if more than --max-edit-churn
+chunks are added or removed (chunk boundaries should line up again right
+after the edit).
+
+Gemini is replaced by a stub that "extracts" the synthetic cast, so no API
+key or network is needed. --embeddings hash also replaces the embedding
+model with a deterministic hashing embedder, for machines without the
+model weights (its numbers measure pipeline overhead, not model cost).
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import hashlib
+import platform
+import logging
+import tempfile
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Measure the index, not the persistent embedding cache from earlier runs
+os.environ.setdefault('EMBEDDING_CACHE_DIR', '')
+
+import numpy as np
+import networkx as nx
+
+from services.indexing import embedding_backend as embedding_backends
+from services.indexing.embedding_backend import EmbeddingBackend, process_rss_mb
+from services.indexing.vector_store import VectorStore, EMBEDDING_MODEL_NAME, EMBEDDING_DIMENSION
+from services.indexing.graph_builder import GeminiGraphBuilder
+from services.indexing.path_retriever import PathRetriever
+
+# Metrics where a larger value is a regression; everything else is a throughput
+LOWER_IS_BETTER = ('_ms', '_mb')
+
+SYLLABLES = ["ka", "ren", "mor", "li", "tha", "vel", "dra", "si", "on", "bel", "quin", "ar", "zo", "mi", "tor"]
+PLACES = ["harbour", "mill", "chapel", "orchard", "lighthouse", "market", "manor", "forest", "bridge", "tavern"]
+WORDS = ("the a of and to in was had her his their it that with for on at by from as but not "
+         "rain river wall letter fire map crew village clock tower dogs torches trees winter "
+         "morning shadow door window voice silence road garden stone promise memory storm "
+         "walked watched whispered remembered waited turned reached laughed carried opened "
+         "slowly quietly cold bright narrow distant heavy old strange familiar broken").split()
+
+
+class StubGeminiService:
+    """
+    Offline stand-in for GeminiService
+
+    Answers the graph builder's extraction prompt with the cast members and
+    places that appear in the text, and INTERACTS_WITH / LOCATED_IN edges
+    between those that co-occur - the same JSON shape Gemini returns.
+    """
+
+    model = None
+
+    def __init__(self, cast: List[str], places: List[str]):
+        self.cast = cast
+        self.places = places
+        self.calls = 0
+
+    async def generate_response(self, prompt: str, **kwargs) -> str:
+        self.calls += 1
+        text = prompt.rsplit("Text to analyze:", 1)[-1]
+        characters = [name for name in self.cast if name in text]
+        places = [place for place in self.places if place in text]
+
+        entities = [{'text': name, 'type': 'CHARACTER', 'start_pos': text.find(name),
+                     'end_pos': text.find(name) + len(name), 'confidence': 0.9} for name in characters]
+        entities += [{'text': place, 'type': 'LOCATION', 'start_pos': text.find(place),
+                      'end_pos': text.find(place) + len(place), 'confidence': 0.8} for place in places]
+        relationships = [{'source': a, 'target': b, 'relation_type': 'INTERACTS_WITH',
+                          'confidence': 0.8, 'context': ''} for a, b in zip(characters, characters[1:])]
+        relationships += [{'source': name, 'target': places[i % len(places)], 'relation_type': 'LOCATED_IN',
+                           'confidence': 0.7, 'context': ''} for i, name in enumerate(characters) if places]
+        return json.dumps({'entities': entities, 'relationships': relationships})
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Deterministic bag-of-words hashing embedder (no model weights needed)"""
+
+    name = "hash"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.md5(token.encode()).digest()
+                vectors[row, int.from_bytes(digest[:4], 'little') % self.dimension] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+def make_cast(size: int, rng: random.Random) -> List[str]:
+    names = set()
+    while len(names) < size:
+        names.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize())
+    return sorted(names)
+
+
+def synthetic_manuscript(rng: random.Random, cast: List[str], words: int, dialogue: float) -> str:
+    """
+    A manuscript of roughly `words` words
+
+    Chapters of paragraphs; `dialogue` is the fraction of paragraphs that are
+    quoted speech attributed to a cast member.
+    """
+    paragraphs = []
+    written = 0
+    chapter = 1
+    while written < words:
+        if not paragraphs or rng.random() < 0.03:
+            paragraphs.append(f"Chapter {chapter}")
+            chapter += 1
+        speaker = rng.choice(cast)
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            body = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+            if rng.random() < 0.4:
+                body.insert(rng.randrange(len(body)), rng.choice(cast))
+            if rng.random() < 0.15:
+                body.append(f"near the {rng.choice(PLACES)}")
+            sentences.append(" ".join(body).capitalize() + ".")
+        if rng.random() < dialogue:
+            paragraph = f'"{" ".join(sentences)}" {speaker} said.'
+        else:
+            paragraph = f"{speaker} " + " ".join(sentences)
+        paragraphs.append(paragraph)
+        written += len(paragraph.split())
+    return "\n\n".join(paragraphs)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3)
+    }
+
+
+def timed(fn, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+    except ImportError:
+        return None
+
+
+def add_mentions(graph: nx.DiGraph, doc_graph: nx.DiGraph, doc_id: str):
+    """Merge one document's graph into the corpus graph, recording mentions"""
+    for node, data in doc_graph.nodes(data=True):
+        if node not in graph:
+            graph.add_node(node, **data, mentions=[])
+        graph.nodes[node]['mentions'].append({'doc_id': doc_id})
+    graph.add_edges_from(doc_graph.edges(data=True))
+
+
+def edit_locality(store: VectorStore, rng: random.Random, cast: List[str], words: int) -> Dict[str, Any]:
+    """
+    Chunks re-encoded when one paragraph is inserted near the top of a manuscript
+
+    Chunk boundaries are content-defined, so the chunking should line up again
+    right after the edit: only a constant number of chunks may be added or
+    removed, however long the manuscript is.
+    """
+    text = synthetic_manuscript(rng, cast, words, 0.3)
+    store.sync_document(text, 'bench-edit', {'user_id': 0, 'title': 'bench-edit'})
+    paragraphs = text.split("\n\n")
+    inserted = synthetic_manuscript(rng, cast, 150, 0.0).split("\n\n")[1]
+    paragraphs.insert(min(3, len(paragraphs)), inserted)
+    delta = store.sync_document("\n\n".join(paragraphs), 'bench-edit', {'user_id': 0, 'title': 'bench-edit'})
+    store.delete_document('bench-edit')
+    return {key: delta[key] for key in ('added', 'removed', 'moved', 'unchanged') if key in delta}
+
+
+def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    cast = make_cast(args.cast, rng)
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    if args.embeddings == 'hash':
+        embedding_backends._backends[EMBEDDING_MODEL_NAME] = HashingEmbeddingBackend(EMBEDDING_DIMENSION)
+
+    persist_directory = tempfile.mkdtemp(prefix='indexing_benchmark_')
+    store = VectorStore('benchmark', persist_directory=persist_directory)
+    gemini = StubGeminiService(cast, PLACES)
+    graph_builder = GeminiGraphBuilder(gemini_service=gemini)
+    graph = nx.DiGraph()
+    retriever = PathRetriever(graph, store)
+
+    queries = [f"{rng.choice(cast)} {' '.join(rng.sample(WORDS, 4))}" for _ in range(args.queries)]
+    if args.embeddings == 'model':
+        store.warmup()
+
+    results = []
+    indexed = 0
+    total_chunks = 0
+    try:
+        locality = edit_locality(store, rng, cast, args.edit_words)
+        print(f"✂️ Inserted paragraph into a {args.edit_words}-word manuscript: "
+              f"{locality.get('added')} chunks added, {locality.get('removed')} removed, "
+              f"{locality.get('moved')} moved")
+
+        for size in sizes:
+            documents = [synthetic_manuscript(rng, cast, args.words, args.dialogue)
+                         for _ in range(size - indexed)]
+            doc_ids = [f"bench-{indexed + i}" for i in range(len(documents))]
+            total_bytes = sum(len(text.encode('utf-8')) for text in documents)
+
+            # Chunking alone (no embedding)
+            chunk_count = 0
+            started = time.perf_counter()
+            for doc_id, text in zip(doc_ids, documents):
+                chunk_count += len(store.chunk_document(text, doc_id))
+            chunk_seconds = time.perf_counter() - started
+            total_chunks += chunk_count
+
+            # Full ingestion: chunk + embed + insert
+            started = time.perf_counter()
+            for i, (doc_id, text) in enumerate(zip(doc_ids, documents)):
+                store.add_document(text, doc_id, {'user_id': i % args.users, 'title': doc_id})
+            add_seconds = time.perf_counter() - started
+
+            # Graph extraction through the stubbed Gemini service
+            started = time.perf_counter()
+            for doc_id, text in zip(doc_ids, documents):
+                doc_graph = asyncio.run(graph_builder.analyze_text(text))
+                add_mentions(graph, doc_graph, doc_id)
+            graph_seconds = time.perf_counter() - started
+            indexed = size
+
+            search_times = [timed(store.search, query, 5) for query in queries]
+            keyword_times = [timed(store.keyword_search, query, 5) for query in queries] \
+                if store.keyword_index is not None else []
+            path_times = [timed(retriever.retrieve_paths, query, 5) for query in queries[:args.path_queries]]
+
+            result = {
+                'documents': size,
+                'chunks': total_chunks,
+                'graph_nodes': graph.number_of_nodes(),
+                'graph_edges': graph.number_of_edges(),
+                'chunk_document': {
+                    'chunks_per_sec': round(chunk_count / chunk_seconds, 1) if chunk_seconds else None,
+                    'mb_per_sec': round(total_bytes / 1e6 / chunk_seconds, 2) if chunk_seconds else None
+                },
+                'add_document': {
+                    'docs_per_sec': round(len(documents) / add_seconds, 2) if add_seconds else None,
+                    'chunks_per_sec': round(chunk_count / add_seconds, 1) if add_seconds else None
+                },
+                'graph_build': {
+                    'docs_per_sec': round(len(documents) / graph_seconds, 2) if graph_seconds else None
+                },
+                'search': percentiles(search_times),
+                'keyword_search': percentiles(keyword_times),
+                'retrieve_paths': percentiles(path_times),
+                'memory': {'rss_mb': process_rss_mb(), 'peak_rss_mb': peak_rss_mb()}
+            }
+            results.append(result)
+
+            print(f"📊 {size} docs / {result['chunks']} chunks: "
+                  f"chunk {result['chunk_document']['chunks_per_sec']}/s, "
+                  f"add {result['add_document']['docs_per_sec']} docs/s, "
+                  f"search p95 {result['search'].get('p95_ms')} ms, "
+                  f"paths p95 {result['retrieve_paths'].get('p95_ms')} ms, "
+                  f"peak RSS {result['memory']['peak_rss_mb']} MB")
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+    return {
+        'created_at': datetime.now().isoformat(),
+        'config': {
+            'sizes': sizes, 'words': args.words, 'dialogue': args.dialogue, 'cast': args.cast,
+            'users': args.users, 'queries': args.queries, 'path_queries': args.path_queries,
+            'embeddings': args.embeddings, 'seed': args.seed, 'edit_words': args.edit_words
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'embedding_backend': os.environ.get('EMBEDDING_BACKEND', 'torch')
+        },
+        'edit_locality': locality,
+        'results': results
+    }
+
+
+def flatten(result: Dict[str, Any]) -> Dict[str, float]:
+    """{'search': {'p95_ms': 3}} -> {'search.p95_ms': 3}"""
+    flat = {}
+    for section, values in result.items():
+        if isinstance(values, dict):
+            for metric, value in values.items():
+                if isinstance(value, (int, float)):
+                    flat[f"{section}.{metric}"] = value
+    return flat
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Metrics that got worse than the baseline by more than `tolerance`
+
+    Sizes are matched by document count; latency and memory regress when
+    they grow, throughputs when they shrink.
+    """
+    baseline_by_size = {result['documents']: flatten(result) for result in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        previous = baseline_by_size.get(result['documents'])
+        if not previous:
+            continue
+        for metric, value in flatten(result).items():
+            before = previous.get(metric)
+            if not before:
+                continue
+            change = (value - before) / before
+            worse = change > tolerance if metric.endswith(LOWER_IS_BETTER) else change < -tolerance
+            if worse:
+                regressions.append({'documents': result['documents'], 'metric': metric,
+                                    'baseline': before, 'current': value, 'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,50,200', help='Comma-separated corpus sizes (documents)')
+    parser.add_argument('--words', type=int, default=5000, help='Words per manuscript')
+    parser.add_argument('--dialogue', type=float, default=0.3, help='Fraction of dialogue paragraphs')
+    parser.add_argument('--cast', type=int, default=12, help='Number of characters')
+    parser.add_argument('--users', type=int, default=4, help='Distinct user_ids the documents belong to')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--path-queries', type=int, default=50, help='Queries timed through retrieve_paths')
+    parser.add_argument('--embeddings', choices=('model', 'hash'), default='model',
+                        help='Production embedding model, or a hashing embedder for offline runs')
+    parser.add_argument('--edit-words', type=int, default=33000,
+                        help='Words in the manuscript used for the edit-locality check')
+    parser.add_argument('--max-edit-churn', type=int, default=4,
+                        help='Exit 1 when a one-paragraph edit adds or removes more chunks than this')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 when a metric regresses')
+    parser.add_argument('--verbose', action='store_true', help='Keep per-chunk INFO logging')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    report = run(args)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        report['baseline'] = {'path': args.baseline, 'tolerance': args.tolerance, 'regressions': regressions}
+        if regressions:
+            print(f"⚠️ {len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression['documents']:>6} docs  {regression['metric']:<28} "
+                      f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.0%})")
+        else:
+            print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+    locality = report['edit_locality']
+    churn = max(locality.get('added', 0), locality.get('removed', 0))
+    if churn > args.max_edit_churn:
+        print(f"❌ A one-paragraph edit re-chunked {churn} chunks (limit {args.max_edit_churn})")
+        sys.exit(1)
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+-- Indexing Jobs Migration
+-- Durable queue for background indexing (/api/indexing/index-document, /index-folder)
+-- Engineering rationale: indexing runs minutes of embedding and Gemini extraction;
+-- doing it inside the HTTP request ties up a worker and is lost on redeploy.
+-- Jobs are claimed with a lease, so a crashed instance's work is picked up again.
+
+-- 1. Indexing Jobs Table
+CREATE TABLE indexing_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    job_type VARCHAR(50) NOT NULL,                -- 'index_document' | 'index_folder'
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    idempotency_key VARCHAR(255),                 -- Client-supplied; retries return the same job
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- Retry backoff: not claimable before this
+    lease_owner VARCHAR(100),                     -- Worker currently holding the job
+    lease_expires_at TIMESTAMPTZ,                 -- Expired leases are reclaimed by other workers
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    result JSONB,
+    last_error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- 2. Performance Indexes
+-- Idempotency: one job per (user, key)
+CREATE UNIQUE INDEX idx_indexing_jobs_idempotency ON indexing_jobs(user_id, idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+-- Claim query: queued jobs that are due, oldest first
+CREATE INDEX idx_indexing_jobs_claimable ON indexing_jobs(run_after, created_at)
+    WHERE status = 'queued';
+
+-- Lease recovery: running jobs whose worker stopped heartbeating
+CREATE INDEX idx_indexing_jobs_leases ON indexing_jobs(lease_expires_at)
+    WHERE status = 'running';
+
+-- Status listing per user
+CREATE INDEX idx_indexing_jobs_user ON indexing_jobs(user_id, created_at DESC);
+
+-- 3. Cleanup Function
+-- Finished jobs are only needed for status polling; drop them after a week
+CREATE OR REPLACE FUNCTION cleanup_finished_indexing_jobs(keep_days INTEGER DEFAULT 7)
+RETURNS INTEGER AS $$
+DECLARE
+    deleted INTEGER;
+BEGIN
+    DELETE FROM indexing_jobs
+    WHERE status IN ('succeeded', 'failed', 'cancelled')
+      AND finished_at < NOW() - make_interval(days => keep_days);
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,19 @@
+-- User Knowledge Graphs Migration
+-- Durable per-user knowledge graphs for path retrieval (services/indexing/graph_store.py)
+-- Engineering rationale: the indexer used to keep one in-process graph that every
+-- indexed document replaced. Each user's graph is now merged document by document,
+-- stored here, and loaded on first use, so a restart or eviction loses nothing.
+
+-- 1. User Knowledge Graphs Table
+CREATE TABLE user_knowledge_graphs (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    graph JSONB NOT NULL,                  -- {"nodes": [...], "edges": [...]}; nodes carry mentions, edges doc_ids
+    node_count INTEGER NOT NULL DEFAULT 0,
+    edge_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- 2. Performance Indexes
+-- Size reporting / finding the largest graphs
+CREATE INDEX idx_user_knowledge_graphs_size ON user_knowledge_graphs(node_count DESC);
@@ -7,6 +7,7 @@ consistency and adherence to the DRY (Don't Repeat Yourself) principle.
 """
 
 import logging
+import os
 import time
 from typing import Union
 from fastapi import Depends, HTTPException, status, Request
@@ -85,6 +86,30 @@ def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(secu
             message="Could not validate credentials due to a server error.",
         )
 
+def get_operator_user_id(user_id: Union[str, int] = Depends(get_current_user_id)) -> Union[str, int]:
+    """
+    FastAPI dependency for operator-only endpoints (model warmup, index snapshots).
+
+    Operators are the user IDs listed in OPERATOR_USER_IDS (comma-separated).
+    With the variable unset nobody qualifies, so these endpoints are closed
+    by default. Guest sessions never match a listed ID.
+
+    Returns:
+        The authenticated operator's user ID
+
+    Raises:
+        HTTPException: 403 for any other authenticated user
+    """
+    operators = {value.strip() for value in os.getenv("OPERATOR_USER_IDS", "").split(",") if value.strip()}
+    if str(user_id) not in operators:
+        logger.warning(f"Operator endpoint refused for user_id: {user_id}")
+        raise error_response(
+            status_code=status.HTTP_403_FORBIDDEN,
+            code="OPERATOR_REQUIRED",
+            message="This endpoint is restricted to operators.",
+        )
+    return user_id
+
 # New PostgreSQL-based rate limiting dependency
 async def check_rate_limit_dependency(
     request: Request,
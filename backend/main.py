@@ -157,6 +157,37 @@ if len(JWT_SECRET_KEY) < 32:
 
 logger.info("✅ JWT_SECRET_KEY configured (length: %d chars)", len(JWT_SECRET_KEY))
 
+async def _restore_index_snapshot():
+    """Load the index snapshot, if any, in a worker thread"""
+    try:
+        from services.indexing.hybrid_indexer import get_hybrid_indexer
+        indexer = get_hybrid_indexer(collection_name="documents")
+        result = await asyncio.to_thread(indexer.restore_snapshot)
+        if not result.get('restored'):
+            logger.info(f"No index snapshot restored: {result.get('reason')}")
+    except Exception as e:
+        logger.error(f"⚠️ Index snapshot restore failed (index will be rebuilt on demand): {e}")
+
+async def _start_indexing_jobs():
+    """Start the indexing job worker pool"""
+    try:
+        from services.indexing.hybrid_indexer import get_hybrid_indexer
+        indexer = get_hybrid_indexer(collection_name="documents")
+        await indexer.job_pool.start()
+    except Exception as e:
+        logger.error(f"⚠️ Indexing job pool failed to start (jobs will queue until restart): {e}")
+
+async def _warmup_embedding_model():
+    """Load the embedding model and run one inference in a worker thread"""
+    try:
+        from services.indexing.hybrid_indexer import get_hybrid_indexer
+        indexer = get_hybrid_indexer(collection_name="documents")
+        stats = await asyncio.to_thread(indexer.vector_store.warmup)
+        logger.info(f"🔥 Embedding model warm: loaded in {stats.get('load_seconds')}s, "
+                    f"first inference {stats.get('warmup_ms')}ms, RSS {stats.get('process_rss_mb')}MB")
+    except Exception as e:
+        logger.error(f"⚠️ Embedding model warmup failed (will load on first use): {e}")
+
 # App initialization
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -201,6 +232,26 @@ async def lifespan(app: FastAPI):
         app.state.startup_success = startup_success
         app.state.startup_errors = startup_errors
         
+        # First use of the indexer builds it here (Chroma client, embedding
+        # cache, graph store) rather than at import.
+        # Restore the vector index from the last snapshot
+        # (INDEX_SNAPSHOT_PATH) so a redeploy does not start from an empty index
+        await _restore_index_snapshot()
+
+        # Background indexing jobs (database/migrations/003_indexing_jobs.sql);
+        # INDEX_JOB_WORKERS=0 leaves this instance enqueue-only
+        await _start_indexing_jobs()
+
+        # Warm the embedding model off the request path.
+        # EMBEDDING_WARMUP: background (default) | blocking | off
+        warmup_mode = os.getenv('EMBEDDING_WARMUP', 'background').lower()
+        if warmup_mode in ('background', 'blocking'):
+            warmup = _warmup_embedding_model()
+            if warmup_mode == 'blocking':
+                await warmup
+            else:
+                app.state.embedding_warmup_task = asyncio.create_task(warmup)
+
         yield
         
     except Exception as e:
@@ -215,6 +266,28 @@ async def lifespan(app: FastAPI):
         # This allows the health endpoint to return error information
         yield
     finally:
+        try:
+            # Release running indexing jobs to the queue, index pending saves,
+            # write back changed knowledge graphs, snapshot the index for the
+            # next instance, then drain the embedding worker so queued encodes
+            # fail fast instead of hanging
+            from services.indexing.hybrid_indexer import HybridIndexer
+            if HybridIndexer._instance is not None:
+                await HybridIndexer._instance.job_pool.stop()
+                await HybridIndexer._instance.reindex_scheduler.flush()
+                saved = await asyncio.to_thread(HybridIndexer._instance.graph_store.flush)
+                if saved:
+                    logger.info(f"💾 Saved {saved} knowledge graphs")
+                if os.getenv('INDEX_SNAPSHOT_ON_SHUTDOWN', 'true').lower() in ('1', 'true', 'yes'):
+                    try:
+                        result = await asyncio.to_thread(HybridIndexer._instance.save_snapshot)
+                        logger.info(f"💾 Shutdown snapshot: {result}")
+                    except Exception as e:
+                        logger.error(f"⚠️ Shutdown snapshot failed: {e}")
+                await HybridIndexer._instance.embedding_worker.stop()
+        except Exception as e:
+            logger.error(f"⚠️ Error during indexer shutdown: {e}")
+
         logger.info("🔄 Shutting down database connections...")
         try:
             # Ensure we're in the right context for database cleanup
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Move indexed chunks from the single vector collection into per-user partitions
+
+Run once after switching VECTOR_PARTITIONING to per_user or hashed:
+    VECTOR_PARTITIONING=hashed python migrate_vector_partitions.py
+    VECTOR_PARTITIONING=per_user python migrate_vector_partitions.py --keep-source
+
+Safe to re-run: chunks are upserted into their partitions.
+"""
+
+import os
+import sys
+import argparse
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from services.indexing.vector_store import VectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--collection', default='documents', help='Base collection name')
+    parser.add_argument('--persist-directory', default='./chroma_db')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--keep-source', action='store_true',
+                        help='Leave migrated chunks in the base collection too')
+    args = parser.parse_args()
+
+    store = VectorStore(args.collection, persist_directory=args.persist_directory)
+    strategy = store.collection_router.strategy
+    if strategy == 'single':
+        print("❌ Set VECTOR_PARTITIONING=per_user or hashed before migrating")
+        sys.exit(1)
+
+    print(f"📦 Migrating '{store.collection.name}' into {strategy} partitions...")
+    result = store.migrate_to_partitions(args.batch_size, delete_source=not args.keep_source)
+    print(f"✅ Moved {result['moved']} chunks into {len(result['partitions'])} partitions "
+          f"({result['kept']} chunks without a user_id stay in '{store.collection.name}')")
+
+
+if __name__ == '__main__':
+    main()
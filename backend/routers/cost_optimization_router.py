@@ -85,6 +85,7 @@ async def get_cost_optimization_dashboard(
                 "rate_limit_tier": rate_limit_status
             },
             "daily_breakdown": daily_stats,
+            "folder_context_cache": _folder_context_cache_stats(user_id),
             "optimizations_active": {
                 "batch_processing": True,
                 "intelligent_caching": True,
@@ -149,6 +150,7 @@ async def get_cache_statistics(
         return {
             "cache_types": cache_stats or [],
             "endpoint_hit_rates": hit_rate_stats or [],
+            "folder_context_cache": _folder_context_cache_stats(user_id),
             "recommendations": _generate_cache_recommendations(cache_stats, hit_rate_stats)
         }
         
@@ -219,6 +221,17 @@ async def cleanup_expired_data(
         logger.error(f"Error during manual cleanup: {e}")
         raise HTTPException(status_code=500, detail="Cleanup failed")
 
+def _folder_context_cache_stats(user_id: int) -> Optional[Dict[str, Any]]:
+    """In-process folder context cache hit rate (None until the indexer is loaded)"""
+    from services.indexing.hybrid_indexer import HybridIndexer
+    indexer = HybridIndexer._instance
+    if indexer is None or getattr(indexer, 'context_cache', None) is None:
+        return None
+    return {
+        "user": indexer.context_cache.stats(user_id),
+        "overall": indexer.context_cache.stats()
+    }
+
 def _generate_cost_recommendations(daily_stats: List[Dict], cache_hit_rate: float) -> List[str]:
     """Generate personalized cost optimization recommendations."""
     recommendations = []
@@ -6,7 +6,7 @@ Extracted from main.py as part of God File refactoring.
 
 import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, Union
 from fastapi import APIRouter, HTTPException, Depends, Query, Request
 import json
@@ -159,6 +159,25 @@ async def get_documents(
 
 # Template endpoint removed - template system deprecated for MVP
 
+def _schedule_reindex(document: dict, user_id: int):
+    """Queue a debounced index update for a saved document; never fails the save"""
+    try:
+        from services.indexing.hybrid_indexer import get_hybrid_indexer
+        indexer = get_hybrid_indexer(collection_name="documents")
+        metadata = {
+            'title': document.get('title'),
+            'user_id': user_id,
+            'folder_id': document.get('folder_id')
+        }
+        indexer.reindex_scheduler.notify_saved(
+            str(document['id']),
+            document.get('content') or '',
+            {key: value for key, value in metadata.items() if value is not None},
+            document.get('updated_at')
+        )
+    except Exception as e:
+        logger.warning(f"Could not schedule re-indexing of document {document.get('id')}: {e}")
+
 @router.post("")
 async def create_document(doc_data: DocumentCreate, request: Request, user_id: int = Depends(get_current_user_id)):
     """Create a new fiction document"""
@@ -200,6 +219,8 @@ async def create_document(doc_data: DocumentCreate, request: Request, user_id: i
         if not result:
             raise HTTPException(status_code=500, detail="Failed to create document")
         
+        _schedule_reindex(dict(result), user_id)
+
         # Format response
         document = dict(result)
         document['created_at'] = document['created_at'].isoformat() if document['created_at'] else None
@@ -304,6 +325,8 @@ async def update_document(
         if not result:
             raise HTTPException(status_code=500, detail="Failed to update document")
         
+        _schedule_reindex(dict(result), user_id)
+
         # Format response
         doc = dict(result)
         doc['created_at'] = doc['created_at'].isoformat() if doc['created_at'] else None
@@ -338,6 +361,12 @@ async def delete_document(document_id: str, request: Request, user_id: int = Dep
             (document_id, user_id)
         )
         
+        try:
+            from services.indexing.hybrid_indexer import get_hybrid_indexer
+            get_hybrid_indexer(collection_name="documents").reindex_scheduler.notify_deleted(document_id, user_id)
+        except Exception as e:
+            logger.warning(f"Could not schedule index removal of document {document_id}: {e}")
+
         logger.info(f"Document deleted: {document['title']} by user {user_id}")
         return {"message": "Document deleted successfully"}
         
@@ -359,7 +388,7 @@ async def auto_save_document(
         
         # Check if document exists and belongs to user
         existing = db_service.execute_query(
-            "SELECT id, content FROM documents WHERE id = %s AND user_id = %s",
+            "SELECT id, title, content, folder_id FROM documents WHERE id = %s AND user_id = %s",
             (document_id, user_id),
             fetch='one'
         )
@@ -370,13 +399,17 @@ async def auto_save_document(
         # Only save if content changed
         if existing['content'] != content:
             word_count = calculate_word_count(content)
+            saved_at = datetime.now(timezone.utc)
             
             db_service.execute_query(
                 """UPDATE documents 
                    SET content = %s, word_count = %s, updated_at = %s 
                    WHERE id = %s AND user_id = %s""",
-                (content, word_count, datetime.utcnow(), document_id, user_id)
+                (content, word_count, saved_at, document_id, user_id)
             )
+
+            # A burst of autosaves is coalesced into one index update
+            _schedule_reindex(dict(existing, content=content, updated_at=saved_at), user_id)
         
         return {"status": "auto_saved", "timestamp": datetime.utcnow().isoformat()}
         
@@ -2,20 +2,24 @@
 Indexing Router - API endpoints for document indexing and contextual retrieval
 """
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Header, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 import asyncio
+import json
 
-from dependencies import get_current_user_id
+from dependencies import get_current_user_id, get_operator_user_id
 from services.indexing.hybrid_indexer import get_hybrid_indexer
+from services.indexing.job_queue import job_to_dict
 
 # Initialize router
 router = APIRouter(prefix="/api/indexing", tags=["indexing"])
 
-# Initialize indexer using singleton pattern for memory optimization
+# Indexer singleton, built on first use (the app lifespan) rather than at import
 # MEMORY OPTIMIZATION: Reuses same instance instead of creating new 400MB+ models
-indexer = get_hybrid_indexer(collection_name="documents")
+def _indexer():
+    return get_hybrid_indexer(collection_name="documents")
 
 # Request/Response models
 class IndexDocumentRequest(BaseModel):
@@ -47,14 +51,17 @@ class SearchRequest(BaseModel):
 
 # Endpoints
 
-@router.post("/index-document")
+@router.post("/index-document", status_code=202)
 async def index_document(
     request: IndexDocumentRequest,
-    background_tasks: BackgroundTasks,
-    current_user_id: int = Depends(get_current_user_id)
+    current_user_id: int = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
-    Index a single document for enhanced contextual understanding
+    Queue a single document for enhanced contextual understanding
+
+    Returns 202 with a job ID; poll GET /jobs/{job_id}. Retrying with the same
+    Idempotency-Key header returns the original job instead of indexing twice.
     """
     try:
         # Add user metadata
@@ -62,49 +69,99 @@ async def index_document(
             request.metadata = {}
         request.metadata['user_id'] = current_user_id
         
-        # Index document
-        result = await indexer.index_document(
-            doc_id=request.doc_id,
-            text=request.text,
-            metadata=request.metadata
+        job, created = await _indexer().job_pool.enqueue(
+            current_user_id,
+            'index_document',
+            {'doc_id': request.doc_id, 'text': request.text, 'metadata': request.metadata},
+            idempotency_key
         )
-        
-        if not result['success']:
-            raise HTTPException(status_code=500, detail=result.get('error', 'Indexing failed'))
-        
-        return result
+        return {'job_id': str(job['id']), 'status': job['status'], 'created': created}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/index-folder")
+@router.post("/index-folder", status_code=202)
 async def index_folder(
     request: IndexFolderRequest,
-    background_tasks: BackgroundTasks,
-    current_user_id: int = Depends(get_current_user_id)
+    current_user_id: int = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
-    Index multiple related documents (e.g., chapters in a book)
+    Queue multiple related documents (e.g., chapters in a book) for indexing
+
+    Returns 202 with a job ID; GET /jobs/{job_id} has the job status and
+    /index-folder/{job_id}/progress the per-document pipeline progress.
     """
     try:
         # Prepare documents with user ID
         documents = []
         for doc in request.documents:
-            metadata = doc.get('metadata', {})
+            if 'doc_id' not in doc or 'text' not in doc:
+                raise HTTPException(status_code=422, detail="Each document needs doc_id and text")
+            metadata = doc.get('metadata') or {}
             metadata['user_id'] = current_user_id
-            documents.append((
-                doc['doc_id'],
-                doc['text'],
-                metadata
-            ))
-        
-        # Index folder
-        result = await indexer.index_folder(documents)
+            documents.append({'doc_id': doc['doc_id'], 'text': doc['text'], 'metadata': metadata})
         
-        return result
+        job, created = await _indexer().job_pool.enqueue(
+            current_user_id, 'index_folder', {'documents': documents}, idempotency_key
+        )
+        return {'job_id': str(job['id']), 'status': job['status'], 'created': created,
+                'documents': len(documents)}
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Status of an indexing job: queued, running, succeeded, failed or cancelled
+    """
+    try:
+        job = await _indexer().job_pool.get(job_id, current_user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Indexing job not found")
+    status = job_to_dict(job)
+    # Folder jobs running on this instance also report pipeline progress
+    progress = _indexer().indexing_jobs.get(status['id'])
+    if progress is not None and progress.owner == current_user_id:
+        status['progress'] = progress.to_dict()
+    return status
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(
+    job_id: str,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Cancel an indexing job; a running job stops at its next cancellation point
+    """
+    try:
+        job = await _indexer().job_pool.cancel(job_id, current_user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Indexing job not found")
+    return job_to_dict(job)
+
+@router.get("/index-folder/{job_id}/progress")
+async def index_folder_progress(
+    job_id: str,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Live progress of a folder indexing run: documents per stage, failures
+    """
+    progress = _indexer().indexing_jobs.get(job_id)
+    if progress is None or progress.owner != current_user_id:
+        raise HTTPException(status_code=404, detail="Indexing job not found")
+    return progress.to_dict()
 
 @router.post("/contextual-feedback")
 async def get_contextual_feedback(
@@ -115,10 +172,11 @@ async def get_contextual_feedback(
     Get contextual feedback for highlighted text
     """
     try:
-        feedback = await indexer.get_contextual_feedback(
+        feedback = await _indexer().get_contextual_feedback(
             highlighted_text=request.highlighted_text,
             doc_id=request.doc_id,
-            context_window=request.context_window
+            context_window=request.context_window,
+            user_id=current_user_id
         )
         
         return feedback
@@ -126,6 +184,40 @@ async def get_contextual_feedback(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/contextual-feedback/stream")
+async def stream_contextual_feedback(
+    request: ContextualFeedbackRequest,
+    http_request: Request,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Contextual feedback as server-sent events
+
+    Emits semantic_context, entities, narrative_paths and character_contexts
+    as each stage completes, then suggestions, then a final summary event
+    (the /contextual-feedback response). Disconnecting stops the remaining work.
+    """
+    async def generate_events():
+        events = _indexer().stream_contextual_feedback(
+            highlighted_text=request.highlighted_text,
+            doc_id=request.doc_id,
+            context_window=request.context_window,
+            user_id=current_user_id
+        )
+        try:
+            async for event, data in events:
+                if await http_request.is_disconnected():
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/check-consistency")
 async def check_consistency(
     request: ConsistencyCheckRequest,
@@ -135,10 +227,11 @@ async def check_consistency(
     Check consistency of a statement against the knowledge base
     """
     try:
-        result = await indexer.check_consistency(
+        result = await _indexer().check_consistency(
             statement=request.statement,
             doc_id=request.doc_id,
-            check_type=request.check_type
+            check_type=request.check_type,
+            user_id=current_user_id
         )
         
         return result
@@ -155,9 +248,10 @@ async def get_writing_suggestions(
     Get AI-powered writing suggestions based on context
     """
     try:
-        suggestions = await indexer.get_writing_suggestions(
+        suggestions = await _indexer().get_writing_suggestions(
             context=request.context,
-            suggestion_type=request.suggestion_type
+            suggestion_type=request.suggestion_type,
+            user_id=current_user_id
         )
         
         return suggestions
@@ -179,7 +273,7 @@ async def search(
             request.filters = {}
         request.filters['user_id'] = current_user_id
         
-        results = indexer.search(
+        results = _indexer().search(
             query=request.query,
             search_type=request.search_type,
             filters=request.filters
@@ -203,7 +297,7 @@ async def get_document_stats(
     Get indexing statistics for a document
     """
     try:
-        stats = indexer.get_document_stats(doc_id)
+        stats = _indexer().get_document_stats(doc_id)
         
         # Verify user owns this document
         if 'metadata' in stats and stats['metadata'].get('user_id') != current_user_id:
@@ -220,10 +314,10 @@ async def export_knowledge_graph(
     current_user_id: int = Depends(get_current_user_id)
 ):
     """
-    Export the knowledge graph for visualization
+    Export the user's knowledge graph for visualization
     """
     try:
-        graph_data = indexer.export_knowledge_graph(format)
+        graph_data = await _indexer().export_knowledge_graph(current_user_id, format)
         
         return {
             'format': format,
@@ -233,6 +327,33 @@ async def export_knowledge_graph(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/storage/dedup")
+async def dedup_storage(current_user_id: int = Depends(get_current_user_id)):
+    """
+    Storage saved for the current user by near-duplicate chunk deduplication
+    """
+    try:
+        stats = await asyncio.to_thread(_indexer().vector_store.dedup_stats, current_user_id)
+        if stats is None:
+            return {'enabled': False}
+        return {'enabled': True, 'user_id': current_user_id, **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/freshness")
+async def index_freshness(
+    doc_ids: str,
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Whether the index reflects each document's latest save (comma-separated doc_ids)
+    """
+    try:
+        ids = [doc_id.strip() for doc_id in doc_ids.split(',') if doc_id.strip()]
+        return {'documents': _indexer().get_index_freshness(ids, current_user_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Health check endpoint
 @router.get("/health")
 async def indexing_health():
@@ -241,7 +362,50 @@ async def indexing_health():
     """
     return {
         'status': 'healthy',
-        'indexed_documents': len(indexer.indexed_documents),
-        'graph_nodes': indexer.graph_builder.graph.number_of_nodes() if indexer.graph_builder.graph else 0,
-        'graph_edges': indexer.graph_builder.graph.number_of_edges() if indexer.graph_builder.graph else 0
-    } 
\ No newline at end of file
+        'indexed_documents': len(_indexer().indexed_documents),
+        'knowledge_graphs': _indexer().graph_store.stats(),
+        'embedding_model': _indexer().vector_store.model_stats(),
+        'embedding_cache': _indexer().vector_store.embedding_cache_stats(),
+        'vector_partitions': _indexer().vector_store.collection_router.stats(),
+        'keyword_index': _indexer().vector_store.keyword_index.stats() if _indexer().vector_store.keyword_index else None,
+        'document_index': _indexer().vector_store.document_index.stats(),
+        'sentence_index': _indexer().sentence_index.stats(),
+        'chunk_dedup': {
+            'references_added': _indexer().vector_store.deduplicator.duplicates_found,
+            'promotions': _indexer().vector_store.deduplicator.promotions
+        } if _indexer().vector_store.deduplicator else None,
+        'embedding_worker': _indexer().embedding_worker.metrics(),
+        'indexing_jobs': _indexer().job_pool.get_stats(),
+        'reindex_on_save': _indexer().reindex_scheduler.get_stats(),
+        'folder_context_cache': _indexer().context_cache.stats() if _indexer().context_cache else None,
+        'folder_context_tiers': _indexer().folder_tier_stats.stats()
+    }
+
+@router.post("/admin/warmup")
+async def warmup_embedding_model(current_user_id: int = Depends(get_operator_user_id)):
+    """
+    Load the embedding model (if not loaded yet) and run one inference
+
+    Operators only (OPERATOR_USER_IDS).
+    """
+    try:
+        return await asyncio.to_thread(_indexer().vector_store.warmup)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/admin/snapshot")
+async def snapshot_index(current_user_id: int = Depends(get_operator_user_id)):
+    """
+    Write the vector index snapshot file now
+
+    The snapshot holds chunk vectors and metadata, document stats and
+    freshness watermarks; the response lists its sections with chunk,
+    document and watermark counts. Knowledge graphs are not part of it:
+    they persist per user in the graph store as documents are indexed.
+    The snapshot covers every user's vectors, so this is operators only
+    (OPERATOR_USER_IDS).
+    """
+    try:
+        return await asyncio.to_thread(_indexer().save_snapshot)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
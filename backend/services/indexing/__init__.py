@@ -8,10 +8,12 @@ from .vector_store import VectorStore
 from .graph_builder import GeminiGraphBuilder
 from .path_retriever import PathRetriever
 from .hybrid_indexer import HybridIndexer
+from .embedding_cache import EmbeddingCache
 
 __all__ = [
     'VectorStore',
     'GeminiGraphBuilder', 
     'PathRetriever',
-    'HybridIndexer'
+    'HybridIndexer',
+    'EmbeddingCache'
 ] 
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+BM25 keyword index over vector store chunks
+Exact lexical matching for character names, invented words and rare terms
+that embeddings blur, kept in compact array-backed postings.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Sequence
+from array import array
+from collections import Counter
+import re
+import math
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Letters/digits with inner apostrophes ("don't", "o'brien"); underscores split
+_TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; possessive 's is dropped so "Mara's" matches "Mara\""""
+    tokens = _TOKEN_RE.findall(text.lower().replace('’', "'"))
+    return [token[:-2] if token.endswith("'s") else token for token in tokens]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)
+
+    Rank-based, so BM25 scores and cosine similarities never have to be put
+    on a common scale.
+
+    Returns:
+        (id, fused score) pairs, best first
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Incremental in-memory BM25 (Okapi) index
+
+    Each term's postings are two parallel array('i') buffers (chunk slots and
+    term frequencies), 8 bytes per posting, scored with numpy views. Removed
+    chunks are tombstoned and postings are compacted once tombstones pile up.
+
+    A few metadata fields (doc_id, user_id by default) are kept per chunk so
+    searches can be scoped with simple equality filters.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75,
+                 filter_fields: Iterable[str] = ('doc_id', 'user_id')):
+        self.k1 = k1
+        self.b = b
+        self.filter_fields = tuple(filter_fields)
+
+        self._lock = threading.RLock()
+        self.vocab: Dict[str, int] = {}
+        self._post_slots: List[array] = []
+        self._post_tfs: List[array] = []
+        self._df = array('i')
+
+        self.ids: List[Optional[str]] = []
+        self.id_to_slot: Dict[str, int] = {}
+        self._lengths = array('i')
+        self._alive = array('b')
+        self._slot_terms: List[Optional[array]] = []
+        self._fields: Dict[str, List[Any]] = {field: [] for field in self.filter_fields}
+
+        self._live = 0
+        self._dead = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.id_to_slot
+
+    def add(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Index chunks (re-adding an ID replaces it)"""
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            self.remove([chunk_id for chunk_id in ids if chunk_id in self.id_to_slot])
+            for chunk_id, text, chunk_meta in zip(ids, texts, metadatas):
+                tokens = tokenize(text or "")
+                counts = Counter(tokens)
+                slot = len(self.ids)
+
+                term_ids = array('i')
+                for term, tf in counts.items():
+                    term_id = self.vocab.get(term)
+                    if term_id is None:
+                        term_id = len(self._post_slots)
+                        self.vocab[term] = term_id
+                        self._post_slots.append(array('i'))
+                        self._post_tfs.append(array('i'))
+                        self._df.append(0)
+                    self._post_slots[term_id].append(slot)
+                    self._post_tfs[term_id].append(tf)
+                    self._df[term_id] += 1
+                    term_ids.append(term_id)
+
+                self.ids.append(chunk_id)
+                self.id_to_slot[chunk_id] = slot
+                self._lengths.append(len(tokens))
+                self._alive.append(1)
+                self._slot_terms.append(term_ids)
+                for field in self.filter_fields:
+                    self._fields[field].append((chunk_meta or {}).get(field))
+
+                self._live += 1
+                self._total_length += len(tokens)
+
+    def remove(self, ids: Iterable[str]):
+        """Tombstone chunks; postings are reclaimed by compact()"""
+        with self._lock:
+            for chunk_id in ids:
+                slot = self.id_to_slot.pop(chunk_id, None)
+                if slot is None:
+                    continue
+                for term_id in self._slot_terms[slot]:
+                    self._df[term_id] -= 1
+                self._slot_terms[slot] = None
+                self.ids[slot] = None
+                self._alive[slot] = 0
+                self._live -= 1
+                self._dead += 1
+                self._total_length -= self._lengths[slot]
+
+            if self._dead > 1024 and self._dead > self._live:
+                self.compact()
+
+    def search(self, query: str, k: int = 10,
+               filter_dict: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k chunks by BM25 score
+
+        Args:
+            query: Free-text query
+            k: Number of results
+            filter_dict: Equality filter on the indexed fields ({"user_id": 1},
+                         {"doc_id": {"$eq": "x"}} or an "$and" of those)
+
+        Returns:
+            (chunk_id, score) pairs, best first
+        """
+        conditions = self._parse_filter(filter_dict)
+        with self._lock:
+            if not self._live or k <= 0:
+                return []
+            term_ids = {self.vocab[term] for term in tokenize(query) if term in self.vocab}
+            if not term_ids:
+                return []
+
+            n_docs = self._live
+            avg_length = self._total_length / n_docs if n_docs else 1.0
+            lengths = np.frombuffer(self._lengths, dtype=np.int32)
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+
+            for term_id in term_ids:
+                df = self._df[term_id]
+                if df <= 0:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                slots = np.frombuffer(self._post_slots[term_id], dtype=np.int32)
+                tfs = np.frombuffer(self._post_tfs[term_id], dtype=np.int32).astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths[slots] / avg_length)
+                # A slot appears at most once per term, so fancy-index += is safe
+                scores[slots] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+            scores *= np.frombuffer(self._alive, dtype=np.int8)
+            candidates = np.flatnonzero(scores > 0)
+            if conditions:
+                candidates = np.array([slot for slot in candidates if all(
+                    self._fields[field][slot] == value for field, value in conditions
+                )], dtype=np.int64)
+            if candidates.size == 0:
+                return []
+
+            if candidates.size > k:
+                top = np.argpartition(-scores[candidates], k - 1)[:k]
+                candidates = candidates[top]
+            order = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(self.ids[slot], float(scores[slot])) for slot in order]
+
+    def compact(self):
+        """Drop tombstoned chunks from postings and renumber slots"""
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            remap = np.full(len(alive), -1, dtype=np.int32)
+            remap[alive] = np.arange(int(alive.sum()), dtype=np.int32)
+
+            for term_id in range(len(self._post_slots)):
+                slots = np.frombuffer(self._post_slots[term_id], dtype=np.int32)
+                tfs = np.frombuffer(self._post_tfs[term_id], dtype=np.int32)
+                keep = alive[slots]
+                new_slots = array('i', remap[slots[keep]].tobytes())
+                new_tfs = array('i', tfs[keep].tobytes())
+                del slots, tfs
+                self._post_slots[term_id] = new_slots
+                self._post_tfs[term_id] = new_tfs
+
+            live_slots = np.flatnonzero(alive)
+            self.ids = [self.ids[slot] for slot in live_slots]
+            self.id_to_slot = {chunk_id: slot for slot, chunk_id in enumerate(self.ids)}
+            self._lengths = array('i', [self._lengths[slot] for slot in live_slots])
+            self._slot_terms = [self._slot_terms[slot] for slot in live_slots]
+            for field in self.filter_fields:
+                values = self._fields[field]
+                self._fields[field] = [values[slot] for slot in live_slots]
+            del alive
+            self._alive = array('b', [1]) * len(self.ids)
+            self._dead = 0
+            logger.info(f"Compacted BM25 index: {self._live} chunks, {len(self.vocab)} terms")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            postings = sum(len(slots) for slots in self._post_slots)
+            return {
+                'chunks': self._live,
+                'tombstones': self._dead,
+                'terms': len(self.vocab),
+                'postings': postings,
+                'postings_bytes': postings * 8,
+                'avg_chunk_tokens': round(self._total_length / self._live, 1) if self._live else 0.0
+            }
+
+    def _parse_filter(self, filter_dict: Optional[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+        """Flatten an equality filter into (field, value) pairs"""
+        if not filter_dict:
+            return []
+        conditions = []
+        for key, value in filter_dict.items():
+            if key == '$and':
+                for clause in value:
+                    conditions.extend(self._parse_filter(clause))
+                continue
+            if isinstance(value, dict):
+                if set(value) != {'$eq'}:
+                    raise ValueError(f"Unsupported keyword filter operator for {key}: {value}")
+                value = value['$eq']
+            if key not in self.filter_fields:
+                raise ValueError(f"Keyword index cannot filter on '{key}' (indexed: {self.filter_fields})")
+            conditions.append((key, value))
+        return conditions
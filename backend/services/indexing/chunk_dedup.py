@@ -0,0 +1,431 @@
+"""
+Near-duplicate chunk deduplication across drafts
+MinHash signatures with an LSH index find chunks that are (almost) the same
+text; a duplicate is stored as a reference to its canonical chunk instead of
+as another embedding.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+from collections import defaultdict
+import os
+import re
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+_SHIFT = np.uint64(32)
+
+
+class MinHasher:
+    """
+    MinHash over word shingles
+
+    Each permutation is a multiply-shift hash of the shingle's CRC32, so
+    signatures are deterministic across processes (unlike hash()).
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # Odd multipliers keep the multiply-shift family universal
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return [" ".join(words)] if words else []
+        return [" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+
+    def signature(self, text: str) -> np.ndarray:
+        """uint32 signature of length num_perm (all-max for empty text)"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        unique = set(shingles)
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in unique),
+                             dtype=np.uint64, count=len(unique))
+        mixed = (hashes[:, None] * self._a[None, :] + self._b[None, :]) >> _SHIFT
+        return mixed.min(axis=0).astype(np.uint32)
+
+
+def estimated_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+class ChunkDeduplicator:
+    """
+    Per-user LSH index over canonical chunks plus a reference store
+
+    Canonical chunks live in the vector store as usual. A chunk whose
+    estimated Jaccard similarity to a canonical chunk of the same user is at
+    least `threshold` becomes a reference row (id, text, metadata, canonical
+    id) in a small SQLite side file; it shares the canonical chunk's
+    embedding instead of storing its own.
+
+    Signatures are persisted next to the references as chunks are added and
+    removed. The LSH index (bands x rows of the signature) is in memory and
+    loaded one user scope at a time, on that user's first insert; a scope
+    whose signatures were never persisted (see mark_scope_built) has to be
+    filled from the vector store by the caller first.
+    """
+
+    def __init__(self, path: Optional[str], threshold: float = 0.9, num_perm: int = 64,
+                 bands: int = 16, dimension: int = 384):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.dimension = dimension
+        self.hasher = MinHasher(num_perm)
+
+        self._lock = threading.RLock()
+        self._buckets: Dict[Tuple[str, int, bytes], List[str]] = defaultdict(list)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._scopes: Dict[str, str] = {}
+        self._loaded_scopes = set()
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_refs (
+                chunk_id TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                doc_id TEXT,
+                scope TEXT NOT NULL,
+                document TEXT,
+                metadata TEXT
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunk_refs_canonical ON chunk_refs (canonical_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunk_refs_doc ON chunk_refs (doc_id)")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_signatures (
+                chunk_id TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunk_signatures_scope ON chunk_signatures (scope)")
+        # Scopes whose every canonical chunk has a persisted signature
+        self._db.execute("CREATE TABLE IF NOT EXISTS signature_scopes (scope TEXT PRIMARY KEY)")
+        self._db.commit()
+
+        # Metrics
+        self.duplicates_found = 0
+        self.promotions = 0
+
+    @staticmethod
+    def scope_for(metadata: Optional[Dict[str, Any]]) -> str:
+        """Dedup scope of a chunk: duplicates are only matched within one user"""
+        user_id = (metadata or {}).get('user_id')
+        return "" if user_id is None else str(user_id)
+
+    # LSH over canonical chunks
+
+    def signature(self, text: str) -> np.ndarray:
+        return self.hasher.signature(text or "")
+
+    def find_duplicate(self, signature: np.ndarray, scope: str,
+                       exclude: Optional[str] = None) -> Optional[str]:
+        """Best canonical chunk in scope at or above the similarity threshold"""
+        with self._lock:
+            candidates = set()
+            for band, key in self._band_keys(signature):
+                candidates.update(self._buckets.get((scope, band, key), ()))
+            candidates.discard(exclude)
+
+            best_id, best_score = None, self.threshold
+            for candidate in candidates:
+                score = estimated_jaccard(signature, self._signatures[candidate])
+                if score >= best_score:
+                    best_id, best_score = candidate, score
+            return best_id
+
+    def is_canonical(self, chunk_id: str) -> bool:
+        return chunk_id in self._signatures
+
+    def add_canonical(self, chunk_id: str, signature: np.ndarray, scope: str, persist: bool = True):
+        """Index a canonical chunk (persist=False defers the write to persist_canonicals)"""
+        with self._lock:
+            if chunk_id in self._signatures:
+                return
+            self._index(chunk_id, signature, scope)
+            if persist:
+                self.persist_canonicals([chunk_id])
+
+    def add_canonicals(self, ids: List[str], documents: List[str], metadatas: List[Optional[Dict[str, Any]]]):
+        with self._lock:
+            added = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id not in self._signatures]
+        if not added:
+            return
+        texts = dict(zip(ids, documents))
+        scopes = {chunk_id: self.scope_for(chunk_meta) for chunk_id, chunk_meta in zip(ids, metadatas)}
+        # MinHash outside the lock, so lookups of other scopes are not held up
+        signatures = [(chunk_id, self.signature(texts[chunk_id])) for chunk_id in added]
+        with self._lock:
+            for chunk_id, signature in signatures:
+                if chunk_id not in self._signatures:
+                    self._index(chunk_id, signature, scopes[chunk_id])
+            self.persist_canonicals(added)
+
+    def persist_canonicals(self, ids: Iterable[str]):
+        """Write the signatures of indexed canonical chunks to the side file"""
+        with self._lock:
+            rows = [(chunk_id, self._scopes[chunk_id], self._signatures[chunk_id].tobytes())
+                    for chunk_id in ids if chunk_id in self._signatures]
+            if rows:
+                self._db.executemany("INSERT OR REPLACE INTO chunk_signatures VALUES (?, ?, ?)", rows)
+                self._db.commit()
+
+    def _index(self, chunk_id: str, signature: np.ndarray, scope: str):
+        self._signatures[chunk_id] = signature
+        self._scopes[chunk_id] = scope
+        for band, key in self._band_keys(signature):
+            self._buckets[(scope, band, key)].append(chunk_id)
+
+    def remove_canonicals(self, ids: Iterable[str]):
+        ids = list(ids)
+        with self._lock:
+            # Persisted rows go too, whether or not their scope is loaded
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                self._db.execute(
+                    f"DELETE FROM chunk_signatures WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                )
+            self._db.commit()
+            for chunk_id in ids:
+                signature = self._signatures.pop(chunk_id, None)
+                if signature is None:
+                    continue
+                scope = self._scopes.pop(chunk_id)
+                for band, key in self._band_keys(signature):
+                    bucket = self._buckets.get((scope, band, key))
+                    if bucket is not None:
+                        bucket.remove(chunk_id)
+                        if not bucket:
+                            del self._buckets[(scope, band, key)]
+
+    def scope_loaded(self, scope: str) -> bool:
+        return scope in self._loaded_scopes
+
+    def load_scope(self, scope: str) -> bool:
+        """
+        Load a scope's persisted signatures into the LSH index
+
+        Returns False when the scope was never marked built: the caller must
+        add its stored chunks (add_canonicals) and then call mark_scope_built.
+        """
+        with self._lock:
+            if scope in self._loaded_scopes:
+                return True
+            built = self._db.execute("SELECT 1 FROM signature_scopes WHERE scope = ?", (scope,)).fetchone()
+            rows = self._db.execute("SELECT chunk_id, signature FROM chunk_signatures WHERE scope = ?",
+                                    (scope,)).fetchall()
+            width = self.hasher.num_perm * 4
+            if any(len(signature) != width for _, signature in rows):
+                # Signatures of another CHUNK_DEDUP_PERMUTATIONS setting: rebuild the scope
+                self._db.execute("DELETE FROM chunk_signatures WHERE scope = ?", (scope,))
+                self._db.execute("DELETE FROM signature_scopes WHERE scope = ?", (scope,))
+                self._db.commit()
+                return False
+            for chunk_id, signature in rows:
+                if chunk_id not in self._signatures:
+                    self._index(chunk_id, np.frombuffer(signature, dtype=np.uint32), scope)
+            if built is None:
+                return False
+            self._loaded_scopes.add(scope)
+            return True
+
+    def mark_scope_built(self, scope: str):
+        """Every stored chunk of the scope is indexed; later loads come from the side file"""
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO signature_scopes VALUES (?)", (scope,))
+            self._db.commit()
+            self._loaded_scopes.add(scope)
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    # Reference store
+
+    def add_references(self, rows: List[Dict[str, Any]]):
+        """Store rows of {id, canonical_id, document, metadata} (re-adding replaces)"""
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunk_refs VALUES (?, ?, ?, ?, ?, ?)",
+                [(row['id'], row['canonical_id'], (row['metadata'] or {}).get('doc_id'),
+                  self.scope_for(row['metadata']), row['document'], json.dumps(row['metadata']))
+                 for row in rows]
+            )
+            self._db.commit()
+            self.duplicates_found += len(rows)
+
+    def get_references(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Reference rows by chunk ID (IDs that are not references are skipped)"""
+        return self._select("chunk_id", ids)
+
+    def references_for_canonicals(self, canonical_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in self._select("canonical_id", canonical_ids).values():
+            grouped[row['canonical_id']].append(row)
+        return dict(grouped)
+
+    def references_for_doc(self, doc_id: str) -> Dict[str, Dict[str, Any]]:
+        return self._select("doc_id", [doc_id])
+
+    def all_references(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM chunk_refs").fetchall()
+        return [self._row(row) for row in rows]
+
+    def remove_references(self, ids: List[str]) -> List[str]:
+        """Delete reference rows; returns the IDs that were references"""
+        with self._lock:
+            removed = list(self.get_references(ids))
+            for start in range(0, len(removed), 500):
+                batch = removed[start:start + 500]
+                self._db.execute(f"DELETE FROM chunk_refs WHERE chunk_id IN ({','.join('?' * len(batch))})", batch)
+            self._db.commit()
+            return removed
+
+    def update_reference_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE chunk_refs SET metadata = ?, doc_id = ? WHERE chunk_id = ?",
+                [(json.dumps(chunk_meta), chunk_meta.get('doc_id'), chunk_id)
+                 for chunk_id, chunk_meta in zip(ids, metadatas)]
+            )
+            self._db.commit()
+
+    def repoint(self, old_canonical_id: str, new_canonical_id: str):
+        """Move the remaining references of a deleted canonical chunk to its successor"""
+        with self._lock:
+            self._db.execute("UPDATE chunk_refs SET canonical_id = ? WHERE canonical_id = ?",
+                             (new_canonical_id, old_canonical_id))
+            self._db.commit()
+            self.promotions += 1
+
+    def _select(self, column: str, values: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(values), 500):
+                batch = list(values[start:start + 500])
+                rows = self._db.execute(
+                    f"SELECT * FROM chunk_refs WHERE {column} IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._row(row)
+        return found
+
+    @staticmethod
+    def _row(row: Tuple) -> Dict[str, Any]:
+        return {
+            'id': row[0],
+            'canonical_id': row[1],
+            'document': row[4],
+            'metadata': json.loads(row[5]) if row[5] else {}
+        }
+
+    # Search-time collapsing
+
+    def collapse(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fold near-duplicate hits into the best-ranked one
+
+        Results must be best first and carry 'id' and 'text'. Each kept result
+        gets a 'duplicates' list of {id, doc_id} for the hits folded into it
+        plus any stored references of its chunk.
+        """
+        if not results:
+            return results
+        references = self.references_for_canonicals([result['id'] for result in results])
+
+        kept: List[Tuple[Dict[str, Any], np.ndarray]] = []
+        for result in results:
+            with self._lock:
+                signature = self._signatures.get(result['id'])
+            if signature is None:
+                signature = self.signature(result.get('text') or "")
+            for best, best_signature in kept:
+                if estimated_jaccard(signature, best_signature) >= self.threshold:
+                    best['duplicates'].append({'id': result['id'], 'doc_id': (result.get('metadata') or {}).get('doc_id')})
+                    best['duplicates'].extend(result.get('duplicates', []))
+                    break
+            else:
+                result = dict(result)
+                result['duplicates'] = list(result.get('duplicates', []))
+                result['duplicates'].extend(
+                    {'id': row['id'], 'doc_id': row['metadata'].get('doc_id')}
+                    for row in references.get(result['id'], [])
+                )
+                kept.append((result, signature))
+        return [result for result, _ in kept]
+
+    def stats(self, user_id: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        Storage saved by deduplication, overall or for one user
+
+        Each reference saves one float32 embedding plus its share of the
+        HNSW graph (approximated as 2x the vector).
+        """
+        with self._lock:
+            if user_id is None:
+                rows = self._db.execute("SELECT scope, COUNT(*) FROM chunk_refs GROUP BY scope").fetchall()
+            else:
+                rows = self._db.execute("SELECT scope, COUNT(*) FROM chunk_refs WHERE scope = ? GROUP BY scope",
+                                        (str(user_id),)).fetchall()
+            canonical = dict(self._db.execute(
+                "SELECT scope, COUNT(*) FROM chunk_signatures GROUP BY scope"
+            ).fetchall())
+
+        bytes_per_vector = self.dimension * 4
+        per_user = {}
+        for scope, references in rows:
+            per_user[scope or 'shared'] = {
+                'references': references,
+                'canonical_chunks': canonical.get(scope, 0),
+                'embeddings_saved': references,
+                'bytes_saved': references * bytes_per_vector * 2
+            }
+        total_references = sum(entry['references'] for entry in per_user.values())
+        return {
+            'threshold': self.threshold,
+            'references': total_references,
+            'bytes_saved': total_references * bytes_per_vector * 2,
+            'canonical_chunks_indexed': len(self._signatures),
+            'scopes_loaded': len(self._loaded_scopes),
+            'promotions': self.promotions,
+            'per_user': per_user
+        }
+
+
+def chunk_deduplicator_from_env(directory: str, name: str, dimension: int) -> Optional[ChunkDeduplicator]:
+    """
+    Build the deduplicator from environment configuration
+
+    CHUNK_DEDUP: on (default) or off
+    CHUNK_DEDUP_THRESHOLD: minimum estimated Jaccard similarity (default 0.9)
+    CHUNK_DEDUP_PERMUTATIONS / CHUNK_DEDUP_BANDS: signature length and LSH bands (64 / 16)
+    """
+    if os.environ.get('CHUNK_DEDUP', 'on').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    return ChunkDeduplicator(
+        os.path.join(directory, f"{name}.sqlite3"),
+        threshold=float(os.environ.get('CHUNK_DEDUP_THRESHOLD', 0.9)),
+        num_perm=int(os.environ.get('CHUNK_DEDUP_PERMUTATIONS', 64)),
+        bands=int(os.environ.get('CHUNK_DEDUP_BANDS', 16)),
+        dimension=dimension
+    )
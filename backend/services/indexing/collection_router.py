@@ -0,0 +1,210 @@
+"""
+Collection router - maps users to Chroma collections
+Partitioning keeps each tenant's HNSW graph small, so a user-scoped search
+no longer walks (and filters) everyone else's vectors.
+"""
+
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import os
+import re
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PARTITION_STRATEGIES = ('single', 'per_user', 'hashed')
+
+
+class CollectionRouter:
+    """
+    Routes a user ID to the collection holding that user's chunks
+
+    Strategies:
+        single    every user shares the base collection (metadata filter scoping)
+        per_user  one collection per user: "<base>-u<user_id>"
+        hashed    users spread over a fixed number of buckets: "<base>-b<NNN>"
+
+    The base collection always exists; it holds chunks without a user_id and
+    is the source for migrate_single_collection(). Partition handles are
+    opened lazily and the least recently used are dropped beyond max_open.
+    """
+
+    def __init__(self, client, base_name: str, strategy: str = 'single', buckets: int = 16,
+                 max_open: int = 64, collection_metadata: Optional[Dict[str, Any]] = None):
+        if strategy not in PARTITION_STRATEGIES:
+            raise ValueError(f"Unsupported partition strategy: {strategy}")
+        self.client = client
+        self.base_name = base_name
+        self.strategy = strategy
+        self.buckets = max(1, buckets)
+        self.max_open = max(1, max_open)
+        self.collection_metadata = collection_metadata
+
+        self.default = client.get_or_create_collection(name=base_name, metadata=collection_metadata)
+        self._handles: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._opens = 0
+        self._evictions = 0
+
+    @property
+    def partitioned(self) -> bool:
+        return self.strategy != 'single'
+
+    def name_for(self, user_id: Optional[Any]) -> str:
+        """Collection name for a user (None maps to the base collection)"""
+        if not self.partitioned or user_id is None:
+            return self.base_name
+        if self.strategy == 'hashed':
+            bucket = int(hashlib.md5(str(user_id).encode()).hexdigest()[:8], 16) % self.buckets
+            return f"{self.base_name}-b{bucket:03d}"
+        key = str(user_id)
+        if not re.fullmatch(r'[A-Za-z0-9_-]*[A-Za-z0-9]', key):
+            # Keep collection names valid for arbitrary IDs
+            key = hashlib.md5(key.encode()).hexdigest()[:16]
+        return f"{self.base_name}-u{key}"
+
+    def collection_for_user(self, user_id: Optional[Any]):
+        return self.get(self.name_for(user_id))
+
+    def get(self, name: str):
+        """Open (or reuse) a collection handle by name"""
+        if name == self.base_name:
+            return self.default
+
+        with self._lock:
+            handle = self._handles.get(name)
+            if handle is not None:
+                self._handles.move_to_end(name)
+                return handle
+
+            handle = self.client.get_or_create_collection(name=name, metadata=self.collection_metadata)
+            self._handles[name] = handle
+            self._opens += 1
+            while len(self._handles) > self.max_open:
+                # Cold tenants: drop our handle; Chroma's segment cache (LRU when
+                # VECTOR_PARTITION_MEMORY_MB is set) releases the index memory
+                self._handles.popitem(last=False)
+                self._evictions += 1
+            return handle
+
+    def partition_names(self) -> List[str]:
+        """Base collection plus every partition created so far"""
+        if not self.partitioned:
+            return [self.base_name]
+        prefix = f"{self.base_name}-{'b' if self.strategy == 'hashed' else 'u'}"
+        names = sorted(collection.name for collection in self.client.list_collections()
+                       if collection.name.startswith(prefix))
+        return [self.base_name] + names
+
+    def all_collections(self) -> List[Any]:
+        return [self.get(name) for name in self.partition_names()]
+
+    def migrate_single_collection(self, batch_size: int = 500, delete_source: bool = True) -> Dict[str, Any]:
+        """
+        Move chunks from the base collection into their users' partitions
+
+        Embeddings are copied, not recomputed. Writes use upsert, so an
+        interrupted migration can simply be run again. Chunks without a
+        user_id stay in the base collection.
+
+        Args:
+            batch_size: Chunks read per page
+            delete_source: Remove migrated chunks from the base collection
+
+        Returns:
+            Counts of moved and kept chunks and the partitions written
+        """
+        if not self.partitioned:
+            raise ValueError("Partitioning is disabled (VECTOR_PARTITIONING=single)")
+
+        moved = 0
+        kept = 0
+        partitions = set()
+        offset = 0
+        while True:
+            page = self.default.get(include=["embeddings", "documents", "metadatas"],
+                                    limit=batch_size, offset=offset)
+            if not page['ids']:
+                break
+
+            by_partition: Dict[str, List[int]] = {}
+            for i, chunk_meta in enumerate(page['metadatas']):
+                user_id = (chunk_meta or {}).get('user_id')
+                if user_id is None:
+                    kept += 1
+                    continue
+                by_partition.setdefault(self.name_for(user_id), []).append(i)
+
+            moved_ids = []
+            for name, rows in by_partition.items():
+                ids = [page['ids'][i] for i in rows]
+                self.get(name).upsert(
+                    ids=ids,
+                    embeddings=[page['embeddings'][i] for i in rows],
+                    documents=[page['documents'][i] for i in rows],
+                    metadatas=[page['metadatas'][i] for i in rows]
+                )
+                moved_ids.extend(ids)
+                partitions.add(name)
+            moved += len(moved_ids)
+
+            if delete_source and moved_ids:
+                self.default.delete(ids=moved_ids)
+                # Deleted rows shift the remaining ones down; skip only what stayed
+                offset += len(page['ids']) - len(moved_ids)
+            else:
+                offset += len(page['ids'])
+
+            logger.info(f"📦 Partition migration: {moved} moved, {kept} kept so far")
+
+        logger.info(f"✅ Migrated {moved} chunks into {len(partitions)} partitions ({kept} left in {self.base_name})")
+        return {'moved': moved, 'kept': kept, 'partitions': sorted(partitions)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'strategy': self.strategy,
+            'buckets': self.buckets if self.strategy == 'hashed' else None,
+            'open_handles': len(self._handles),
+            'max_open': self.max_open,
+            'opens': self._opens,
+            'evictions': self._evictions
+        }
+
+
+def partition_settings_from_env() -> Dict[str, Any]:
+    """
+    Chroma client settings for partitioned storage
+
+    VECTOR_PARTITION_MEMORY_MB caps the memory Chroma spends on loaded
+    collection indexes, unloading the least recently used ones.
+    """
+    memory_mb = int(os.environ.get('VECTOR_PARTITION_MEMORY_MB', 0))
+    if not memory_mb:
+        return {}
+    return {
+        'chroma_segment_cache_policy': "LRU",
+        'chroma_memory_limit_bytes': memory_mb * 1024 * 1024
+    }
+
+
+def collection_router_from_env(client, base_name: str,
+                               collection_metadata: Optional[Dict[str, Any]] = None) -> CollectionRouter:
+    """
+    Build a CollectionRouter from environment configuration
+
+    VECTOR_PARTITIONING: single (default), per_user or hashed
+    VECTOR_PARTITION_BUCKETS: bucket count for hashed (default 16)
+    VECTOR_PARTITION_MAX_OPEN: collection handles kept open (default 64)
+    """
+    return CollectionRouter(
+        client,
+        base_name,
+        strategy=os.environ.get('VECTOR_PARTITIONING', 'single').lower(),
+        buckets=int(os.environ.get('VECTOR_PARTITION_BUCKETS', 16)),
+        max_open=int(os.environ.get('VECTOR_PARTITION_MAX_OPEN', 64)),
+        collection_metadata=collection_metadata
+    )
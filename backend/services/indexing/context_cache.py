@@ -0,0 +1,151 @@
+"""
+Folder context cache - reuse retrieval results across a user's chat turns
+Entries are tied to the version of the user's documents they were built from,
+so a save or delete of any document in scope invalidates exactly that user's entries.
+"""
+
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import os
+import re
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[^\w\s]+')
+
+
+def normalize_query(query: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a query"""
+    return ' '.join(_NON_WORD.sub(' ', query.lower()).split())
+
+
+class FolderContextCache:
+    """
+    Bounded LRU cache of folder context strings
+
+    Keyed on (user, normalized query, max_documents). Folder retrieval ranks
+    every document of the user, so any of them changing can change the
+    result: each user has a version counter bumped by invalidate_document(),
+    which also drops that user's entries. A result computed while a change
+    landed is discarded on put() because its start version is stale.
+    Entries also expire after `ttl_seconds`, covering edits made through
+    another instance.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 600.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str, int], Tuple[str, int, float]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._owners: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        # Metrics, overall and per user
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+        self._user_counts: Dict[str, Dict[str, int]] = {}
+
+    def version(self, user_id: Any) -> int:
+        """Current version of the user's document set; pass it back to put()"""
+        with self._lock:
+            return self._versions.get(str(user_id), 0)
+
+    def get(self, user_id: Any, query: str, max_documents: int) -> Optional[str]:
+        """Cached context, or None on a miss"""
+        user_key = str(user_id)
+        key = (user_key, normalize_query(query), max_documents)
+        with self._lock:
+            counts = self._user_counts.setdefault(user_key, {'hits': 0, 'misses': 0})
+            entry = self._entries.get(key)
+            if entry is not None:
+                context, version, stored_at = entry
+                if version == self._versions.get(user_key, 0) and time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    counts['hits'] += 1
+                    return context
+                del self._entries[key]
+            self._misses += 1
+            counts['misses'] += 1
+            return None
+
+    def put(self, user_id: Any, query: str, max_documents: int, context: str, version: int):
+        """Store a result computed against `version` (dropped if that version is gone)"""
+        user_key = str(user_id)
+        key = (user_key, normalize_query(query), max_documents)
+        with self._lock:
+            if version != self._versions.get(user_key, 0):
+                return
+            self._entries[key] = (context, version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate_document(self, doc_id: str, user_id: Optional[Any] = None):
+        """
+        A document was saved, re-indexed or deleted
+
+        Drops the owner's entries and bumps their version. Without a user_id
+        the owner recorded on an earlier call is used; if the owner was never
+        seen, every entry is dropped.
+        """
+        with self._lock:
+            if user_id is not None:
+                self._owners[doc_id] = str(user_id)
+            user_key = self._owners.get(doc_id)
+            if user_key is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                for known in self._versions:
+                    self._versions[known] += 1
+            else:
+                self._versions[user_key] = self._versions.get(user_key, 0) + 1
+                stale = [key for key in self._entries if key[0] == user_key]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+            self._invalidations += 1
+        if dropped:
+            logger.debug(f"Folder context cache: {dropped} entries invalidated by document {doc_id}")
+
+    def stats(self, user_id: Optional[Any] = None) -> Dict[str, Any]:
+        """Hit rate overall, or for one user"""
+        with self._lock:
+            if user_id is not None:
+                counts = self._user_counts.get(str(user_id), {'hits': 0, 'misses': 0})
+                hits, misses = counts['hits'], counts['misses']
+            else:
+                hits, misses = self._hits, self._misses
+            stats = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate_percent': round(100 * hits / (hits + misses), 2) if hits + misses else 0.0
+            }
+            if user_id is None:
+                stats.update({
+                    'entries': len(self._entries),
+                    'max_entries': self.max_entries,
+                    'invalidations': self._invalidations,
+                    'evictions': self._evictions
+                })
+            return stats
+
+
+def folder_context_cache_from_env() -> Optional[FolderContextCache]:
+    """
+    FOLDER_CONTEXT_CACHE: on (default) | off
+    FOLDER_CONTEXT_CACHE_SIZE: entries kept across all users (default 512)
+    FOLDER_CONTEXT_CACHE_TTL: seconds an entry stays valid (default 600)
+    """
+    if os.environ.get('FOLDER_CONTEXT_CACHE', 'on').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    return FolderContextCache(
+        max_entries=int(os.environ.get('FOLDER_CONTEXT_CACHE_SIZE', 512)),
+        ttl_seconds=float(os.environ.get('FOLDER_CONTEXT_CACHE_TTL', 600))
+    )
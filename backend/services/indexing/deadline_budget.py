@@ -0,0 +1,88 @@
+"""
+Deadline budget - one time allowance shared by every stage of a request
+Stages ask the budget for their timeout instead of carrying fixed timeouts of
+their own, so a slow early stage leaves less time to the later ones rather
+than stacking on top of them. TierStats records how retrieval tiers that race
+under a budget fare against each other.
+"""
+
+from typing import Dict, Any, Optional
+from collections import deque
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineBudget:
+    """Time left until a request's deadline"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.deadline = self.started + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Timeout for the next stage: what is left, at most `cap`"""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def elapsed_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+
+class TierStats:
+    """
+    Outcomes and latencies of retrieval tiers
+
+    Every launched tier ends as one of: 'hit' (returned a result), 'empty',
+    'failed', 'timeout' or 'cancelled' (lost the race). A request's winner is
+    recorded separately with record_win(); 'none' counts requests no tier
+    answered. Latencies cover tiers that ran to completion (hit or empty).
+    """
+
+    OUTCOMES = ('hit', 'empty', 'failed', 'timeout', 'cancelled')
+
+    def __init__(self, latency_window: int = 512):
+        self.latency_window = latency_window
+        self._tiers: Dict[str, Dict[str, int]] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._wins: Dict[str, int] = {}
+        self._requests = 0
+
+    def record(self, tier: str, outcome: str, seconds: float):
+        counts = self._tiers.setdefault(tier, dict.fromkeys(('launched',) + self.OUTCOMES, 0))
+        counts['launched'] += 1
+        counts[outcome] += 1
+        if outcome in ('hit', 'empty'):
+            self._latencies.setdefault(tier, deque(maxlen=self.latency_window)).append(seconds * 1000)
+
+    def record_win(self, tier: Optional[str]):
+        self._requests += 1
+        key = tier or 'none'
+        self._wins[key] = self._wins.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        tiers = {}
+        for tier, counts in self._tiers.items():
+            latencies = sorted(self._latencies.get(tier, ()))
+            wins = self._wins.get(tier, 0)
+            tiers[tier] = {
+                **counts,
+                'wins': wins,
+                'win_rate_percent': round(100 * wins / self._requests, 2) if self._requests else 0.0,
+                'avg_ms': round(sum(latencies) / len(latencies), 1) if latencies else None,
+                'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None
+            }
+        return {
+            'requests': self._requests,
+            'unanswered': self._wins.get('none', 0),
+            'tiers': tiers
+        }
@@ -0,0 +1,124 @@
+"""
+Document index - one embedding per document for ranking a user's whole folder
+A document's vector is the normalized mean of its chunk embeddings, so ranking
+every document a user has costs one matrix-vector product instead of an LLM call.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple, Set
+import threading
+import numpy as np
+
+
+def centroid(vectors: np.ndarray) -> Optional[np.ndarray]:
+    """Normalized mean of chunk vectors (None for an empty or all-zero set)"""
+    if len(vectors) == 0:
+        return None
+    mean = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+    norm = float(np.linalg.norm(mean))
+    return mean / norm if norm > 0 else None
+
+
+class DocumentIndex:
+    """
+    Document-level embeddings grouped by user
+
+    Each user's documents are stacked into a matrix on first ranking after a
+    change, so ranking is a single dot product over that user's documents.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._owners: Dict[str, str] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def set(self, doc_id: str, user_id: Any, vector: Optional[np.ndarray], info: Optional[Dict[str, Any]] = None):
+        """Store (or replace) a document's vector; None removes the document"""
+        if vector is None:
+            self.remove(doc_id)
+            return
+        user_key = _user_key(user_id)
+        with self._lock:
+            self._drop(doc_id)
+            self._vectors[doc_id] = np.asarray(vector, dtype=np.float32)
+            self._info[doc_id] = dict(info or {})
+            self._owners[doc_id] = user_key
+            self._by_user.setdefault(user_key, set()).add(doc_id)
+            self._matrices.pop(user_key, None)
+
+    def update_info(self, doc_id: str, info: Dict[str, Any]):
+        with self._lock:
+            if doc_id in self._info:
+                self._info[doc_id].update(info)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._drop(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+            self._info.clear()
+            self._owners.clear()
+            self._by_user.clear()
+            self._matrices.clear()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._vectors
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def documents(self, user_id: Any) -> Set[str]:
+        with self._lock:
+            return set(self._by_user.get(_user_key(user_id), ()))
+
+    def rank(self, query_vector: np.ndarray, user_id: Any, n_results: int) -> List[Dict[str, Any]]:
+        """
+        A user's documents by cosine similarity to the query, best first
+
+        Returns:
+            List of {'doc_id', 'score', **info}
+        """
+        user_key = _user_key(user_id)
+        with self._lock:
+            cached = self._matrices.get(user_key)
+            if cached is None:
+                doc_ids = sorted(self._by_user.get(user_key, ()))
+                if not doc_ids:
+                    return []
+                matrix = np.stack([self._vectors[doc_id] for doc_id in doc_ids])
+                cached = self._matrices[user_key] = (doc_ids, matrix)
+            doc_ids, matrix = cached
+            info = {doc_id: self._info[doc_id] for doc_id in doc_ids}
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0:
+            return []
+        scores = matrix @ (query / norm)
+        top = np.argsort(-scores)[:n_results]
+        return [{'doc_id': doc_ids[row], 'score': float(scores[row]), **info[doc_ids[row]]} for row in top]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'documents': len(self._vectors),
+            'users': len(self._by_user),
+            'memory_mb': round(len(self._vectors) * self.dimension * 4 / 1e6, 2)
+        }
+
+    def _drop(self, doc_id: str):
+        user_key = self._owners.pop(doc_id, None)
+        self._vectors.pop(doc_id, None)
+        self._info.pop(doc_id, None)
+        if user_key is not None:
+            self._by_user.get(user_key, set()).discard(doc_id)
+            self._matrices.pop(user_key, None)
+
+
+def _user_key(user_id: Any) -> str:
+    # user_id arrives as int from the API and may come back as str from metadata
+    return str(user_id)
@@ -0,0 +1,425 @@
+"""
+Embedding backends for the vector store
+PyTorch (sentence-transformers) is the default; ONNX Runtime runs the same
+model from an exported graph, optionally with dynamic int8 quantization,
+which is smaller and faster on CPU-only instances.
+"""
+
+from typing import List, Dict, Any, Optional
+import os
+import json
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ('torch', 'onnx')
+
+
+def default_thread_count() -> int:
+    """Physical cores (hyperthreads rarely help GEMM-bound inference)"""
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False)
+        if physical:
+            return physical
+    except ImportError:
+        pass
+    return os.cpu_count() or 1
+
+
+class EmbeddingBackend:
+    """
+    Interface shared by the embedding backends
+
+    Attributes:
+        name: Backend identifier, also used to namespace cached embeddings
+        max_seq_length: Tokens the model sees per text (longer input is truncated)
+    """
+
+    name = "base"
+    max_seq_length = 256
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embed texts into a (len(texts), dimension) float32 array"""
+        raise NotImplementedError
+
+    def get_sentence_embedding_dimension(self) -> int:
+        raise NotImplementedError
+
+    def count_tokens(self, text: str) -> int:
+        """Untruncated token count, excluding special tokens"""
+        raise NotImplementedError
+
+
+class TorchEmbeddingBackend(EmbeddingBackend):
+    """sentence-transformers model running under PyTorch"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, num_threads: Optional[int] = None):
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.max_seq_length = getattr(self.model, 'max_seq_length', None) or 256
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenizer.encode(text, add_special_tokens=False))
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    The same model exported to ONNX and run with ONNX Runtime
+
+    The export (and int8 quantization) happens once and is cached under
+    export_dir; later processes load only the graph and a tokenizers
+    tokenizer, so PyTorch is never imported at runtime.
+
+    Export directory layout:
+        model.onnx        float32 graph (transformer only)
+        model-int8.onnx   dynamically quantized graph (int8 weights)
+        tokenizer.json    fast tokenizer
+        config.json       pooling, normalization, dimension, sequence length
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, export_dir: str, quantize: bool = True,
+                 num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.export_dir = export_dir
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+
+        model_path = os.path.join(export_dir, "model-int8.onnx" if quantize else "model.onnx")
+        if not os.path.exists(model_path) or not os.path.exists(os.path.join(export_dir, "config.json")):
+            export_onnx_model(model_name, export_dir, quantize=quantize)
+
+        with open(os.path.join(export_dir, "config.json")) as f:
+            self.config = json.load(f)
+        self.max_seq_length = self.config['max_seq_length']
+        self.dimension = self.config['dimension']
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or default_thread_count()
+        # Batches are run one at a time; parallelism is inside each operator
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+        tokenizer_path = os.path.join(export_dir, "tokenizer.json")
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.config['pad_token_id'], pad_token=self.config['pad_token'])
+        # Separate instance without truncation for chunk-budget counting
+        self._counter = Tokenizer.from_file(tokenizer_path)
+        self._counter.no_truncation()
+        self._counter.no_padding()
+
+        logger.info(f"✅ ONNX embedding backend ready ({os.path.basename(model_path)}, "
+                    f"{options.intra_op_num_threads} threads)")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        # Length-sorted batches keep padding (wasted compute) to a minimum
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        output = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            output[rows] = self._encode_batch([texts[i] for i in rows])
+        return output
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        if self.config['pooling'] == 'cls':
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.config['normalize']:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._counter.encode(text, add_special_tokens=False).ids)
+
+
+_export_lock = threading.Lock()
+
+
+def export_onnx_model(model_name: str, export_dir: str, quantize: bool = True) -> str:
+    """
+    Export a sentence-transformers model to ONNX (requires torch and onnx)
+
+    Only the transformer is exported; pooling and normalization are read from
+    the sentence-transformers pipeline and applied in numpy at runtime.
+
+    Returns:
+        Path of the graph the ONNX backend will load
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    with _export_lock:
+        os.makedirs(export_dir, exist_ok=True)
+        fp32_path = os.path.join(export_dir, "model.onnx")
+        int8_path = os.path.join(export_dir, "model-int8.onnx")
+
+        started = time.time()
+        st_model = SentenceTransformer(model_name, device='cpu')
+        transformer = st_model[0].auto_model.eval()
+        hf_tokenizer = st_model.tokenizer
+
+        pooling, normalize = 'mean', False
+        for module in st_model:
+            kind = type(module).__name__
+            if kind == 'Pooling':
+                pooling_config = module.get_config_dict()
+                if pooling_config.get('pooling_mode_cls_token'):
+                    pooling = 'cls'
+                elif not pooling_config.get('pooling_mode_mean_tokens'):
+                    raise ValueError(f"Unsupported pooling for ONNX export: {pooling_config}")
+            elif kind == 'Normalize':
+                normalize = True
+            elif kind == 'Dense':
+                raise ValueError("Models with Dense heads are not supported by the ONNX backend")
+
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids')
+                       if name in hf_tokenizer.model_input_names]
+        sample = hf_tokenizer(["an example sentence"], return_tensors='pt')
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer,
+                tuple(sample[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                do_constant_folding=True
+            )
+
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+        hf_tokenizer.backend_tokenizer.save(os.path.join(export_dir, "tokenizer.json"))
+        config = {
+            'model_name': model_name,
+            'dimension': st_model.get_sentence_embedding_dimension(),
+            'max_seq_length': getattr(st_model, 'max_seq_length', None) or 256,
+            'pooling': pooling,
+            'normalize': normalize,
+            'pad_token': hf_tokenizer.pad_token,
+            'pad_token_id': hf_tokenizer.pad_token_id,
+            'input_names': input_names
+        }
+        with open(os.path.join(export_dir, "config.json"), 'w') as f:
+            json.dump(config, f, indent=2)
+
+        logger.info(f"✅ Exported {model_name} to ONNX in {time.time() - started:.1f}s "
+                    f"({'int8' if quantize else 'float32'})")
+        return int8_path if quantize else fp32_path
+
+
+def check_parity(reference: EmbeddingBackend, candidate: EmbeddingBackend,
+                 texts: List[str]) -> Dict[str, Any]:
+    """
+    Cosine agreement between two backends on the same texts
+
+    Returns:
+        mean/min cosine similarity between paired embeddings, plus the
+        fraction of texts whose nearest neighbour (within texts) is unchanged
+    """
+    a = _normalize(reference.encode(texts))
+    b = _normalize(candidate.encode(texts))
+    cosines = (a * b).sum(axis=1)
+
+    # Retrieval-level agreement: does each text still pick the same neighbour?
+    neighbours_a = a @ a.T
+    neighbours_b = b @ b.T
+    np.fill_diagonal(neighbours_a, -np.inf)
+    np.fill_diagonal(neighbours_b, -np.inf)
+    same_neighbour = float(np.mean(neighbours_a.argmax(axis=1) == neighbours_b.argmax(axis=1)))
+
+    return {
+        'reference': reference.name,
+        'candidate': candidate.name,
+        'texts': len(texts),
+        'mean_cosine': float(cosines.mean()),
+        'min_cosine': float(cosines.min()),
+        'nearest_neighbour_agreement': same_neighbour
+    }
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def _onnx_settings(model_name: str) -> Dict[str, Any]:
+    """Export directory and quantization flag for the ONNX backend"""
+    is_railway = os.environ.get('RAILWAY_ENVIRONMENT') == 'production'
+    default_dir = "/tmp/onnx_models" if is_railway else "./onnx_models"
+    return {
+        'export_dir': os.path.join(os.environ.get('EMBEDDING_ONNX_DIR', default_dir),
+                                   model_name.replace('/', '_')),
+        'quantize': os.environ.get('EMBEDDING_ONNX_QUANTIZE', 'true').lower() in ('1', 'true', 'yes')
+    }
+
+
+def configured_backend() -> str:
+    """Backend selected by EMBEDDING_BACKEND (torch by default)"""
+    backend = os.environ.get('EMBEDDING_BACKEND', 'torch').lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported EMBEDDING_BACKEND: {backend} (expected one of {EMBEDDING_BACKENDS})")
+    return backend
+
+
+def embedding_backend_from_env(model_name: str) -> EmbeddingBackend:
+    """
+    Build the embedding backend from environment configuration
+
+    EMBEDDING_BACKEND: torch (default) or onnx
+    EMBEDDING_ONNX_QUANTIZE: dynamic int8 quantization for onnx (default on)
+    EMBEDDING_ONNX_DIR: where exported graphs are cached
+    EMBEDDING_THREADS: intra-op threads (default: physical cores for onnx)
+
+    Falls back to PyTorch if the ONNX backend cannot be initialized.
+    """
+    backend = configured_backend()
+    threads = int(os.environ.get('EMBEDDING_THREADS', 0)) or None
+
+    if backend == 'onnx':
+        settings = _onnx_settings(model_name)
+        try:
+            return OnnxEmbeddingBackend(model_name, settings['export_dir'],
+                                        quantize=settings['quantize'], num_threads=threads)
+        except Exception as e:
+            logger.warning(f"⚠️ ONNX embedding backend unavailable ({e}), falling back to PyTorch")
+
+    return TorchEmbeddingBackend(model_name, num_threads=threads)
+
+
+# Process-wide backends, loaded on first use
+_backends: Dict[str, EmbeddingBackend] = {}
+_backend_stats: Dict[str, Dict[str, Any]] = {}
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend(model_name: str, dimension: Optional[int] = None) -> EmbeddingBackend:
+    """
+    Thread-safe lazy accessor for the shared embedding backend
+
+    The first caller loads the model (double-checked locking, so concurrent
+    first requests load it once); everyone after gets the cached instance.
+
+    Args:
+        model_name: Model to load
+        dimension: Expected embedding dimension, verified once at load time
+    """
+    backend = _backends.get(model_name)
+    if backend is not None:
+        return backend
+
+    with _backend_lock:
+        backend = _backends.get(model_name)
+        if backend is not None:
+            return backend
+
+        rss_before = process_rss_mb()
+        started = time.perf_counter()
+        logger.info(f"🔄 Loading embedding model {model_name}...")
+        backend = embedding_backend_from_env(model_name)
+        load_seconds = time.perf_counter() - started
+
+        if dimension is not None and backend.get_sentence_embedding_dimension() != dimension:
+            raise RuntimeError(f"{model_name} produces {backend.get_sentence_embedding_dimension()}-dim "
+                               f"embeddings, expected {dimension}")
+
+        rss_after = process_rss_mb()
+        _backend_stats[model_name] = {
+            'backend': backend.name,
+            'load_seconds': round(load_seconds, 3),
+            'rss_delta_mb': round(rss_after - rss_before, 1) if rss_after and rss_before else None,
+            'loaded_at': time.time()
+        }
+        _backends[model_name] = backend
+        logger.info(f"✅ Embedding model {model_name} ({backend.name}) loaded in {load_seconds:.1f}s")
+        return backend
+
+
+def active_backend_name(model_name: str, dimension: Optional[int] = None,
+                        load: bool = True) -> Optional[str]:
+    """
+    Name of the backend actually serving model_name
+
+    ONNX falls back to PyTorch when it cannot be initialized, so its name is
+    only known once loaded: with load=False that case returns None instead of
+    loading the model. PyTorch is known without loading.
+    """
+    backend = _backends.get(model_name)
+    if backend is not None:
+        return backend.name
+    if configured_backend() == 'torch':
+        return TorchEmbeddingBackend.name
+    if not load:
+        return None
+    return get_embedding_backend(model_name, dimension).name
+
+
+def embedding_backend_stats(model_name: str) -> Dict[str, Any]:
+    """Load state, load time and memory of the shared backend (for health checks)"""
+    stats = dict(_backend_stats.get(model_name, {}))
+    stats['loaded'] = model_name in _backends
+    stats['process_rss_mb'] = process_rss_mb()
+    return stats
+
+
+def process_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB"""
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except ImportError:
+        try:
+            import resource
+            # ru_maxrss is the peak, in KB on Linux
+            return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:
+            return None
@@ -0,0 +1,344 @@
+"""
+Embedding cache for the writing assistant's vector store
+Two tiers in front of the embedding model: a bounded in-process LRU and a
+memory-mapped on-disk matrix that survives restarts and can be opened
+read-only by other worker processes.
+"""
+
+from typing import List, Dict, Any, Optional, Callable
+from collections import OrderedDict
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import unicodedata
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by a hash of the normalized text
+
+    Memory tier: OrderedDict LRU of float32 vectors, bounded by entry count.
+    Disk tier: fixed-capacity np.memmap matrix (float16 or float32) plus a JSON
+    offset index mapping key -> row. When the matrix is full the least recently
+    used row is overwritten. Each row also stores an 8-byte key fingerprint so a
+    reader holding a stale index never returns a vector that was overwritten.
+    """
+
+    def __init__(self,
+                 dimension: int,
+                 namespace: str = "all-MiniLM-L6-v2",
+                 cache_dir: Optional[str] = None,
+                 memory_entries: int = 2048,
+                 disk_entries: int = 50000,
+                 dtype: str = "float16",
+                 read_only: bool = False,
+                 flush_every: int = 256):
+        self.dimension = dimension
+        self.namespace = namespace
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.dtype = np.dtype(dtype)
+        self.read_only = read_only
+        self.flush_every = flush_every
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        # Disk tier state (key -> row, kept in LRU order)
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._free_rows: List[int] = []
+        self._matrix = None
+        self._fingerprints = None
+        self._index_mtime = 0.0
+        self._dirty_writes = 0
+
+        self.stats_counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_evictions': 0
+        }
+
+        self.cache_dir = cache_dir
+        if cache_dir and disk_entries > 0:
+            try:
+                self._open_disk_tier()
+                if not read_only:
+                    atexit.register(self.flush)
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding disk cache unavailable, using memory tier only: {e}")
+                self._matrix = None
+
+    # Public API
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return embeddings for texts, calling encode_fn only for cache misses
+
+        Args:
+            texts: Texts to embed
+            encode_fn: Batch encoder used for misses (e.g. SentenceTransformer.encode)
+
+        Returns:
+            float32 matrix of shape (len(texts), dimension)
+        """
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return result
+
+        keys = [self.key_for(text) for text in texts]
+
+        # Group positions by key so duplicate texts in one batch are encoded once
+        missing: "OrderedDict[str, List[int]]" = OrderedDict()
+        for position, key in enumerate(keys):
+            vector = self.get(key)
+            if vector is None:
+                missing.setdefault(key, []).append(position)
+            else:
+                result[position] = vector
+
+        if missing:
+            miss_texts = [texts[positions[0]] for positions in missing.values()]
+            vectors = np.asarray(encode_fn(miss_texts), dtype=np.float32).reshape(len(miss_texts), -1)
+            for (key, positions), vector in zip(missing.items(), vectors):
+                self.put(key, vector)
+                result[positions] = vector
+
+        return result
+
+    def key_for(self, text: str) -> str:
+        """Hash of the normalized text, scoped to the embedding model"""
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha1(f"{self.namespace}\x00{normalized}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Look up a vector in the memory tier, then the disk tier"""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats_counters['memory_hits'] += 1
+                return vector
+
+            vector = self._disk_get(key)
+            if vector is not None:
+                self.stats_counters['disk_hits'] += 1
+                self._memory_put(key, vector)
+                return vector
+
+            self.stats_counters['misses'] += 1
+            return None
+
+    def put(self, key: str, vector: np.ndarray):
+        """Store a vector in both tiers"""
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._memory_put(key, vector)
+            self._disk_put(key, vector)
+
+    def flush(self):
+        """Flush the memory-mapped matrix and write the offset index atomically"""
+        with self._lock:
+            if self._matrix is None or self.read_only or self._dirty_writes == 0:
+                return
+            try:
+                self._matrix.flush()
+                self._fingerprints.flush()
+                index_path = self._index_path()
+                tmp_path = f"{index_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({
+                        'version': INDEX_VERSION,
+                        'namespace': self.namespace,
+                        'dimension': self.dimension,
+                        'dtype': self.dtype.name,
+                        'capacity': self.disk_entries,
+                        # Stored in LRU order (oldest first)
+                        'entries': list(self._disk_index.items())
+                    }, f)
+                os.replace(tmp_path, index_path)
+                self._index_mtime = os.path.getmtime(index_path)
+                self._dirty_writes = 0
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to flush embedding cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            hits = self.stats_counters['memory_hits'] + self.stats_counters['disk_hits']
+            lookups = hits + self.stats_counters['misses']
+            return {
+                **self.stats_counters,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_capacity': self.memory_entries,
+                'disk_entries': len(self._disk_index),
+                'disk_capacity': self.disk_entries if self._matrix is not None else 0,
+                'disk_dtype': self.dtype.name,
+                'read_only': self.read_only
+            }
+
+    # Memory tier
+
+    def _memory_put(self, key: str, vector: np.ndarray):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats_counters['evictions'] += 1
+
+    # Disk tier
+
+    def _matrix_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self._slug()}.{self.dtype.name}.mmap")
+
+    def _fingerprint_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self._slug()}.keys.mmap")
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self._slug()}.index.json")
+
+    def _slug(self) -> str:
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in self.namespace)
+
+    def _open_disk_tier(self):
+        """Open (or create) the memory-mapped matrix and load the offset index"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        matrix_path = self._matrix_path()
+        fingerprint_path = self._fingerprint_path()
+        shape = (self.disk_entries, self.dimension)
+
+        exists = os.path.exists(matrix_path) and os.path.exists(fingerprint_path)
+        if exists and os.path.getsize(matrix_path) != self.disk_entries * self.dimension * self.dtype.itemsize:
+            # Capacity or dtype changed - the old file cannot be reused
+            if self.read_only:
+                raise RuntimeError("Embedding cache file layout does not match configuration")
+            logger.info("Embedding cache layout changed, recreating disk tier")
+            exists = False
+
+        if self.read_only:
+            if not exists:
+                raise RuntimeError(f"No embedding cache found at {matrix_path}")
+            self._matrix = np.memmap(matrix_path, dtype=self.dtype, mode='r', shape=shape)
+            self._fingerprints = np.memmap(fingerprint_path, dtype=np.uint64, mode='r',
+                                           shape=(self.disk_entries,))
+        else:
+            mode = 'r+' if exists else 'w+'
+            self._matrix = np.memmap(matrix_path, dtype=self.dtype, mode=mode, shape=shape)
+            self._fingerprints = np.memmap(fingerprint_path, dtype=np.uint64, mode=mode,
+                                           shape=(self.disk_entries,))
+
+        self._load_index(fresh=not exists)
+        logger.info(f"✅ Embedding disk cache ready: {len(self._disk_index)}/{self.disk_entries} rows "
+                    f"({self.dtype.name}, read_only={self.read_only})")
+
+    def _load_index(self, fresh: bool = False):
+        """Load the offset index; rows not referenced by it are free"""
+        self._disk_index = OrderedDict()
+        index_path = self._index_path()
+        if not fresh and os.path.exists(index_path):
+            try:
+                with open(index_path) as f:
+                    data = json.load(f)
+                if (data.get('version') == INDEX_VERSION and
+                        data.get('dimension') == self.dimension and
+                        data.get('dtype') == self.dtype.name and
+                        data.get('capacity') == self.disk_entries):
+                    for key, row in data.get('entries', []):
+                        if 0 <= row < self.disk_entries:
+                            self._disk_index[key] = row
+                self._index_mtime = os.path.getmtime(index_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Embedding cache index unreadable, starting empty: {e}")
+                self._disk_index = OrderedDict()
+
+        used = set(self._disk_index.values())
+        self._free_rows = [row for row in range(self.disk_entries - 1, -1, -1) if row not in used]
+
+    def _refresh_read_only_index(self):
+        """Pick up rows written by the owning process since we last looked"""
+        try:
+            mtime = os.path.getmtime(self._index_path())
+        except OSError:
+            return
+        if mtime != self._index_mtime:
+            self._load_index()
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        if self._matrix is None:
+            return None
+        if self.read_only:
+            self._refresh_read_only_index()
+
+        row = self._disk_index.get(key)
+        if row is None:
+            return None
+        if int(self._fingerprints[row]) != self._fingerprint(key):
+            # Row was reused for another key after this index was written
+            del self._disk_index[key]
+            return None
+
+        self._disk_index.move_to_end(key)
+        return np.array(self._matrix[row], dtype=np.float32)
+
+    def _disk_put(self, key: str, vector: np.ndarray):
+        if self._matrix is None or self.read_only:
+            return
+
+        row = self._disk_index.get(key)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                # Evict the least recently used row
+                _, row = self._disk_index.popitem(last=False)
+                self.stats_counters['disk_evictions'] += 1
+
+        self._matrix[row] = vector.astype(self.dtype)
+        self._fingerprints[row] = self._fingerprint(key)
+        self._disk_index[key] = row
+        self._disk_index.move_to_end(key)
+
+        self._dirty_writes += 1
+        if self._dirty_writes >= self.flush_every:
+            self.flush()
+
+    @staticmethod
+    def _fingerprint(key: str) -> int:
+        # Keys are hex SHA1 digests; the first 16 hex chars fit in a uint64
+        return int(key[:16], 16)
+
+
+def embedding_cache_from_env(dimension: int, namespace: str) -> EmbeddingCache:
+    """
+    Build an EmbeddingCache from environment configuration
+
+    EMBEDDING_CACHE_DIR: directory for the disk tier ('' disables it)
+    EMBEDDING_CACHE_MEMORY_ENTRIES / EMBEDDING_CACHE_DISK_ENTRIES: tier bounds
+    EMBEDDING_CACHE_DTYPE: float16 (default) or float32 for the disk matrix
+    EMBEDDING_CACHE_READ_ONLY: open the disk tier read-only (secondary workers)
+    """
+    is_railway = os.environ.get('RAILWAY_ENVIRONMENT') == 'production'
+    default_dir = "/tmp/embedding_cache" if is_railway else "./embedding_cache"
+
+    return EmbeddingCache(
+        dimension=dimension,
+        namespace=namespace,
+        cache_dir=os.environ.get('EMBEDDING_CACHE_DIR', default_dir) or None,
+        memory_entries=int(os.environ.get('EMBEDDING_CACHE_MEMORY_ENTRIES', 2048)),
+        disk_entries=int(os.environ.get('EMBEDDING_CACHE_DISK_ENTRIES', 50000)),
+        dtype=os.environ.get('EMBEDDING_CACHE_DTYPE', 'float16'),
+        read_only=os.environ.get('EMBEDDING_CACHE_READ_ONLY', '').lower() in ('1', 'true', 'yes')
+    )
@@ -0,0 +1,227 @@
+"""
+Embedding worker - runs the embedding model off the event loop
+Coalesces concurrent encode requests into micro-batches so one user's
+manuscript does not stall every other request on the worker.
+"""
+
+from typing import List, Dict, Any, Optional, Callable
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EncodeRequest:
+    """A caller's texts plus the future its embeddings are delivered to"""
+    texts: List[str]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingWorker:
+    """
+    Micro-batching embedding service behind an asyncio queue
+
+    Callers submit lists of texts and get a future back. A single batching
+    task drains the queue, packing requests from different users into one
+    model call until either max_batch_size texts are collected or the oldest
+    request has waited max_wait_ms. The model runs in a dedicated thread pool,
+    never on the event loop.
+    """
+
+    def __init__(self,
+                 encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 10.0,
+                 executor_workers: int = 1):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor_workers = executor_workers
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._start_lock = threading.Lock()
+        # Request that overflowed the previous batch; it opens the next one
+        self._carried: Optional[_EncodeRequest] = None
+
+        # Metrics
+        self._queued_texts = 0
+        self._batches = 0
+        self._texts = 0
+        self._requests = 0
+        self._recent_batch_sizes = deque(maxlen=200)
+        self._recent_wait_ms = deque(maxlen=200)
+        self._recent_encode_ms = deque(maxlen=200)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Bind the worker to the running event loop and start batching"""
+        with self._start_lock:
+            if self.running:
+                return
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._executor = ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                thread_name_prefix="embedding-worker")
+            self._task = self._loop.create_task(self._run())
+        logger.info(f"✅ Embedding worker started (batch<={self.max_batch_size}, "
+                    f"wait<={self.max_wait * 1000:.0f}ms)")
+
+    async def stop(self):
+        """Stop batching and fail any requests still queued"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        leftovers = [self._carried] if self._carried is not None else []
+        self._carried = None
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        for request in leftovers:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Embedding worker stopped"))
+        self._executor.shutdown(wait=False)
+        self._task = None
+        logger.info("Embedding worker stopped")
+
+    def submit(self, texts: List[str]) -> asyncio.Future:
+        """Queue texts for encoding; must be called on the worker's loop"""
+        future = self._loop.create_future()
+        if not texts:
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+        self._queue.put_nowait(_EncodeRequest(list(texts), future))
+        self._queued_texts += len(texts)
+        self._requests += 1
+        return future
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts through the shared micro-batching queue"""
+        if not self.running:
+            await self.start()
+        return await self.submit(texts)
+
+    def encode_threadsafe(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Encode from a worker thread (e.g. VectorStore calls made via asyncio.to_thread)
+
+        Must not be called from the event loop thread itself - that would block
+        the loop the batching task runs on.
+        """
+        async def _submit():
+            return await self.submit(texts)
+
+        concurrent_future = asyncio.run_coroutine_threadsafe(_submit(), self._loop)
+        return concurrent_future.result(timeout)
+
+    def can_serve_current_thread(self) -> bool:
+        """True when a blocking call from this thread can safely wait on the worker"""
+        if not self.running or self._loop is None or self._loop.is_closed():
+            return False
+        try:
+            return asyncio.get_running_loop() is not self._loop
+        except RuntimeError:
+            # No loop running in this thread
+            return True
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth and batching statistics"""
+        sizes = list(self._recent_batch_sizes)
+        waits = list(self._recent_wait_ms)
+        encodes = list(self._recent_encode_ms)
+        return {
+            'running': self.running,
+            'queue_depth_requests': self._queue.qsize() if self._queue else 0,
+            'queue_depth_texts': self._queued_texts,
+            'requests_total': self._requests,
+            'batches_total': self._batches,
+            'texts_total': self._texts,
+            'avg_batch_size': round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            'max_batch_size_recent': max(sizes) if sizes else 0,
+            'avg_queue_wait_ms': round(sum(waits) / len(waits), 2) if waits else 0.0,
+            'avg_encode_ms': round(sum(encodes) / len(encodes), 2) if encodes else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
+
+    async def _run(self):
+        """Batching loop: collect requests, encode in the executor, resolve futures"""
+        while True:
+            if self._carried is not None:
+                first, self._carried = self._carried, None
+            else:
+                first = await self._queue.get()
+            batch = [first]
+            batch_texts = len(first.texts)
+            deadline = first.enqueued_at + self.max_wait
+
+            # Coalesce until the batch is full or the oldest request's wait is up
+            while batch_texts < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if batch_texts + len(request.texts) > self.max_batch_size:
+                    # Would overflow the cap - it opens the next batch instead
+                    self._carried = request
+                    break
+                batch.append(request)
+                batch_texts += len(request.texts)
+
+            batch = [request for request in batch if not request.future.cancelled()]
+            self._queued_texts -= batch_texts
+            if not batch:
+                continue
+
+            texts = [text for request in batch for text in request.texts]
+            started = time.perf_counter()
+            for request in batch:
+                self._recent_wait_ms.append((started - request.enqueued_at) * 1000)
+
+            try:
+                vectors = await self._loop.run_in_executor(self._executor, self._encode_batch, texts)
+            except asyncio.CancelledError:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(RuntimeError("Embedding worker stopped"))
+                raise
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            self._recent_encode_ms.append((time.perf_counter() - started) * 1000)
+            self._recent_batch_sizes.append(len(texts))
+            self._batches += 1
+            self._texts += len(texts)
+
+            offset = 0
+            for request in batch:
+                count = len(request.texts)
+                if not request.future.done():
+                    request.future.set_result(vectors[offset:offset + count])
+                offset += count
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.encode_fn(texts), dtype=np.float32).reshape(len(texts), -1)
@@ -0,0 +1,310 @@
+"""
+Fact index - what a user's documents state about each entity, for consistency checks
+Facts are extracted once per document version at indexing time and kept on the
+entity's node in the user's knowledge graph, so they persist and are evicted
+with it. A consistency check is then one lookup pass over the statement.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple, Iterable
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import re
+import logging
+
+from .context_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# "<entity> was dead", "<entity> has been married", "<entity> died"
+_ASSERTION = re.compile(
+    r"\s+(?:(?:is|was|are|were|has been|had been|became|becomes|remained|remains|is now|was now)"
+    r"\s+(not\s+)?(?:(?:a|an|the|still|already|now)\s+)?([a-z]+)|(died|passed away))\b",
+    re.IGNORECASE
+)
+
+# Assertion values meaning the same thing
+VALUE_ALIASES = {
+    'died': 'dead', 'passed away': 'dead', 'killed': 'dead', 'murdered': 'dead',
+    'deceased': 'dead', 'slain': 'dead', 'living': 'alive'
+}
+
+# Values of which an entity can hold only one at a time
+EXCLUSIVE_VALUES = [
+    {'dead', 'alive'},
+    {'married', 'single', 'divorced', 'widowed', 'engaged'},
+    {'asleep', 'awake'},
+    {'young', 'old'},
+    {'rich', 'poor'}
+]
+_VALUE_GROUP = {value: i for i, group in enumerate(EXCLUSIVE_VALUES) for value in group}
+
+# Relation types each check covers; attribute facts ('is') belong to the character check
+CHECK_RELATIONS = {
+    'character': {'is', 'INTERACTS_WITH', 'SPEAKS_TO', 'BELONGS_TO'},
+    'plot': {'CAUSES', 'PRECEDES', 'PARTICIPATES_IN', 'REPRESENTS'},
+    'setting': {'LOCATED_IN'}
+}
+
+SNIPPET_CHARS = 200
+
+
+class Fact(NamedTuple):
+    """
+    One statement about an entity, as stored on its graph node
+
+    predicate is 'is' for attributes (value is the attribute, e.g. 'dead')
+    or a relation type (value is the other entity). start/end are character
+    offsets of the source span in the document (-1 when unknown).
+    """
+    predicate: str
+    value: str
+    doc_id: str
+    start: int
+    end: int
+    confidence: float
+    snippet: str
+
+
+@dataclass
+class FactLookup:
+    """Outcome of the lookup pass; ambiguous facts still need verification"""
+    mentioned: List[str] = field(default_factory=list)
+    conflicts: List[Dict[str, Any]] = field(default_factory=list)
+    confirmations: List[Dict[str, Any]] = field(default_factory=list)
+    ambiguous: List[Tuple[str, Fact]] = field(default_factory=list)
+
+
+def _normalize_value(value: str) -> str:
+    value = ' '.join(value.lower().split())
+    return VALUE_ALIASES.get(value, value)
+
+
+def _sentence_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Bounds of the sentence(s) around text[start:end]"""
+    left = max(text.rfind('.', 0, start), text.rfind('\n', 0, start)) + 1
+    right = min((i for i in (text.find('.', end), text.find('\n', end)) if i != -1), default=len(text))
+    while left < start and text[left].isspace():
+        left += 1
+    return left, right
+
+
+def _name_pattern(names: Iterable[str]) -> Optional[re.Pattern]:
+    names = sorted({name for name in names if name and name.strip()}, key=len, reverse=True)
+    if not names:
+        return None
+    return re.compile(r"\b(?:" + "|".join(re.escape(name) for name in names) + r")\b", re.IGNORECASE)
+
+
+def assertions(text: str, pattern: Optional[re.Pattern], names: Dict[str, str]
+               ) -> List[Tuple[str, str, int, int]]:
+    """
+    (entity, value, start, end) for every "<entity> is/was <value>" in text
+
+    `names` maps lowercased names to the entity names used in the graph.
+    Negated assertions ("was not dead") are skipped.
+    """
+    found = []
+    if pattern is None:
+        return found
+    for match in pattern.finditer(text):
+        assertion = _ASSERTION.match(text, match.end())
+        if assertion is None or assertion.group(1):
+            continue
+        value = _normalize_value(assertion.group(2) or assertion.group(3))
+        entity = names.get(match.group(0).lower())
+        if entity is not None:
+            found.append((entity, value, match.start(), assertion.end()))
+    return found
+
+
+def extract_facts(doc_id: str, text: str, entities: List[Any], relationships: List[Any]
+                  ) -> Dict[str, List[Fact]]:
+    """
+    Facts a document states, keyed by entity name (blocking; run in a thread)
+
+    Attribute facts come from "<entity> is/was <value>" sentences; relation
+    facts from the extracted relationships, located by their context or by
+    the first sentence naming both entities.
+    """
+    names = {entity.text.lower(): entity.text for entity in entities}
+    pattern = _name_pattern(entity.text for entity in entities)
+    facts: Dict[str, List[Fact]] = {}
+    seen = set()
+
+    for entity, value, start, end in assertions(text, pattern, names):
+        if (entity, value) in seen:
+            continue
+        seen.add((entity, value))
+        left, right = _sentence_span(text, start, end)
+        facts.setdefault(entity, []).append(
+            Fact('is', value, doc_id, left, right, 0.8, text[left:right][:SNIPPET_CHARS])
+        )
+
+    lowered = text.lower()
+    known = set(names.values())
+    for rel in relationships:
+        if rel.source not in known or rel.target not in known:
+            continue
+        start, end = -1, -1
+        context = (rel.context or '').strip()
+        position = lowered.find(context.lower()) if context else -1
+        if position != -1:
+            start, end = position, position + len(context)
+        else:
+            source_at = lowered.find(rel.source.lower())
+            while source_at != -1:
+                left, right = _sentence_span(text, source_at, source_at + len(rel.source))
+                if rel.target.lower() in lowered[left:right]:
+                    start, end = left, right
+                    break
+                source_at = lowered.find(rel.source.lower(), source_at + 1)
+        snippet = text[start:end][:SNIPPET_CHARS] if start != -1 else context[:SNIPPET_CHARS]
+        facts.setdefault(rel.source, []).append(
+            Fact(rel.relation_type, rel.target, doc_id, start, end, rel.confidence, snippet)
+        )
+    return facts
+
+
+def _conflict_type(predicate: str) -> str:
+    if predicate in CHECK_RELATIONS['setting']:
+        return 'setting'
+    if predicate in CHECK_RELATIONS['plot']:
+        return 'plot'
+    return 'character_state'
+
+
+def fact_to_dict(entity: str, fact: Fact) -> Dict[str, Any]:
+    return {
+        'entity': entity,
+        'predicate': fact.predicate,
+        'value': fact.value,
+        'doc_id': fact.doc_id,
+        'span': [fact.start, fact.end] if fact.start != -1 else None,
+        'evidence': fact.snippet
+    }
+
+
+class FactIndex:
+    """
+    Lookup side of a user's facts (the facts themselves live on graph nodes)
+
+    `version` is bumped by the owning UserGraph whenever a document is merged
+    or removed; the name matcher, verification verdicts and check results
+    are kept until then, so re-checking against an unchanged corpus is a
+    dictionary lookup.
+    """
+
+    def __init__(self, graph, max_results: int = 256):
+        self.graph = graph
+        self.version = 0
+        self.max_results = max_results
+        self._matcher_version = -1
+        self._pattern: Optional[re.Pattern] = None
+        self._names: Dict[str, str] = {}
+        self._verdicts: Dict[Tuple[str, Fact], str] = {}
+        self._results: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+
+    def invalidate(self):
+        """Documents changed (call with the graph lock held)"""
+        self.version += 1
+        self._verdicts.clear()
+        self._results.clear()
+
+    def facts(self, entity: str) -> List[Fact]:
+        if entity not in self.graph:
+            return []
+        return [Fact(*fact) for fact in self.graph.nodes[entity].get('facts', ())]
+
+    def _matcher(self):
+        if self._matcher_version != self.version:
+            self._names = {str(node).lower(): node for node in self.graph.nodes}
+            self._pattern = _name_pattern(self._names.values())
+            self._matcher_version = self.version
+        return self._pattern, self._names
+
+    def lookup(self, statement: str, check_type: str = 'all') -> FactLookup:
+        """
+        Compare what the statement asserts with the indexed facts
+
+        Contradictions within an exclusive value group (dead vs alive) are
+        conflicts; facts the statement repeats are confirmations. Differing
+        attributes outside the groups, and relations between entities the
+        statement mentions together, are ambiguous.
+        """
+        pattern, names = self._matcher()
+        result = FactLookup()
+        if pattern is None:
+            return result
+        predicates = set().union(*CHECK_RELATIONS.values()) if check_type == 'all' \
+            else CHECK_RELATIONS.get(check_type, set())
+        mentioned = list(OrderedDict.fromkeys(names[m.group(0).lower()] for m in pattern.finditer(statement)))
+        result.mentioned = mentioned
+        stated = {}
+        for entity, value, _, _ in assertions(statement, pattern, names):
+            stated.setdefault(entity, set()).add(value)
+
+        for entity in mentioned:
+            for fact in self.facts(entity):
+                if fact.predicate not in predicates:
+                    continue
+                if fact.predicate == 'is':
+                    values = stated.get(entity)
+                    if not values:
+                        continue
+                    if fact.value in values:
+                        result.confirmations.append({
+                            'type': 'supporting_evidence',
+                            'narrative': fact.snippet,
+                            'confidence': fact.confidence,
+                            'fact': fact_to_dict(entity, fact)
+                        })
+                    elif any(_VALUE_GROUP.get(value, -1) == _VALUE_GROUP.get(fact.value, -2) for value in values):
+                        result.conflicts.append({
+                            'type': 'character_state',
+                            'character': entity,
+                            'conflict': f"{entity} previously described as {fact.value}",
+                            'evidence': fact.snippet,
+                            'fact': fact_to_dict(entity, fact)
+                        })
+                    else:
+                        result.ambiguous.append((entity, fact))
+                elif fact.value in mentioned:
+                    result.ambiguous.append((entity, fact))
+        return result
+
+    def verdict(self, statement: str, fact: Fact) -> Optional[str]:
+        return self._verdicts.get((normalize_query(statement), fact))
+
+    def remember_verdict(self, statement: str, fact: Fact, verdict: str, version: int):
+        if version == self.version:
+            self._verdicts[(normalize_query(statement), fact)] = verdict
+
+    def cached_result(self, statement: str, check_type: str) -> Optional[Dict[str, Any]]:
+        key = (normalize_query(statement), check_type)
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+        return result
+
+    def remember_result(self, statement: str, check_type: str, result: Dict[str, Any], version: int):
+        """Keep a check result computed against `version` (dropped if documents changed since)"""
+        if version != self.version:
+            return
+        self._results[(normalize_query(statement), check_type)] = result
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+
+def conflict_from_verdict(entity: str, fact: Fact) -> Dict[str, Any]:
+    """Conflict entry for a fact the verifier found contradicted"""
+    if fact.predicate == 'is':
+        description = f"{entity} previously described as {fact.value}"
+    else:
+        description = f"Contradicts {entity} {fact.predicate.lower().replace('_', ' ')} {fact.value}"
+    return {
+        'type': _conflict_type(fact.predicate),
+        'character': entity,
+        'conflict': description,
+        'evidence': fact.snippet,
+        'fact': fact_to_dict(entity, fact)
+    }
@@ -5,6 +5,7 @@ Implements PathRAG-inspired knowledge graph construction with LLM-enhanced NER.
 
 import asyncio
 import logging
+import os
 from typing import Dict, List, Set, Tuple, Optional, Any
 import networkx as nx
 import json
@@ -15,6 +16,9 @@ from ..llm.gemini_service import GeminiService
 
 logger = logging.getLogger(__name__)
 
+# Gemini extraction calls in flight per document (GRAPH_EXTRACTION_CONCURRENCY)
+DEFAULT_EXTRACTION_CONCURRENCY = int(os.environ.get('GRAPH_EXTRACTION_CONCURRENCY', 4))
+
 @dataclass
 class Entity:
     """Represents an extracted entity with metadata."""
@@ -196,25 +200,44 @@ Text to analyze:
         Returns:
             Complete knowledge graph
         """
+        merged_entities, merged_relationships = await self.extract_document(text, chunk_size)
+
+        # Build final graph
+        return self.build_graph(merged_entities, merged_relationships)
+
+    async def extract_document(self, text: str, chunk_size: int = 2000,
+                               semaphore: Optional[asyncio.Semaphore] = None
+                               ) -> Tuple[List[Entity], List[Relationship]]:
+        """
+        Extract and merge entities and relationships from every chunk of a text.
+
+        Chunks are sent to Gemini concurrently; the semaphore bounds the calls in
+        flight (pass a shared one to cap calls across several documents).
+
+        Args:
+            text: Input text to analyze
+            chunk_size: Size of text chunks for processing
+            semaphore: Limit on concurrent extraction calls
+
+        Returns:
+            Tuple of merged (entities, relationships)
+        """
         # Split text into manageable chunks if needed
         chunks = self._split_text(text, chunk_size)
+        semaphore = semaphore or asyncio.Semaphore(DEFAULT_EXTRACTION_CONCURRENCY)
         
-        all_entities = []
-        all_relationships = []
+        async def extract(i: int, chunk: str):
+            async with semaphore:
+                logger.info(f"Processing chunk {i+1}/{len(chunks)}")
+                return await self.extract_entities_and_relationships(chunk)
         
-        # Process each chunk
-        for i, chunk in enumerate(chunks):
-            logger.info(f"Processing chunk {i+1}/{len(chunks)}")
-            entities, relationships = await self.extract_entities_and_relationships(chunk)
-            all_entities.extend(entities)
-            all_relationships.extend(relationships)
+        results = await asyncio.gather(*(extract(i, chunk) for i, chunk in enumerate(chunks)))
         
-        # Merge duplicate entities and relationships
-        merged_entities = self._merge_entities(all_entities)
-        merged_relationships = self._merge_relationships(all_relationships)
+        all_entities = [entity for entities, _ in results for entity in entities]
+        all_relationships = [relationship for _, relationships in results for relationship in relationships]
         
-        # Build final graph
-        return self.build_graph(merged_entities, merged_relationships)
+        # Merge duplicate entities and relationships
+        return self._merge_entities(all_entities), self._merge_relationships(all_relationships)
 
     def _split_text(self, text: str, chunk_size: int) -> List[str]:
         """Split text into overlapping chunks."""
@@ -314,6 +337,18 @@ Text to analyze:
             ]
         }
 
+    def load_graph_data(self, graph_data: Dict[str, Any]) -> nx.DiGraph:
+        """Replace the graph with data produced by export_graph_data()."""
+        self.graph.clear()
+        for node in graph_data.get('nodes', []):
+            attributes = {key: value for key, value in node.items() if key != 'id'}
+            self.graph.add_node(node['id'], **attributes)
+        for edge in graph_data.get('edges', []):
+            attributes = {key: value for key, value in edge.items() if key not in ('source', 'target')}
+            self.graph.add_edge(edge['source'], edge['target'], **attributes)
+        logger.info(f"Loaded graph with {len(self.graph.nodes)} nodes and {len(self.graph.edges)} edges")
+        return self.graph
+
     def calculate_centrality_metrics(self) -> Dict[str, Dict[str, float]]:
         """Calculate various centrality metrics for nodes."""
         metrics = {}
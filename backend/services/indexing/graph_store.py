@@ -0,0 +1,414 @@
+"""
+Graph store - one knowledge graph per user, merged document by document
+Graphs persist per user (Postgres or local files) and are loaded on first use;
+resident graphs are kept under a memory budget, least recently used evicted first.
+"""
+
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable, Callable
+from collections import OrderedDict
+import os
+import json
+import logging
+import threading
+import networkx as nx
+
+from .graph_builder import Entity, Relationship
+from .path_retriever import PathRetriever
+from .fact_index import Fact, FactIndex
+
+logger = logging.getLogger(__name__)
+
+# Approximate resident size of a networkx node / edge with this module's
+# attributes (measured with tracemalloc), used for the memory budget
+NODE_BYTES = 750
+EDGE_BYTES = 350
+FACT_BYTES = 400
+
+
+class UserGraph:
+    """
+    A user's knowledge graph and the documents behind each part of it
+
+    Every node carries `mentions` ([{'doc_id': ...}]) and every edge `doc_ids`,
+    so re-indexing a document first takes back exactly what that document
+    contributed: nodes and edges no other document supports are dropped,
+    shared ones only lose the mention. Nodes also carry the `facts` the
+    documents state about them (see fact_index.py); `facts` is the lookup
+    side, invalidated on every change.
+
+    Changes happen on the event loop. `lock` keeps readers in worker threads
+    (saves, read()) from seeing the graph mid-change; readers on the event
+    loop need no lock.
+    """
+
+    def __init__(self, user_id: Any, graph: Optional[nx.DiGraph] = None):
+        self.user_id = user_id
+        self.graph = graph if graph is not None else nx.DiGraph()
+        self.doc_nodes: Dict[str, Set[str]] = {}
+        self.doc_edges: Dict[str, Set[Tuple[str, str]]] = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self._retriever: Optional[PathRetriever] = None
+        self.facts = FactIndex(self.graph)
+        self.fact_count = 0
+        for node, data in self.graph.nodes(data=True):
+            self.fact_count += len(data.get('facts', ()))
+            for mention in data.get('mentions', []):
+                self.doc_nodes.setdefault(mention['doc_id'], set()).add(node)
+        for source, target, data in self.graph.edges(data=True):
+            for doc_id in data.get('doc_ids', []):
+                self.doc_edges.setdefault(doc_id, set()).add((source, target))
+
+    @property
+    def nbytes(self) -> int:
+        return (self.graph.number_of_nodes() * NODE_BYTES + self.graph.number_of_edges() * EDGE_BYTES
+                + self.fact_count * FACT_BYTES)
+
+    def merge_document(self, doc_id: str, entities: List[Entity], relationships: List[Relationship],
+                       facts: Optional[Dict[str, List[Fact]]] = None):
+        """Replace a document's contribution with a fresh extraction"""
+        with self.lock:
+            self._remove_document(doc_id)
+            self._add_document(doc_id, entities, relationships, facts or {})
+            self.facts.invalidate()
+            self.dirty = True
+
+    def remove_document(self, doc_id: str):
+        """Take back everything a document contributed"""
+        with self.lock:
+            self._remove_document(doc_id)
+            self.facts.invalidate()
+            self.dirty = True
+
+    def _add_document(self, doc_id: str, entities: List[Entity], relationships: List[Relationship],
+                      facts: Dict[str, List[Fact]]):
+        nodes = self.doc_nodes.setdefault(doc_id, set())
+        for entity in entities:
+            if entity.text in nodes:
+                continue
+            if entity.text in self.graph:
+                data = self.graph.nodes[entity.text]
+                if entity.confidence > data.get('confidence', 0):
+                    data['confidence'] = entity.confidence
+                data.setdefault('mentions', []).append({'doc_id': doc_id})
+            else:
+                self.graph.add_node(
+                    entity.text,
+                    type=entity.type,
+                    confidence=entity.confidence,
+                    start_pos=entity.start_pos,
+                    end_pos=entity.end_pos,
+                    mentions=[{'doc_id': doc_id}]
+                )
+            nodes.add(entity.text)
+
+        # Fact lists are replaced, never changed in place, so a snapshot taken
+        # by to_data() stays valid after the lock is released
+        for node, node_facts in facts.items():
+            if node in nodes and node_facts:
+                data = self.graph.nodes[node]
+                data['facts'] = data.get('facts', []) + [tuple(fact) for fact in node_facts]
+                self.fact_count += len(node_facts)
+
+        edges = self.doc_edges.setdefault(doc_id, set())
+        for rel in relationships:
+            if rel.source not in self.graph or rel.target not in self.graph:
+                continue
+            existing = self.graph.get_edge_data(rel.source, rel.target)
+            if existing is None:
+                self.graph.add_edge(rel.source, rel.target, relation_type=rel.relation_type,
+                                    confidence=rel.confidence, context=rel.context, doc_ids=[doc_id])
+            else:
+                if rel.confidence > existing.get('confidence', 0):
+                    existing.update(relation_type=rel.relation_type, confidence=rel.confidence,
+                                    context=rel.context)
+                if doc_id not in existing.setdefault('doc_ids', []):
+                    existing['doc_ids'].append(doc_id)
+            edges.add((rel.source, rel.target))
+
+    def _remove_document(self, doc_id: str):
+        for source, target in self.doc_edges.pop(doc_id, ()):
+            data = self.graph.get_edge_data(source, target)
+            if data is None:
+                continue
+            doc_ids = [d for d in data.get('doc_ids', []) if d != doc_id]
+            if doc_ids:
+                data['doc_ids'] = doc_ids
+            else:
+                self.graph.remove_edge(source, target)
+        for node in self.doc_nodes.pop(doc_id, ()):
+            if node not in self.graph:
+                continue
+            data = self.graph.nodes[node]
+            if data.get('facts'):
+                kept = [fact for fact in data['facts'] if fact[2] != doc_id]
+                self.fact_count -= len(data['facts']) - len(kept)
+                data['facts'] = kept
+            mentions = [m for m in data.get('mentions', []) if m.get('doc_id') != doc_id]
+            if mentions:
+                data['mentions'] = mentions
+            else:
+                self.fact_count -= len(data.get('facts', ()))
+                self.graph.remove_node(node)
+
+    def nodes_for_documents(self, doc_ids: Iterable[str]) -> Set[str]:
+        nodes = set()
+        for doc_id in doc_ids:
+            nodes.update(self.doc_nodes.get(doc_id, ()))
+        return nodes
+
+    def read(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(*args) with the graph held still (for readers in worker threads)"""
+        with self.lock:
+            return fn(*args)
+
+    def retriever(self, vector_store) -> PathRetriever:
+        """Path retriever over this graph, scoped to the user's chunks"""
+        if self._retriever is None:
+            self._retriever = PathRetriever(self.graph, vector_store, doc_nodes=self.doc_nodes,
+                                            search_filter={'user_id': self.user_id})
+        return self._retriever
+
+    def to_data(self) -> Dict[str, Any]:
+        """Same layout as GeminiGraphBuilder.export_graph_data()"""
+        with self.lock:
+            return {
+                'nodes': [{'id': node, **data, 'mentions': [dict(m) for m in data.get('mentions', [])]}
+                          for node, data in self.graph.nodes(data=True)],
+                'edges': [{'source': source, 'target': target, **data, 'doc_ids': list(data.get('doc_ids', []))}
+                          for source, target, data in self.graph.edges(data=True)]
+            }
+
+    @classmethod
+    def from_data(cls, user_id: Any, data: Dict[str, Any]) -> 'UserGraph':
+        graph = nx.DiGraph()
+        for node in data.get('nodes', []):
+            graph.add_node(node['id'], **{key: value for key, value in node.items() if key != 'id'})
+        for edge in data.get('edges', []):
+            graph.add_edge(edge['source'], edge['target'],
+                           **{key: value for key, value in edge.items() if key not in ('source', 'target')})
+        return cls(user_id, graph)
+
+
+class PostgresGraphBackend:
+    """Graphs in the user_knowledge_graphs table (database/migrations/004_user_knowledge_graphs.sql)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def load(self, user_id: Any) -> Optional[Dict[str, Any]]:
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT graph FROM user_knowledge_graphs WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        graph = row['graph']
+        return json.loads(graph) if isinstance(graph, str) else graph
+
+    def save(self, user_id: Any, data: Dict[str, Any]):
+        # Raw cursor rather than execute_query, which logs its parameters
+        with self.db.get_connection() as conn:
+            conn.cursor().execute(
+                """
+                INSERT INTO user_knowledge_graphs (user_id, graph, node_count, edge_count, updated_at)
+                VALUES (%s, %s::jsonb, %s, %s, NOW())
+                ON CONFLICT (user_id) DO UPDATE SET
+                    graph = EXCLUDED.graph, node_count = EXCLUDED.node_count,
+                    edge_count = EXCLUDED.edge_count, updated_at = NOW()
+                """,
+                (user_id, json.dumps(data, default=str), len(data['nodes']), len(data['edges']))
+            )
+
+
+class FileGraphBackend:
+    """One JSON file per user; used when DATABASE_URL is not configured"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, user_id: Any) -> str:
+        return os.path.join(self.directory, f"user_{user_id}.json")
+
+    def load(self, user_id: Any) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(user_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, user_id: Any, data: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(user_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, path)
+
+
+class GraphStore:
+    """
+    Resident per-user graphs over a durable backend
+
+    get() loads a user's graph on first use. Merges mark the graph dirty and
+    save() / flush() write it back. When resident graphs exceed `max_bytes`,
+    the least recently used ones are saved (if dirty) and dropped; the graph
+    just requested is never evicted, so one large user can exceed the budget
+    but never loses their own graph mid-request. A graph that failed to load
+    is not kept, so a later merge cannot overwrite the stored one.
+
+    get(), save() and flush() do blocking I/O; call them from a worker thread.
+    merge_document() and remove_document() only touch memory once get() has
+    loaded the user's graph.
+    """
+
+    def __init__(self, backend, max_bytes: int = 256 * 1024 * 1024):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self._graphs: "OrderedDict[str, UserGraph]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._loads = 0
+        self._load_failures = 0
+        self._saves = 0
+        self._evictions = 0
+
+    def get(self, user_id: Any) -> UserGraph:
+        key = str(user_id)
+        with self._lock:
+            user_graph = self._graphs.get(key)
+            if user_graph is not None:
+                self._graphs.move_to_end(key)
+                return user_graph
+
+        loaded = self._load(user_id)
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first copy
+            user_graph = self._graphs.setdefault(key, loaded)
+            self._graphs.move_to_end(key)
+        self._evict(keep=key)
+        return user_graph
+
+    def peek(self, user_id: Any) -> Optional[UserGraph]:
+        """Resident graph, without loading it"""
+        return self._graphs.get(str(user_id))
+
+    def merge_document(self, user_id: Any, doc_id: str, entities: List[Entity],
+                       relationships: List[Relationship],
+                       facts: Optional[Dict[str, List[Fact]]] = None) -> UserGraph:
+        """Replace a document's entities, relationships and facts in its owner's graph"""
+        return self._change(
+            user_id, lambda user_graph: user_graph.merge_document(doc_id, entities, relationships, facts)
+        )
+
+    def remove_document(self, user_id: Any, doc_id: str) -> UserGraph:
+        return self._change(user_id, lambda user_graph: user_graph.remove_document(doc_id))
+
+    def _change(self, user_id: Any, change) -> UserGraph:
+        key = str(user_id)
+        while True:
+            user_graph = self.get(user_id)
+            with self._lock:
+                # Eviction only drops clean graphs under this lock, so once the
+                # change marks the graph dirty it stays resident until saved
+                if self._graphs.get(key) is user_graph:
+                    change(user_graph)
+                    return user_graph
+
+    def save(self, user_id: Any) -> bool:
+        """Write a user's graph back if it changed"""
+        user_graph = self.peek(user_id)
+        if user_graph is None or not user_graph.dirty:
+            return False
+        self._save(user_graph)
+        return True
+
+    def flush(self) -> int:
+        """Write back every changed graph (used on shutdown); returns graphs saved"""
+        saved = 0
+        for user_graph in list(self._graphs.values()):
+            if user_graph.dirty:
+                try:
+                    self._save(user_graph)
+                    saved += 1
+                except Exception as e:
+                    logger.error(f"❌ Saving knowledge graph of user {user_graph.user_id} failed: {e}")
+        return saved
+
+    def _load(self, user_id: Any) -> UserGraph:
+        try:
+            data = self.backend.load(user_id)
+        except Exception:
+            self._load_failures += 1
+            raise
+        self._loads += 1
+        return UserGraph.from_data(user_id, data) if data else UserGraph(user_id)
+
+    def _save(self, user_graph: UserGraph):
+        with user_graph.save_lock:
+            if not user_graph.dirty:
+                return
+            data = user_graph.to_data()
+            user_graph.dirty = False
+            try:
+                self.backend.save(user_graph.user_id, data)
+            except Exception:
+                user_graph.dirty = True
+                raise
+            self._saves += 1
+
+    def _evict(self, keep: str):
+        with self._lock:
+            resident = sum(user_graph.nbytes for user_graph in self._graphs.values())
+            candidates = [(key, user_graph) for key, user_graph in self._graphs.items() if key != keep]
+        for key, user_graph in candidates:
+            if resident <= self.max_bytes:
+                break
+            if user_graph.dirty:
+                try:
+                    self._save(user_graph)
+                except Exception as e:
+                    logger.error(f"❌ Saving knowledge graph of user {user_graph.user_id} failed, "
+                                 f"keeping it resident: {e}")
+                    continue
+            with self._lock:
+                if user_graph.dirty or self._graphs.get(key) is not user_graph:
+                    continue
+                del self._graphs[key]
+            resident -= user_graph.nbytes
+            self._evictions += 1
+            logger.debug(f"Evicted knowledge graph of user {user_graph.user_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        graphs = list(self._graphs.values())
+        return {
+            'resident_graphs': len(graphs),
+            'nodes': sum(g.graph.number_of_nodes() for g in graphs),
+            'edges': sum(g.graph.number_of_edges() for g in graphs),
+            'facts': sum(g.fact_count for g in graphs),
+            'memory_mb': round(sum(g.nbytes for g in graphs) / 1e6, 2),
+            'max_memory_mb': round(self.max_bytes / 1e6, 2),
+            'dirty': sum(1 for g in graphs if g.dirty),
+            'loads': self._loads,
+            'load_failures': self._load_failures,
+            'saves': self._saves,
+            'evictions': self._evictions,
+            'backend': type(self.backend).__name__
+        }
+
+
+def graph_store_from_env() -> GraphStore:
+    """
+    GRAPH_STORE: postgres (default when DATABASE_URL is set) | file
+    GRAPH_STORE_DIR: directory for the file backend (default ./knowledge_graphs)
+    GRAPH_STORE_MAX_MB: memory for resident graphs (default 256)
+    """
+    backend_name = os.environ.get('GRAPH_STORE', 'postgres' if os.environ.get('DATABASE_URL') else 'file')
+    if backend_name.lower() == 'file':
+        backend = FileGraphBackend(os.environ.get('GRAPH_STORE_DIR', './knowledge_graphs'))
+    else:
+        from ..database import get_db_service
+        backend = PostgresGraphBackend(get_db_service())
+    return GraphStore(backend, max_bytes=int(float(os.environ.get('GRAPH_STORE_MAX_MB', 256)) * 1024 * 1024))
@@ -3,11 +3,12 @@ Hybrid Indexer - Combines vector store, knowledge graph, and path retrieval
 Main interface for the writing assistant's contextual understanding
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import asyncio
 from datetime import datetime
 import json
 import logging
+import os
 import time
 import threading
 from functools import lru_cache
@@ -15,10 +16,45 @@ from functools import lru_cache
 from .vector_store import VectorStore
 from .graph_builder import GeminiGraphBuilder
 from .path_retriever import PathRetriever
+from .embedding_worker import EmbeddingWorker
+from .bm25_index import reciprocal_rank_fusion
+from .index_snapshot import IndexSnapshot, write_snapshot, snapshot_path_from_env
+from .indexing_pipeline import IndexingJobs, indexing_pipeline_from_env
+from .job_queue import PermanentJobError, job_pool_from_env
+from .graph_store import UserGraph, graph_store_from_env
+from .fact_index import Fact, extract_facts, fact_to_dict, conflict_from_verdict
+from .reindex_scheduler import reindex_scheduler_from_env
+from .context_cache import folder_context_cache_from_env
+from .deadline_budget import DeadlineBudget, TierStats
+from .sentence_index import sentence_index_store_from_env
 from ..llm.gemini_service import GeminiService
 
 logger = logging.getLogger(__name__)
 
+# Reciprocal-rank fusion constant (the usual 60 from the original RRF paper)
+RRF_K = 60
+
+# Folder context: documents ranked locally by embedding. Blended document/chunk
+# cosine below FOLDER_CONTEXT_MIN_SCORE is dropped; FOLDER_CONTEXT_RERANK=llm
+# lets Gemini re-order the local candidates.
+FOLDER_CONTEXT_MIN_SCORE = float(os.environ.get('FOLDER_CONTEXT_MIN_SCORE', 0.25))
+FOLDER_CONTEXT_RERANK = os.environ.get('FOLDER_CONTEXT_RERANK', 'off').lower()
+FOLDER_CONTEXT_RERANK_TIMEOUT = float(os.environ.get('FOLDER_CONTEXT_RERANK_TIMEOUT', 10))
+# Folder context tiers share one deadline; each tier also has its own ceiling
+FOLDER_CONTEXT_DEADLINE = float(os.environ.get('FOLDER_CONTEXT_DEADLINE', 120))
+FOLDER_TIER_TIMEOUTS = {'embedding': 30.0, 'keyword': 45.0, 'llm': 60.0}
+# How often a user's documents are checked against the index
+FOLDER_INDEX_CHECK_SECONDS = float(os.environ.get('FOLDER_INDEX_CHECK_SECONDS', 300))
+
+# Consistency checks: facts the lookup cannot decide are verified by Gemini,
+# at most CONSISTENCY_VERIFY_MAX_FACTS of them in one call
+CONSISTENCY_VERIFY_MAX_FACTS = int(os.environ.get('CONSISTENCY_VERIFY_MAX_FACTS', 12))
+CONSISTENCY_VERIFY_TIMEOUT = float(os.environ.get('CONSISTENCY_VERIFY_TIMEOUT', 15))
+
+# Contextual feedback: stages still running at the deadline are cut off and
+# reported as 'timeout' next to whatever the other stages found
+CONTEXTUAL_FEEDBACK_DEADLINE = float(os.environ.get('CONTEXTUAL_FEEDBACK_DEADLINE', 20))
+
 class HybridIndexer:
     """
     Unified interface for hybrid document indexing combining:
@@ -91,7 +127,47 @@ class HybridIndexer:
         self.vector_store = VectorStore(collection_name)
         self.gemini_service = gemini_service or GeminiService()
         self.graph_builder = GeminiGraphBuilder(self.gemini_service)
-        self.path_retriever = None  # Will be initialized after we have a graph
+        # One knowledge graph per user, loaded on demand and saved per user
+        self.graph_store = graph_store_from_env()
+        
+        # Model runs in a dedicated thread; concurrent encodes from different
+        # requests are coalesced into micro-batches. The backend is resolved per
+        # batch so constructing the indexer does not load the model.
+        self.embedding_worker = EmbeddingWorker(
+            lambda texts: self.vector_store.embedding_backend.encode(texts),
+            max_batch_size=int(os.environ.get('EMBEDDING_BATCH_SIZE', 64)),
+            max_wait_ms=float(os.environ.get('EMBEDDING_BATCH_WAIT_MS', 10))
+        )
+        self.vector_store.attach_embedding_worker(self.embedding_worker)
+
+        # Folder indexing runs as a staged pipeline with per-stage concurrency;
+        # progress of recent runs is kept for the UI to poll
+        self.indexing_pipeline = indexing_pipeline_from_env(self.vector_store, self.graph_builder,
+                                                            self.graph_store)
+        self.indexing_jobs = IndexingJobs()
+
+        # Indexing requests are queued as durable jobs and run by this pool
+        # (started in the app lifespan), not inside the HTTP request
+        self.job_pool = job_pool_from_env({
+            'index_document': self._run_index_document_job,
+            'index_folder': self._run_index_folder_job
+        })
+
+        # Sentence boundaries and token IDs per document version, for excerpts
+        self.sentence_index = sentence_index_store_from_env(self.vector_store._encode)
+
+        # Folder context results are reused until a document of that user changes
+        self.context_cache = folder_context_cache_from_env()
+
+        # Which folder retrieval tier answers, and how fast
+        self.folder_tier_stats = TierStats()
+
+        # Document saves are debounced into diff-based vector index updates;
+        # its watermarks say whether the index is current for each document
+        self.reindex_scheduler = reindex_scheduler_from_env(self.reindex_document, self.remove_document,
+                                                            on_change=self._invalidate_folder_context)
+        self._folder_index_checked: Dict[int, float] = {}
+        self._background_tasks = set()
         
         # Track indexed documents
         self.indexed_documents = {}
@@ -133,41 +209,53 @@ class HybridIndexer:
             })
             
             # 1. Vector indexing with narrative-aware chunking
+            # Re-indexing an existing document only embeds the chunks that changed
+            # Chroma and chunking run in a thread; the model calls inside it are
+            # served by the embedding worker so the event loop stays responsive
             logger.info(f"Starting vector indexing for document {document_id}")
-            vector_chunk_ids = self.vector_store.add_document(content, document_id, doc_metadata)
+            await self.embedding_worker.start()
+            vector_sync = await asyncio.to_thread(
+                self.vector_store.sync_document, content, document_id, doc_metadata
+            )
+            vector_chunk_ids = vector_sync['chunk_ids']
+            await asyncio.to_thread(self.sentence_index.index_document, document_id, content)
             
             # 2. Knowledge graph construction using Gemini
             logger.info(f"Building knowledge graph for document {document_id}")
-            graph = await self.graph_builder.analyze_text(content)
-            
-            # 3. Store graph data
-            graph_data = self.graph_builder.export_graph_data()
-            
-            # 4. Initialize path retriever with the graph (if not already initialized)
-            if self.path_retriever is None:
-                self.path_retriever = PathRetriever(graph, self.vector_store)
-            else:
-                # Update the path retriever with the new graph
-                self.path_retriever.graph = graph
-            
-            # 5. Calculate document statistics
+            entities, relationships = await self.graph_builder.extract_document(content)
+            
+            # 3. Replace this document's entities and facts in its owner's graph
+            user_graph = None
+            user_id = doc_metadata.get('user_id')
+            if user_id is not None:
+                facts = await asyncio.to_thread(extract_facts, document_id, content, entities, relationships)
+                await asyncio.to_thread(self.graph_store.get, user_id)
+                user_graph = self.graph_store.merge_document(user_id, document_id, entities, relationships, facts)
+                await asyncio.to_thread(self.graph_store.save, user_id)
+            
+            # 4. Calculate document statistics
             stats = {
                 'document_id': document_id,
                 'processing_time': time.time() - start_time,
                 'chunks_created': len(vector_chunk_ids),
-                'entities_extracted': len(graph_data['nodes']),
-                'relationships_found': len(graph_data['edges']),
-                'graph_nodes': len(graph.nodes),
-                'graph_edges': len(graph.edges)
+                'chunks_embedded': vector_sync['added'],
+                'chunks_removed': vector_sync['removed'],
+                'entities_extracted': len(entities),
+                'relationships_found': len(relationships),
+                'graph_nodes': user_graph.graph.number_of_nodes() if user_graph else 0,
+                'graph_edges': user_graph.graph.number_of_edges() if user_graph else 0
             }
             
             # Store document info
             self.indexed_documents[document_id] = {
                 'metadata': doc_metadata,
                 'stats': stats,
-                'graph_data': graph_data,
+                'chunk_ids': vector_chunk_ids,
+                'entity_count': len(entities),
+                'relationship_count': len(relationships),
                 'indexed_at': datetime.now()
             }
+            self._invalidate_folder_context(document_id, doc_metadata.get('user_id'))
             
             logger.info(f"Document {document_id} indexed successfully: {stats}")
             return stats
@@ -176,66 +264,279 @@ class HybridIndexer:
             logger.error(f"Error indexing document {document_id}: {e}")
             raise
     
-    async def index_folder(self, documents: List[Tuple[str, str, Dict]]) -> Dict[str, Any]:
+    async def index_folder(self, documents: List[Tuple[str, str, Dict]],
+                           job_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Index multiple documents as a related collection (e.g., chapters in a book)
         
+        Documents flow through the chunk -> embed -> extract -> merge pipeline
+        (see indexing_pipeline), so chapters overlap instead of running one
+        after another. A document that fails is reported and skipped; the rest
+        of the batch still completes.
+
         Args:
             documents: List of (doc_id, text, metadata) tuples
+            job_id: Progress record to update (created if missing)
             
         Returns:
             Batch indexing results
         """
-        results = []
+        progress = self.indexing_jobs.get(job_id) if job_id else None
+        if progress is None:
+            progress = self.indexing_jobs.create([doc_id for doc_id, _, _ in documents], job_id)
         
-        # Index each document
+        prepared = []
         for doc_id, text, metadata in documents:
-            result = await self.index_document(doc_id, text, metadata)
-            results.append(result)
+            doc_metadata = dict(metadata or {})
+            doc_metadata.update({
+                'document_id': doc_id,
+                'indexed_at': datetime.now().isoformat(),
+                'content_length': len(text or '')
+            })
+            prepared.append((doc_id, text, doc_metadata))
+
+        try:
+            await self.embedding_worker.start()
+            results = await self.indexing_pipeline.run(prepared, progress)
+        except asyncio.CancelledError:
+            progress.finish('cancelled')
+            raise
+        except Exception:
+            progress.finish('failed')
+            raise
         
-        # Build unified graph from all documents
-        doc_texts = [(doc_id, text) for doc_id, text, _ in documents]
-        self.graph_builder.build_narrative_graph(doc_texts)
+        texts_by_id = {doc_id: text for doc_id, text, _ in prepared}
+        await asyncio.to_thread(self._index_sentences,
+                                [(result['document_id'], texts_by_id[result['document_id']]) for result in results])
+
+        metadata_by_id = {doc_id: doc_metadata for doc_id, _, doc_metadata in prepared}
+        for result in results:
+            self.indexed_documents[result['document_id']] = {
+                'metadata': metadata_by_id[result['document_id']],
+                'stats': result,
+                'chunk_ids': result['chunk_ids'],
+                'entity_count': result['entities_extracted'],
+                'relationship_count': result['relationships_found'],
+                'indexed_at': datetime.now()
+            }
+            self._invalidate_folder_context(result['document_id'],
+                                            metadata_by_id[result['document_id']].get('user_id'))
         
-        # Reinitialize path retriever with complete graph
-        self.path_retriever = PathRetriever(self.graph_builder.graph, self.vector_store)
+        # Write the merged graphs back once per batch rather than per document
+        user_ids = {doc_metadata.get('user_id') for doc_metadata in metadata_by_id.values()} - {None}
+        for user_id in user_ids:
+            try:
+                await asyncio.to_thread(self.graph_store.save, user_id)
+            except Exception as e:
+                logger.error(f"❌ Saving knowledge graph of user {user_id} failed (kept in memory): {e}")
+        graphs = [self.graph_store.peek(user_id) for user_id in user_ids]
+        graphs = [user_graph for user_graph in graphs if user_graph is not None]
+        progress.finish()
         
         # Calculate statistics
-        successful = len(results)  # All results that completed without exception
+        successful = len(results)
         total_entities = sum(r.get('entities_extracted', 0) for r in results)
         total_relationships = sum(r.get('relationships_found', 0) for r in results)
         
+        logger.info(f"Folder indexed: {successful}/{len(documents)} documents in "
+                    f"{progress.to_dict()['elapsed_seconds']}s")
         return {
+            'job_id': progress.job_id,
             'documents_indexed': len(documents),
             'successful': successful,
             'failed': len(documents) - successful,
+            'errors': dict(progress.failed),
             'total_entities': total_entities,
             'total_relationships': total_relationships,
-            'graph_nodes': self.graph_builder.graph.number_of_nodes(),
-            'graph_edges': self.graph_builder.graph.number_of_edges(),
-            'results': results
+            'graph_nodes': sum(user_graph.graph.number_of_nodes() for user_graph in graphs),
+            'graph_edges': sum(user_graph.graph.number_of_edges() for user_graph in graphs),
+            'results': [{key: value for key, value in result.items() if key != 'chunk_ids'} for result in results]
         }
     
+    async def reindex_document(self, document_id: str, content: str,
+                               metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Bring a saved document's vector index up to date
+
+        Diff-based: only chunks whose text changed are embedded (see
+        VectorStore.sync_document). Gemini graph extraction is not re-run on
+        saves; it is left to explicit index_document / index_folder calls.
+
+        Args:
+            document_id: Saved document
+            content: Full document text after the save
+            metadata: Document metadata (title, user_id, folder_id)
+
+        Returns:
+            The vector store sync summary
+        """
+        await self.embedding_worker.start()
+        sync = await asyncio.to_thread(self.vector_store.sync_document, content, document_id, metadata or {})
+        await asyncio.to_thread(self.sentence_index.index_document, document_id, content)
+
+        doc_info = self.indexed_documents.setdefault(document_id, {})
+        doc_info.update({
+            'metadata': dict(metadata or {}, document_id=document_id, content_length=len(content)),
+            'chunk_ids': sync['chunk_ids'],
+            'indexed_at': datetime.now()
+        })
+        # Graph counts stay as of the last full indexing run
+        doc_info.setdefault('entity_count', 0)
+        doc_info.setdefault('relationship_count', 0)
+        self._invalidate_folder_context(document_id, (metadata or {}).get('user_id'))
+        return sync
+
+    async def remove_document(self, document_id: str, user_id: Optional[Any] = None) -> int:
+        """
+        Remove a deleted document's chunks and graph entities
+
+        The owner is needed to find the user's graph; when the caller does not
+        pass it (and the document was not indexed by this process), it is read
+        from the chunk metadata before the chunks are deleted.
+        """
+        doc_info = self.indexed_documents.pop(document_id, None) or {}
+        if user_id is None:
+            user_id = doc_info.get('metadata', {}).get('user_id')
+        if user_id is None:
+            try:
+                user_id = await asyncio.to_thread(self.vector_store.document_owner, document_id)
+            except Exception as e:
+                logger.warning(f"Could not look up the owner of {document_id}: {e}")
+        if user_id is not None:
+            try:
+                await asyncio.to_thread(self.graph_store.get, user_id)
+                self.graph_store.remove_document(user_id, document_id)
+                await asyncio.to_thread(self.graph_store.save, user_id)
+            except Exception as e:
+                logger.error(f"❌ Removing {document_id} from the knowledge graph failed: {e}")
+        self.sentence_index.remove_document(document_id)
+        removed = await asyncio.to_thread(self.vector_store.delete_document, document_id)
+        self._invalidate_folder_context(document_id)
+        return removed
+
+    async def _get_user_graph(self, user_id: Optional[int]) -> Optional[UserGraph]:
+        """The user's knowledge graph (None if they have no graph yet)"""
+        if user_id is None:
+            return None
+        try:
+            user_graph = await asyncio.to_thread(self.graph_store.get, user_id)
+        except Exception as e:
+            logger.warning(f"Knowledge graph of user {user_id} unavailable: {e}")
+            return None
+        return user_graph if user_graph.graph.number_of_nodes() else None
+
+    async def _get_path_retriever(self, user_id: Optional[int]) -> Optional[PathRetriever]:
+        """Path retriever over the user's graph (None if they have no graph yet)"""
+        user_graph = await self._get_user_graph(user_id)
+        return user_graph.retriever(self.vector_store) if user_graph else None
+
+    def _index_sentences(self, documents: List[Tuple[str, str]]):
+        """Build sentence indexes for (doc_id, text) pairs (blocking; run in a thread)"""
+        for doc_id, text in documents:
+            if text:
+                self.sentence_index.index_document(doc_id, text)
+
+    def _invalidate_folder_context(self, document_id: str, user_id: Optional[Any] = None):
+        """Drop cached folder context built from a document that just changed"""
+        if self.context_cache is not None:
+            self.context_cache.invalidate_document(document_id, user_id)
+
+    def get_index_freshness(self, doc_ids: List[str], user_id: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Per-document freshness watermarks (see ReindexScheduler.freshness)"""
+        return self.reindex_scheduler.freshness_many(doc_ids, user_id)
+
+    async def _run_index_document_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job handler for index_document"""
+        payload = job['payload']
+        if not payload.get('doc_id') or payload.get('text') is None:
+            raise PermanentJobError("index_document job needs doc_id and text")
+        return await self.index_document(payload['doc_id'], payload['text'], payload.get('metadata'))
+
+    async def _run_index_folder_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Job handler for index_folder; progress is tracked under the job ID"""
+        try:
+            documents = [(doc['doc_id'], doc['text'], doc.get('metadata') or {})
+                         for doc in job['payload']['documents']]
+        except (KeyError, TypeError) as e:
+            raise PermanentJobError(f"index_folder job has a malformed document list: {e}")
+        job_id = str(job['id'])
+        self.indexing_jobs.create([doc_id for doc_id, _, _ in documents], job_id, owner=job['user_id'])
+        return await self.index_folder(documents, job_id)
+
+    def get_indexing_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Live progress of a folder indexing run (None if unknown)"""
+        progress = self.indexing_jobs.get(job_id)
+        return progress.to_dict() if progress else None
+
     async def get_contextual_feedback(self, 
                                     highlighted_text: str,
                                     doc_id: str,
-                                    context_window: int = 500) -> Dict[str, Any]:
+                                    context_window: int = 500,
+                                    user_id: Optional[int] = None,
+                                    deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
         """
         Get contextual feedback for highlighted text
         
+        Runs stream_contextual_feedback() to completion and returns its summary.
+
         Args:
             highlighted_text: The text user highlighted
             doc_id: Document containing the highlight
             context_window: Characters of context around highlight
+            user_id: Owner whose documents and knowledge graph are searched
+            deadline_seconds: Overall time budget (CONTEXTUAL_FEEDBACK_DEADLINE)
             
         Returns:
             Contextual analysis and suggestions
         """
+        analysis: Dict[str, Any] = {}
+        async for event, data in self.stream_contextual_feedback(
+            highlighted_text, doc_id, context_window, user_id, deadline_seconds
+        ):
+            if event == 'summary':
+                analysis = data
+        return analysis
+
+    async def stream_contextual_feedback(self,
+                                         highlighted_text: str,
+                                         doc_id: str,
+                                         context_window: int = 500,
+                                         user_id: Optional[int] = None,
+                                         deadline_seconds: Optional[float] = None
+                                         ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Contextual feedback for highlighted text, yielded stage by stage
+
+        Two independent chains run concurrently under one deadline:
+        vector search -> path retrieval (seeded by the search results), and
+        Gemini entity extraction -> per-character paths. Vector and graph work
+        runs in worker threads. Stages unfinished at the deadline are
+        cancelled; the summary carries what finished plus a per-stage status
+        ('ok', 'failed', 'timeout' or 'skipped') in 'stages'.
+
+        Yields (event, data) pairs:
+            semantic_context, entities, narrative_paths, character_contexts -
+                one per stage, in the order the stages complete, each with
+                the stage's status under 'stage'
+            suggestions - once every stage has finished or timed out
+            summary - the full analysis, as get_contextual_feedback returns it
+
+        Closing the generator early (client gone) cancels the stages still running.
+        """
+        started = time.monotonic()
+        deadline = started + (deadline_seconds or CONTEXTUAL_FEEDBACK_DEADLINE)
+        tasks: Dict[str, asyncio.Task] = {}
         try:
+            try:
+                user_graph = await asyncio.wait_for(self._get_user_graph(user_id), timeout=deadline - started)
+            except asyncio.TimeoutError:
+                user_graph = None
+            path_retriever = user_graph.retriever(self.vector_store) if user_graph else None
+
             # Check if we have any indexed documents
-            if not self.path_retriever and not self.indexed_documents:
+            if path_retriever is None and not self.indexed_documents:
                 # Provide helpful fallback response instead of error
-                return {
+                yield 'summary', {
                     'highlighted_text': highlighted_text,
                     'semantic_context': [],
                     'entities_mentioned': [],
@@ -248,45 +549,84 @@ class HybridIndexer:
                     'feedback_type': 'general_guidance',
                     'status': 'limited_context'
                 }
+                return
             
-            # Step 1: Get semantic context from vector store
-            semantic_results = []
-            try:
-                semantic_results = self.vector_store.search(
-                    highlighted_text,
-                    n_results=5,
-                    filter_dict={'doc_id': doc_id} if doc_id else None
-                )
-            except Exception as e:
-                logger.warning(f"Vector search failed: {e}")
-                # Try without filter if doc_id filter fails
-                try:
-                    semantic_results = self.vector_store.search(
-                        highlighted_text,
-                        n_results=5
-                    )
-                except Exception as e2:
-                    logger.warning(f"General vector search also failed: {e2}")
-                    semantic_results = []
-            
-            # Step 2: Extract entities from highlighted text
-            entities = {}
-            try:
-                entities = await self._extract_entities_from_text(highlighted_text)
-            except Exception as e:
-                logger.warning(f"Entity extraction failed: {e}")
-                entities = {}
+            # Chain 1: vector search, then path retrieval seeded by its results
+            search_task = asyncio.create_task(asyncio.to_thread(
+                self._search_feedback_context, highlighted_text, doc_id, user_id
+            ))
             
-            # Step 3: Get relevant paths (if path retriever is available)
-            paths = []
-            if self.path_retriever:
+            async def retrieve_paths():
                 try:
-                    paths = self.path_retriever.retrieve_paths(highlighted_text, top_k=3)
-                except Exception as e:
-                    logger.warning(f"Path retrieval failed: {e}")
-                    paths = []
+                    _, seed_results = await search_task
+                except Exception:
+                    seed_results = None  # Path retrieval runs its own search
+                return await asyncio.to_thread(
+                    user_graph.read, path_retriever.retrieve_paths, highlighted_text, 3, seed_results
+                )
+
+            # Chain 2: entity extraction, then each character's paths
+            entities_task = asyncio.create_task(self._extract_entities_from_text(highlighted_text))
+
+            async def character_context():
+                entities = await entities_task
+                char_names = [char_entity['text'] for char_entity in entities.get('CHARACTER', [])]
+                if not char_names:
+                    return []
+                if path_retriever is None:
+                    return [{
+                        'character': char_name,
+                        'arc_summary': f"Character {char_name} appears in the narrative",
+                        'relationship_count': 0,
+                        'event_count': 0
+                    } for char_name in char_names]
+                return await asyncio.to_thread(user_graph.read, self._character_contexts, path_retriever, char_names)
+
+            tasks['semantic_search'] = search_task
+            tasks['entity_extraction'] = entities_task
+            if path_retriever is not None:
+                tasks['path_retrieval'] = asyncio.create_task(retrieve_paths())
+            tasks['character_context'] = asyncio.create_task(character_context())
+
+            stages: Dict[str, Dict[str, Any]] = {}
+            outputs: Dict[str, Any] = {}
+            stage_names = {task: name for name, task in tasks.items()}
+            pending = set(tasks.values())
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in sorted(done, key=stage_names.get):
+                    name = stage_names[task]
+                    stage = {'status': 'ok', 'elapsed_ms': round((time.monotonic() - started) * 1000, 1)}
+                    error = task.exception()
+                    if error is not None:
+                        logger.warning(f"Contextual feedback stage {name} failed: {error}")
+                        stage.update(status='failed', error=str(error) or type(error).__name__)
+                    else:
+                        outputs[name] = task.result()
+                    stages[name] = stage
+                    yield self._feedback_stage_event(name, outputs.get(name), stage)
+
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            for name in tasks:
+                stages.setdefault(name, {'status': 'timeout'})
+            if 'path_retrieval' not in tasks:
+                stages['path_retrieval'] = {'status': 'skipped'}
+
+            semantic_results = outputs.get('semantic_search', ([], None))[0]
+            entities = outputs.get('entity_extraction', {})
+            paths = outputs.get('path_retrieval', [])
+
+            suggestions = self._generate_enhanced_suggestions(highlighted_text, entities, paths, semantic_results)
+            yield 'suggestions', {'suggestions': suggestions}
             
-            # Step 4: Analyze context and provide comprehensive feedback
             analysis = {
                 'highlighted_text': highlighted_text,
                 'semantic_context': [
@@ -297,48 +637,28 @@ class HybridIndexer:
                 ],
                 'entities_mentioned': self._format_entities(entities),
                 'narrative_paths': self._format_paths(paths),
-                'suggestions': self._generate_enhanced_suggestions(highlighted_text, entities, paths, semantic_results),
+                'suggestions': suggestions,
                 'feedback_type': 'contextual_analysis',
-                'status': 'success'
+                'status': 'success' if all(stage['status'] in ('ok', 'skipped') for stage in stages.values())
+                          else 'partial',
+                'stages': stages,
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
             }
             
-            # Step 5: Add character-specific context if characters are mentioned
-            character_contexts = []
-            for char_entity in entities.get('CHARACTER', []):
-                char_name = char_entity['text']
-                try:
-                    if self.path_retriever:
-                        char_paths = self.path_retriever.get_character_context_paths(char_name, 'all')
-                        character_contexts.append({
-                            'character': char_name,
-                            'arc_summary': self._summarize_character_arc(char_paths[:5]),
-                            'relationship_count': len([p for p in char_paths if 'SPEAKS_TO' in str(p)]),
-                            'event_count': len([p for p in char_paths if 'PARTICIPATES_IN' in str(p)])
-                        })
-                    else:
-                        character_contexts.append({
-                            'character': char_name,
-                            'arc_summary': f"Character {char_name} appears in the narrative",
-                            'relationship_count': 0,
-                            'event_count': 0
-                        })
-                except Exception as e:
-                    logger.warning(f"Character context analysis failed for {char_name}: {e}")
-            
-            if character_contexts:
-                analysis['character_contexts'] = character_contexts
-            
-            # Step 6: Add writing insights based on context
+            if outputs.get('character_context'):
+                analysis['character_contexts'] = outputs['character_context']
+
+            # Add writing insights based on context
             analysis['writing_insights'] = self._generate_writing_insights(
                 highlighted_text, semantic_results, entities, paths
             )
             
-            return analysis
+            yield 'summary', analysis
             
         except Exception as e:
             logger.error(f"Contextual feedback failed: {e}")
             # Return graceful fallback instead of error
-            return {
+            yield 'summary', {
                 'highlighted_text': highlighted_text,
                 'semantic_context': [],
                 'entities_mentioned': [],
@@ -352,78 +672,204 @@ class HybridIndexer:
                 'status': 'analysis_unavailable',
                 'error_note': 'Contextual analysis temporarily unavailable'
             }
+        finally:
+            # Consumer stopped early (or the request was cancelled): stop the rest
+            for task in tasks.values():
+                task.cancel()
+
+    def _feedback_stage_event(self, name: str, output: Any, stage: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Stream event for a finished contextual feedback stage"""
+        if name == 'semantic_search':
+            semantic_results = output[0] if output else []
+            return 'semantic_context', {
+                'semantic_context': [
+                    {'text': r['text'], 'relevance_score': r['score']} for r in semantic_results[:3]
+                ],
+                'stage': stage
+            }
+        if name == 'entity_extraction':
+            return 'entities', {'entities_mentioned': self._format_entities(output or {}), 'stage': stage}
+        if name == 'path_retrieval':
+            return 'narrative_paths', {'narrative_paths': self._format_paths(output or []), 'stage': stage}
+        return 'character_contexts', {'character_contexts': output or [], 'stage': stage}
+    
+    def _search_feedback_context(self, highlighted_text: str, doc_id: Optional[str],
+                                 user_id: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """
+        Vector search for contextual feedback (blocking; run in a thread)
+
+        The document-scoped and user-wide searches share one embedding batch;
+        the user-wide results also seed path retrieval.
+
+        Returns:
+            (top semantic results, path seed results or None)
+        """
+        user_filter = {'user_id': user_id} if user_id is not None else None
+        try:
+            scoped_results, path_seed_results = self.vector_store.search_many(
+                [highlighted_text, highlighted_text],
+                n_results=10,
+                filters=[{'doc_id': doc_id} if doc_id else user_filter, user_filter]
+            )
+            return scoped_results[:5], path_seed_results
+        except Exception as e:
+            logger.warning(f"Vector search failed: {e}")
+            # Try without the document filter if it fails
+            path_seed_results = self.vector_store.search(highlighted_text, n_results=10, filter_dict=user_filter)
+            return path_seed_results[:5], path_seed_results
+
+    def _character_contexts(self, path_retriever: PathRetriever, char_names: List[str]) -> List[Dict[str, Any]]:
+        """Arc summaries for characters from their graph paths (blocking; run in a thread)"""
+        character_contexts = []
+        for char_name in char_names:
+            try:
+                char_paths = path_retriever.get_character_context_paths(char_name, 'all')
+                character_contexts.append({
+                    'character': char_name,
+                    'arc_summary': self._summarize_character_arc(char_paths[:5]),
+                    'relationship_count': len([p for p in char_paths if 'SPEAKS_TO' in str(p)]),
+                    'event_count': len([p for p in char_paths if 'PARTICIPATES_IN' in str(p)])
+                })
+            except Exception as e:
+                logger.warning(f"Character context analysis failed for {char_name}: {e}")
+        return character_contexts
     
     async def check_consistency(self, 
                               statement: str,
                               doc_id: str,
-                              check_type: str = 'all') -> Dict[str, Any]:
+                              check_type: str = 'all',
+                              user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Check consistency of a statement against the knowledge base
         
+        One lookup pass over the user's fact index (built at indexing time)
+        finds the known entities the statement mentions and compares what it
+        asserts with their facts: clear contradictions (dead vs alive) are
+        conflicts outright, repeated facts are confirmations, and facts the
+        lookup cannot decide are verified by Gemini in one batched call.
+        Results are cached on the index until one of the user's documents
+        changes.
+
         Args:
             statement: Statement to verify
             doc_id: Current document ID
             check_type: Type of check ('character', 'plot', 'setting', 'all')
+            user_id: Owner whose knowledge graph is checked
             
         Returns:
             Consistency analysis with potential conflicts
         """
-        if not self.path_retriever:
+        user_graph = await self._get_user_graph(user_id)
+        if not user_graph:
             return {
                 'error': 'No documents indexed yet'
             }
         
-        # Extract entities from statement
-        entities = await self._extract_entities_from_text(statement)
-        
-        conflicts = []
-        confirmations = []
-        
-        # Check different aspects based on check_type
-        if check_type in ['character', 'all']:
-            char_conflicts = await self._check_character_consistency(entities, statement)
-            conflicts.extend(char_conflicts)
-        
-        if check_type in ['plot', 'all']:
-            plot_conflicts = await self._check_plot_consistency(entities, statement)
-            conflicts.extend(plot_conflicts)
-        
-        if check_type in ['setting', 'all']:
-            setting_conflicts = await self._check_setting_consistency(entities, statement)
-            conflicts.extend(setting_conflicts)
-        
-        # Find supporting evidence
-        supporting_paths = self.path_retriever.retrieve_paths(statement, top_k=3)
-        for path in supporting_paths:
-            if path['score'] > 0.7:  # High confidence
-                confirmations.append({
-                    'type': 'supporting_evidence',
-                    'narrative': path['narrative'],
-                    'confidence': path['score']
-                })
+        fact_index = user_graph.facts
+        cached = fact_index.cached_result(statement, check_type)
+        if cached is not None:
+            return {**cached, 'cached': True}
+        version = fact_index.version
+
+        lookup = await asyncio.to_thread(user_graph.read, fact_index.lookup, statement, check_type)
+        conflicts = lookup.conflicts
+        confirmations = lookup.confirmations
+
+        # Facts the lookup could not decide: one batched verification call
+        unverified = []
+        to_verify = []
+        for entity, fact in lookup.ambiguous[:CONSISTENCY_VERIFY_MAX_FACTS]:
+            verdict = fact_index.verdict(statement, fact)
+            if verdict is None:
+                to_verify.append((entity, fact))
+            else:
+                self._apply_fact_verdict(verdict, entity, fact, conflicts, confirmations)
+        if to_verify:
+            verdicts = await self._verify_facts(statement, to_verify)
+            for (entity, fact), verdict in zip(to_verify, verdicts):
+                if verdict is None:
+                    unverified.append(fact_to_dict(entity, fact))
+                    continue
+                fact_index.remember_verdict(statement, fact, verdict, version)
+                self._apply_fact_verdict(verdict, entity, fact, conflicts, confirmations)
         
-        return {
+        result = {
             'statement': statement,
             'is_consistent': len(conflicts) == 0,
             'conflicts': conflicts,
             'confirmations': confirmations,
+            'entities_checked': lookup.mentioned,
+            'unverified': unverified,
             'recommendation': self._generate_consistency_recommendation(conflicts, confirmations)
         }
+        if not unverified:
+            fact_index.remember_result(statement, check_type, result, version)
+        return result
+
+    async def _verify_facts(self, statement: str, facts: List[Tuple[str, Fact]]) -> List[Optional[str]]:
+        """
+        Ask Gemini whether the statement contradicts each fact, in one call
+
+        Returns 'consistent', 'conflict' or 'unrelated' per fact, or None where
+        no verdict could be obtained (Gemini unavailable, timeout, unparsable).
+        """
+        import re
+        listing = "\n".join(
+            f"{i + 1}. {entity} {fact.predicate.lower().replace('_', ' ')} {fact.value}"
+            + (f' (source: "{fact.snippet}")' if fact.snippet else '')
+            for i, (entity, fact) in enumerate(facts)
+        )
+        prompt = f"""Statement: "{statement}"
+
+Facts established earlier in the story:
+{listing}
+
+For each fact, does the statement contradict it? Answer one line per fact as "<number>: CONSISTENT", "<number>: CONFLICT" or "<number>: UNRELATED".
+
+Answer:"""
+        try:
+            response = await asyncio.wait_for(self.gemini_service.generate_text(prompt),
+                                              timeout=CONSISTENCY_VERIFY_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"⚠️ Fact verification skipped: {e}")
+            return [None] * len(facts)
+
+        verdicts: List[Optional[str]] = [None] * len(facts)
+        for number, verdict in re.findall(r'(\d+)\s*[:.)-]\s*(CONSISTENT|CONFLICT|UNRELATED)', response or '', re.IGNORECASE):
+            index = int(number) - 1
+            if 0 <= index < len(facts):
+                verdicts[index] = verdict.lower()
+        return verdicts
+
+    def _apply_fact_verdict(self, verdict: str, entity: str, fact: Fact,
+                            conflicts: List[Dict], confirmations: List[Dict]):
+        if verdict == 'conflict':
+            conflicts.append(conflict_from_verdict(entity, fact))
+        elif verdict == 'consistent':
+            confirmations.append({
+                'type': 'supporting_evidence',
+                'narrative': fact.snippet,
+                'confidence': fact.confidence,
+                'fact': fact_to_dict(entity, fact)
+            })
     
     async def get_writing_suggestions(self,
                                     context: str,
-                                    suggestion_type: str = 'all') -> Dict[str, Any]:
+                                    suggestion_type: str = 'all',
+                                    user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Get AI-powered writing suggestions based on context
         
         Args:
             context: Current writing context
             suggestion_type: Type of suggestions ('plot', 'character', 'style', 'all')
+            user_id: Owner whose documents and knowledge graph are used
             
         Returns:
             Writing suggestions based on the knowledge base
         """
-        if not self.path_retriever:
+        path_retriever = await self._get_path_retriever(user_id)
+        if not path_retriever:
             return {
                 'error': 'No documents indexed yet'
             }
@@ -434,7 +880,7 @@ class HybridIndexer:
         }
         
         # Get relevant paths for context
-        paths = self.path_retriever.retrieve_paths(context, top_k=5)
+        paths = path_retriever.retrieve_paths(context, top_k=5)
         
         # Extract patterns from paths
         if suggestion_type in ['plot', 'all']:
@@ -454,7 +900,7 @@ class HybridIndexer:
         
         if suggestion_type in ['style', 'all']:
             # Get similar passages for style consistency
-            similar_passages = self.vector_store.search(context, n_results=3)
+            similar_passages = self.vector_store.search(context, n_results=3, filter_dict={'user_id': user_id})
             style_suggestions = self._analyze_style_patterns(similar_passages)
             suggestions['suggestions'].extend(style_suggestions)
         
@@ -466,28 +912,80 @@ class HybridIndexer:
         
         Args:
             query: Search query
-            search_type: 'vector', 'graph', or 'hybrid'
-            filters: Optional filters (doc_id, entity_type, etc.)
+            search_type: 'vector', 'keyword', 'graph', or 'hybrid' (BM25 and vector
+                         rankings fused with reciprocal-rank fusion, plus graph paths)
+            filters: Optional filters (doc_id, entity_type, etc.); graph paths
+                     need a user_id filter, since graphs are per user
             
         Returns:
             Search results
         """
         results = []
         
-        if search_type in ['vector', 'hybrid']:
-            # Vector search
-            vector_results = self.vector_store.search(query, n_results=10, filter_dict=filters)
-            for vr in vector_results:
+        path_retriever = None
+        user_id = (filters or {}).get('user_id')
+        if search_type in ['graph', 'hybrid'] and user_id is not None:
+            try:
+                user_graph = self.graph_store.get(user_id)
+                if user_graph.graph.number_of_nodes():
+                    path_retriever = user_graph.retriever(self.vector_store)
+            except Exception as e:
+                logger.warning(f"Knowledge graph of user {user_id} unavailable: {e}")
+
+        # One batched search serves both the filtered vector results and the
+        # user-wide seeds for path retrieval
+        want_vector = search_type in ['vector', 'hybrid']
+        want_keyword = search_type in ['keyword', 'hybrid']
+        want_paths = path_retriever is not None
+        batch_filters = []
+        if want_vector:
+            batch_filters.append(filters)
+        if want_paths:
+            batch_filters.append({'user_id': user_id})
+        batch_results = self.vector_store.search_many(
+            [query] * len(batch_filters), n_results=10, filters=batch_filters
+        ) if batch_filters else []
+
+        vector_results = batch_results[0] if want_vector else []
+        keyword_results = []
+        if want_keyword:
+            try:
+                keyword_results = self.vector_store.keyword_search(query, n_results=10, filter_dict=filters)
+            except ValueError as e:
+                # Filter on a field the keyword index does not hold; vector results still apply
+                logger.debug(f"Keyword search skipped: {e}")
+
+        if want_vector and want_keyword:
+            # Reciprocal-rank fusion; normalized so a chunk ranked first by both
+            # retrievers scores 1.0 next to the graph path scores
+            chunks = {r['id']: r for r in keyword_results}
+            chunks.update({r['id']: r for r in vector_results})
+            vector_ranks = {r['id']: rank for rank, r in enumerate(vector_results, start=1)}
+            keyword_ranks = {r['id']: rank for rank, r in enumerate(keyword_results, start=1)}
+            fused = reciprocal_rank_fusion([list(vector_ranks), list(keyword_ranks)], k=RRF_K)
+            best_possible = 2.0 / (RRF_K + 1)
+            for chunk_id, fused_score in fused:
+                results.append({
+                    'type': 'text_chunk',
+                    'content': chunks[chunk_id]['text'],
+                    'score': fused_score / best_possible,
+                    'metadata': chunks[chunk_id]['metadata'],
+                    'vector_rank': vector_ranks.get(chunk_id),
+                    'keyword_rank': keyword_ranks.get(chunk_id)
+                })
+        else:
+            # Single retriever: keyword scores are unbounded BM25, so rank-normalize them
+            for rank, vr in enumerate(vector_results or keyword_results, start=1):
                 results.append({
                     'type': 'text_chunk',
                     'content': vr['text'],
-                    'score': vr['score'],
+                    'score': vr['score'] if want_vector else 1.0 / rank,
                     'metadata': vr['metadata']
                 })
         
-        if search_type in ['graph', 'hybrid'] and self.path_retriever:
+        if want_paths:
             # Path-based search
-            paths = self.path_retriever.retrieve_paths(query, top_k=5)
+            paths = path_retriever.retrieve_paths(query, top_k=5, seed_results=batch_results[-1])
             for path in paths:
                 results.append({
                     'type': 'narrative_path',
@@ -502,6 +1000,87 @@ class HybridIndexer:
         
         return results[:10]  # Return top 10
     
+    def save_snapshot(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Write vectors, chunk metadata and document stats to a single snapshot
+        file (see index_snapshot); knowledge graphs persist in the graph store
+
+        Args:
+            path: Snapshot file (defaults to INDEX_SNAPSHOT_PATH)
+
+        Returns:
+            Snapshot summary
+        """
+        path = path or snapshot_path_from_env()
+        if not path:
+            return {'saved': False, 'reason': 'snapshots disabled'}
+
+        start_time = time.time()
+        meta, sections = self.vector_store.export_snapshot()
+        if not meta['chunks']:
+            # Never replace a good snapshot with an empty index (e.g. after a failed restore)
+            return {'saved': False, 'reason': 'index is empty'}
+
+        sections['indexed_documents'] = self.indexed_documents
+        sections['freshness'] = self.reindex_scheduler.export_watermarks()
+        meta['created_at'] = datetime.now().isoformat()
+        write_snapshot(path, sections, meta)
+
+        return {
+            'saved': True,
+            'path': path,
+            'sections': sorted(sections),
+            'chunks': meta['chunks'],
+            'documents': len(self.indexed_documents),
+            'freshness_watermarks': len(sections['freshness']),
+            'seconds': round(time.time() - start_time, 2)
+        }
+
+    def restore_snapshot(self, path: Optional[str] = None, verify: bool = True) -> Dict[str, Any]:
+        """
+        Restore the index from a snapshot instead of re-embedding and re-extracting
+
+        Vectors are only loaded into an empty vector store, so a restore never
+        clobbers newer state. The single shared graph older snapshots carry is
+        not restored: graphs are per user now and load from the graph store.
+
+        Args:
+            path: Snapshot file (defaults to INDEX_SNAPSHOT_PATH)
+            verify: Check section checksums before loading
+
+        Returns:
+            Restore summary
+        """
+        path = path or snapshot_path_from_env()
+        if not path or not os.path.exists(path):
+            return {'restored': False, 'reason': 'no snapshot'}
+
+        start_time = time.time()
+        snapshot = IndexSnapshot(path, verify=verify)
+        chunks = self.vector_store.restore_snapshot(snapshot)
+
+        if 'indexed_documents' in snapshot:
+            for doc_id, doc_info in snapshot.json('indexed_documents').items():
+                if doc_id in self.indexed_documents:
+                    continue
+                if isinstance(doc_info.get('indexed_at'), str):
+                    doc_info['indexed_at'] = datetime.fromisoformat(doc_info['indexed_at'])
+                self.indexed_documents[doc_id] = doc_info
+
+        if 'freshness' in snapshot:
+            self.reindex_scheduler.load_watermarks(snapshot.json('freshness'))
+
+        summary = {
+            'restored': True,
+            'path': path,
+            'snapshot_created_at': snapshot.meta.get('created_at'),
+            'chunks': chunks,
+            'documents': len(self.indexed_documents),
+            'seconds': round(time.time() - start_time, 2)
+        }
+        logger.info(f"✅ Index restored from snapshot: {summary}")
+        return summary
+
     def get_document_stats(self, doc_id: str) -> Dict[str, Any]:
         """Get statistics for an indexed document"""
         if doc_id not in self.indexed_documents:
@@ -509,32 +1088,36 @@ class HybridIndexer:
         
         doc_info = self.indexed_documents[doc_id]
         
-        # Count entities by type in graph
+        # Count entities by type in the owner's graph
         entity_counts = {}
-        for node, data in self.graph_builder.graph.nodes(data=True):
-            if 'mentions' in data:
-                for mention in data['mentions']:
-                    if mention['doc_id'] == doc_id:
-                        entity_type = data.get('type', 'UNKNOWN')
-                        entity_counts[entity_type] = entity_counts.get(entity_type, 0) + 1
-                        break
+        user_id = doc_info['metadata'].get('user_id')
+        user_graph = self.graph_store.peek(user_id) if user_id is not None else None
+        if user_graph is not None:
+            for node in user_graph.nodes_for_documents([doc_id]):
+                if node in user_graph.graph:
+                    entity_type = user_graph.graph.nodes[node].get('type', 'UNKNOWN')
+                    entity_counts[entity_type] = entity_counts.get(entity_type, 0) + 1
         
         return {
             'doc_id': doc_id,
             'metadata': doc_info['metadata'],
-            'chunks': len(doc_info['chunk_ids']),
+            'chunks': len(doc_info.get('chunk_ids', [])),
             'entities': entity_counts,
-            'total_entities': doc_info['entity_count'],
-            'relationships': doc_info['relationship_count'],
-            'indexed_at': doc_info['indexed_at']
+            'total_entities': doc_info.get('entity_count', 0),
+            'relationships': doc_info.get('relationship_count', 0),
+            'indexed_at': doc_info['indexed_at'],
+            'freshness': self.reindex_scheduler.freshness(doc_id)
         }
     
-    def export_knowledge_graph(self, format: str = 'json') -> Any:
-        """Export the knowledge graph"""
-        if not self.graph_builder.graph:
+    async def export_knowledge_graph(self, user_id: int, format: str = 'json') -> Any:
+        """Export a user's knowledge graph"""
+        if format != 'json':
+            return {'error': f"Unsupported format '{format}' (only json)"}
+        user_graph = await asyncio.to_thread(self.graph_store.get, user_id)
+        if user_graph.graph.number_of_nodes() == 0:
             return {'error': 'No graph built yet'}
         
-        return self.graph_builder.export_graph(format)
+        return await asyncio.to_thread(user_graph.to_data)
     
     # Helper methods
     
@@ -704,60 +1287,6 @@ class HybridIndexer:
         
         return f"Character involved in: {', '.join(summary_parts)}"
     
-    async def _check_character_consistency(self, entities: Dict, statement: str) -> List[Dict]:
-        """Check character consistency"""
-        conflicts = []
-        
-        for char_entity in entities.get('CHARACTER', []):
-            char_name = char_entity['text']
-            
-            # Get character's established patterns
-            char_paths = self.path_retriever.get_character_context_paths(char_name, 'all')
-            
-            # Check for contradictions
-            for path in char_paths:
-                # Simple contradiction detection (can be enhanced)
-                if 'dead' in path['narrative'].lower() and 'alive' in statement.lower():
-                    conflicts.append({
-                        'type': 'character_state',
-                        'character': char_name,
-                        'conflict': 'Character previously marked as dead',
-                        'evidence': path['narrative']
-                    })
-        
-        return conflicts
-    
-    async def _check_plot_consistency(self, entities: Dict, statement: str) -> List[Dict]:
-        """Check plot consistency"""
-        conflicts = []
-        
-        # Get event patterns
-        event_paths = self.path_retriever.retrieve_paths(statement, top_k=5)
-        
-        # Check for causal inconsistencies
-        for path in event_paths:
-            if path['score'] > 0.6:
-                # Check if events follow logical order
-                for rel in path['relationships']:
-                    if rel['type'] == 'CAUSES':
-                        # Verify causality makes sense
-                        pass  # Implement specific checks
-        
-        return conflicts
-    
-    async def _check_setting_consistency(self, entities: Dict, statement: str) -> List[Dict]:
-        """Check setting/location consistency"""
-        conflicts = []
-        
-        for loc_entity in entities.get('LOCATION', []):
-            loc_name = loc_entity['text']
-            
-            # Check if characters can be in this location
-            # based on their previous movements
-            # This is simplified - real implementation would be more sophisticated
-            
-        return conflicts
-    
     def _generate_consistency_recommendation(self, conflicts: List[Dict], confirmations: List[Dict]) -> str:
         """Generate recommendation based on consistency check"""
         if not conflicts:
@@ -816,6 +1345,8 @@ class HybridIndexer:
         """
         ENHANCED: Retrieve relevant context using vector search + LLM semantic matching as fallback.
         
+        Retrieval tiers share one FOLDER_CONTEXT_DEADLINE budget; see _execute_folder_search.
+
         Args:
             user_id: The user ID to get documents for
             query: The current user query to find relevant context
@@ -828,13 +1359,25 @@ class HybridIndexer:
             logger.info(f"📁 ========== INTELLIGENT FOLDER SCOPE SEARCH ==========")
             logger.info(f"📁 User: {user_id} | Query: '{query}' | Max docs: {max_documents}")
             
-            # OPTIMIZED FIX: Reduced timeout to match frontend (2 minutes instead of 4 minutes)
+            # Same question over unchanged documents: reuse the last answer
+            if self.context_cache is not None:
+                cached = self.context_cache.get(user_id, query, max_documents)
+                if cached is not None:
+                    logger.info(f"📁 Folder context cache hit ({len(cached)} characters)")
+                    return cached
+                version = self.context_cache.version(user_id)
+
+            # One budget for every tier (matches the frontend's 2 minute timeout)
+            budget = DeadlineBudget(FOLDER_CONTEXT_DEADLINE)
             context_string = await asyncio.wait_for(
-                self._execute_folder_search(user_id, query, max_documents),
-                timeout=120  # 2 minutes timeout (was 240 seconds)
+                self._execute_folder_search(user_id, query, max_documents, budget),
+                timeout=FOLDER_CONTEXT_DEADLINE
             )
             
             if context_string:
+                # Empty results are not cached: they may come from a failed search
+                if self.context_cache is not None:
+                    self.context_cache.put(user_id, query, max_documents, context_string, version)
                 logger.info(f"📁 Total context characters: {len(context_string)}")
                 logger.info(f"📁 ========== INTELLIGENT FOLDER SCOPE SEARCH COMPLETE ==========")
                 return context_string
@@ -843,161 +1386,257 @@ class HybridIndexer:
                 logger.info(f"📁 ========== INTELLIGENT FOLDER SCOPE SEARCH COMPLETE ==========")
                 return None
         except asyncio.TimeoutError:
-            logger.error(f"❌ FolderScope context retrieval timed out after 120 seconds for user {user_id}, query '{query}'")
+            logger.error(f"❌ FolderScope context retrieval timed out after {FOLDER_CONTEXT_DEADLINE} seconds for user {user_id}, query '{query}'")
             return None
         except Exception as e:
             logger.error(f"❌ Error in get_folder_context: {e}", exc_info=True)
             return None
 
-    async def _execute_folder_search(self, user_id: int, query: str, max_documents: int) -> Optional[str]:
-        """Internal method to execute the actual folder search logic"""
+    async def _execute_folder_search(self, user_id: int, query: str, max_documents: int,
+                                     budget: DeadlineBudget) -> Optional[str]:
+        """
+        Run the folder retrieval tiers against one deadline budget
+
+        The local tiers start at once and race: embedding ranking wins as
+        soon as it returns context; keyword search (BM25, then a title/content
+        scan) wins once the embedding tier came back empty. Only when both
+        are weak (empty, failed or out of time) is Gemini document selection
+        launched, with what is left of the budget. Tiers that lose are
+        cancelled; every run is recorded in self.folder_tier_stats.
+        """
+        # Keep the vector index covering the user's documents (throttled,
+        # runs in the background through the reindex scheduler)
+        self._schedule_folder_indexing(user_id)
+
+        async def embedding_tier():
+            # Rank all indexed documents by embedding (milliseconds, no LLM)
+            if not await asyncio.to_thread(self.vector_store.has_documents, user_id):
+                return None
+            return await self._get_embedding_ranked_context(user_id, query, max_documents)
+
+        # Local tiers, in order of preference
+        tasks = {
+            'embedding': asyncio.create_task(self._run_folder_tier('embedding', embedding_tier(), budget)),
+            'keyword': asyncio.create_task(self._run_folder_tier(
+                'keyword', self._get_enhanced_keyword_context(user_id, query, max_documents), budget
+            ))
+        }
+        results: Dict[str, Optional[str]] = {}
+        winner = None
         try:
-            # PERFORMANCE FIX: Skip slow document indexing, go straight to search methods
-            logger.info(f"📁 PERFORMANCE MODE: Skipping document indexing to prevent timeout")
-            
-            # STEP 1: Try LLM semantic search first (fastest for most queries)
-            logger.info(f"📁 STEP 1: LLM semantic search with Gemini Flash (FAST)...")
-            llm_context = await asyncio.wait_for(
-                self._get_llm_semantic_context(user_id, query, max_documents),
-                timeout=60.0  # 1 minute timeout for LLM search
-            )
-            if llm_context:
-                logger.info(f"📁 ✅ LLM semantic search found context: {len(llm_context)} chars")
-                return llm_context
-            else:
-                logger.info(f"📁 ⚠️ LLM semantic search returned no results")
-            
-            # STEP 2: Enhanced keyword search (fallback)
-            logger.info(f"📁 STEP 2: Enhanced keyword search (FALLBACK)...")
-            keyword_context = await asyncio.wait_for(
-                self._get_enhanced_keyword_context(user_id, query, max_documents),
-                timeout=45.0  # 45 second timeout for keyword search
+            pending = set(tasks.values())
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for name, task in tasks.items():
+                    if task in done:
+                        results[name] = task.result()
+                # The best finished tier wins once every tier preferred over it is known to be empty
+                for name in tasks:
+                    if name not in results:
+                        break
+                    if results[name]:
+                        winner = name
+                        break
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        if winner is None and not budget.expired:
+            logger.info(f"📁 Local tiers came back empty, LLM semantic search with Gemini Flash...")
+            results['llm'] = await self._run_folder_tier(
+                'llm', self._get_llm_semantic_context(user_id, query, max_documents), budget
             )
-            if keyword_context:
-                logger.info(f"📁 ✅ Enhanced keyword search found context: {len(keyword_context)} chars")
-                return keyword_context
-            
-            logger.info(f"📁 ❌ No relevant context found")
+            if results['llm']:
+                winner = 'llm'
+
+        self.folder_tier_stats.record_win(winner)
+        if winner is None:
+            logger.info(f"📁 ❌ No relevant context found ({budget.elapsed_ms()}ms)")
             return None
-            
+        logger.info(f"📁 ✅ {winner} tier found context: {len(results[winner])} chars ({budget.elapsed_ms()}ms)")
+        return results[winner]
+
+    async def _run_folder_tier(self, tier: str, coro, budget: DeadlineBudget) -> Optional[str]:
+        """Run one retrieval tier within its share of the budget; failures count as no result"""
+        started = time.monotonic()
+        outcome = 'empty'
+        try:
+            result = await asyncio.wait_for(coro, timeout=budget.timeout(FOLDER_TIER_TIMEOUTS.get(tier)))
+            if result:
+                outcome = 'hit'
+            return result
         except asyncio.TimeoutError:
-            logger.error(f"❌ Internal folder search timed out for user {user_id}, query '{query}'")
+            outcome = 'timeout'
+            logger.warning(f"⚠️ Folder retrieval tier {tier} timed out")
             return None
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
         except Exception as e:
-            logger.error(f"❌ Error in _execute_folder_search: {e}", exc_info=True)
+            outcome = 'failed'
+            logger.error(f"❌ Folder retrieval tier {tier} failed: {e}", exc_info=True)
             return None
+        finally:
+            self.folder_tier_stats.record(tier, outcome, time.monotonic() - started)
+
+    def _schedule_folder_indexing(self, user_id: int):
+        """Check the user's documents against the index at most every FOLDER_INDEX_CHECK_SECONDS"""
+        now = time.monotonic()
+        if now - self._folder_index_checked.get(user_id, float('-inf')) < FOLDER_INDEX_CHECK_SECONDS:
+            return
+        self._folder_index_checked[user_id] = now
+        task = asyncio.create_task(self._ensure_user_documents_indexed(user_id))
+        # Keep a reference so the task is not garbage collected mid-run
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
 
     async def _ensure_user_documents_indexed(self, user_id: int):
-        """Ensure user's documents are indexed in the vector store"""
+        """Queue re-indexing of the user's documents that are missing from the index or stale"""
         try:
             # Import database service
             from services.database import get_db_service
             db_service = get_db_service()
             
-            # Get user's documents
-            query_sql = """
-            SELECT id, title, content, updated_at 
-            FROM documents 
-            WHERE user_id = %s 
-            AND content IS NOT NULL 
-            AND LENGTH(TRIM(content)) > 100
-            ORDER BY updated_at DESC
-            """
-            
-            documents = db_service.execute_query(query_sql, (user_id,), fetch='all')
-            
+            # Timestamps only; content is loaded for the documents that need it
+            documents = await asyncio.to_thread(
+                db_service.execute_query,
+                """
+                SELECT id, title, folder_id, updated_at
+                FROM documents
+                WHERE user_id = %s
+                AND content IS NOT NULL
+                AND LENGTH(TRIM(content)) > 50
+                """,
+                (user_id,),
+                'all'
+            )
             if not documents:
-                logger.info(f"📁 No documents found for user {user_id} to index")
                 return
             
-            # Check which documents need indexing
+            await asyncio.to_thread(self.vector_store.has_documents, user_id)
+            needed = {}
             for doc in documents:
-                doc_id = str(doc[0])
-                title = doc[1]
-                content = doc[2]
-                
-                # Quick check if document is already indexed
-                try:
-                    results = self.vector_store.search(
-                        query=f"document_id:{doc_id}",
-                        n_results=1,
-                        filter_dict={"doc_id": doc_id}
-                    )
-                    
-                    if not results:
-                        # Document not indexed, add it
-                        logger.info(f"📁 Indexing document: {title} ({doc_id})")
-                        self.vector_store.add_document(
-                            text=content,
-                            doc_id=doc_id,
-                            metadata={
-                                "title": title,
-                                "user_id": user_id,
-                                "updated_at": doc[3].isoformat() if doc[3] else None
-                            }
-                        )
-                except Exception as index_error:
-                    logger.warning(f"⚠️ Failed to index document {doc_id}: {index_error}")
+                doc_id = str(doc['id'])
+                freshness = self.reindex_scheduler.freshness(doc_id, doc['updated_at'])
+                if doc_id not in self.vector_store.document_index or freshness['state'] == 'stale':
+                    needed[doc_id] = doc
+            if not needed:
+                return
+
+            logger.info(f"📁 Indexing {len(needed)} of {len(documents)} documents for user {user_id}")
+            rows = await asyncio.to_thread(
+                db_service.execute_query,
+                "SELECT id, content FROM documents WHERE user_id = %s AND id::text = ANY(%s)",
+                (user_id, list(needed)),
+                'all'
+            )
+            for row in rows or []:
+                doc = needed[str(row['id'])]
+                metadata = {'title': doc['title'], 'user_id': user_id, 'folder_id': doc['folder_id']}
+                self.reindex_scheduler.notify_saved(
+                    str(row['id']),
+                    row['content'],
+                    {key: value for key, value in metadata.items() if value is not None},
+                    doc['updated_at']
+                )
                     
         except Exception as e:
             logger.warning(f"⚠️ Failed to ensure document indexing: {e}")
 
-    async def _get_vector_context_fixed(self, user_id: int, query: str, max_documents: int) -> Optional[str]:
-        """Fixed vector store search using correct API"""
+    async def _get_embedding_ranked_context(self, user_id: int, query: str, max_documents: int) -> Optional[str]:
+        """
+        Local folder retrieval over every indexed document of the user
+
+        Documents are ranked by their document-level embedding, then each
+        candidate's best-matching chunks are found with a chunk search scoped
+        to the candidates. The final score blends both; excerpts come from the
+        best chunks. Gemini is only called when FOLDER_CONTEXT_RERANK=llm.
+        """
         try:
-            # Use the correct search method with user filter
-            results = self.vector_store.search(
-                query=query,
-                n_results=max_documents * 3,  # Get more results to filter
-                filter_dict={"user_id": user_id}
+            start_time = time.perf_counter()
+            await self.embedding_worker.start()
+            candidates = await asyncio.to_thread(
+                self.vector_store.rank_documents, query, user_id, max_documents * 3
             )
-            
-            if not results:
-                logger.info("📁 Vector search returned no results")
+            if not candidates:
                 return None
             
-            # Group by document and get best excerpts
-            doc_contexts = {}
-            for result in results:
-                if result['score'] < 0.3:  # Skip low-relevance results
+            doc_ids = [candidate['doc_id'] for candidate in candidates]
+            chunk_hits = await asyncio.to_thread(
+                self.vector_store.search,
+                query,
+                max_documents * 6,
+                {'$and': [{'user_id': user_id}, {'doc_id': {'$in': doc_ids}}]}
+            )
+            best_chunks: Dict[str, List[Dict[str, Any]]] = {}
+            for hit in chunk_hits:
+                # A hit stands for every candidate draft holding the same chunk
+                # (collapsed duplicates and dedup references included)
+                hit_doc_ids = [hit['metadata'].get('doc_id')]
+                hit_doc_ids += [duplicate['doc_id'] for duplicate in hit.get('duplicates', [])]
+                for hit_doc_id in dict.fromkeys(hit_doc_ids):
+                    hits = best_chunks.setdefault(hit_doc_id, [])
+                    if len(hits) < 2:  # Max 2 excerpts per doc
+                        hits.append(hit)
+            
+            ranked = []
+            for candidate in candidates:
+                hits = best_chunks.get(candidate['doc_id'], [])
+                if not hits:
                     continue
-                    
-                metadata = result['metadata']
-                doc_id = metadata.get('doc_id')
-                title = metadata.get('title', f'Document {doc_id}')
-                
-                if doc_id not in doc_contexts:
-                    doc_contexts[doc_id] = {
-                        'title': title,
-                        'excerpts': [],
-                        'max_score': result['score']
-                    }
-                
-                if len(doc_contexts[doc_id]['excerpts']) < 2:  # Max 2 excerpts per doc
-                    doc_contexts[doc_id]['excerpts'].append({
-                        'text': result['text'][:800],  # Larger excerpts
-                        'score': result['score']
-                    })
-            
-            if not doc_contexts:
-                return None
+                score = 0.5 * candidate['score'] + 0.5 * hits[0]['score']
+                if score >= FOLDER_CONTEXT_MIN_SCORE:
+                    ranked.append((score, candidate, hits))
+            ranked.sort(key=lambda entry: entry[0], reverse=True)
             
-            # Sort documents by relevance and create context
-            sorted_docs = sorted(doc_contexts.items(), 
-                               key=lambda x: x[1]['max_score'], 
-                               reverse=True)[:max_documents]
+            if FOLDER_CONTEXT_RERANK == 'llm' and len(ranked) > 1:
+                ranked = await self._llm_rerank_documents(query, ranked)
             
             context_parts = []
-            for doc_id, doc_data in sorted_docs:
-                excerpts_text = "\n".join([ex['text'] for ex in doc_data['excerpts']])
-                context_parts.append(f"**{doc_data['title']}**:\n{excerpts_text}")
+            for score, candidate, hits in ranked[:max_documents]:
+                title = candidate.get('title') or hits[0]['metadata'].get('title') or f"Document {candidate['doc_id']}"
+                excerpts_text = "\n".join(self._extract_smart_excerpt(hit['text'], query, max_length=600) for hit in hits)
+                context_parts.append(f"**{title}**:\n{excerpts_text}")
             
-            return "\n\n---\n\n".join(context_parts)
+            logger.info(f"📁 Ranked {len(candidates)} documents, kept {len(context_parts)} "
+                        f"in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+            return "\n\n---\n\n".join(context_parts) if context_parts else None
             
         except Exception as e:
-            logger.warning(f"⚠️ Vector search failed: {e}")
+            logger.warning(f"⚠️ Embedding-ranked folder search failed: {e}")
             return None
 
+    async def _llm_rerank_documents(self, query: str, ranked: List[Tuple[float, Dict, List[Dict]]]
+                                    ) -> List[Tuple[float, Dict, List[Dict]]]:
+        """Optional Gemini re-rank of locally ranked documents; keeps the local order on any failure"""
+        import re
+        listing = "\n".join(
+            f"{i + 1}. {candidate.get('title') or candidate['doc_id']}: {hits[0]['text'][:200]}..."
+            for i, (_, candidate, hits) in enumerate(ranked)
+        )
+        prompt = f"""Query: "{query}"
+
+Order these documents from most to least relevant. Return only the document numbers (e.g. 3,1,2).
+
+{listing}
+
+Answer:"""
+        try:
+            response = await asyncio.wait_for(self.gemini_service.generate_text(prompt),
+                                              timeout=FOLDER_CONTEXT_RERANK_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM re-rank skipped: {e}")
+            return ranked
+
+        order = []
+        for number in re.findall(r'\d+', response or ''):
+            index = int(number) - 1
+            if 0 <= index < len(ranked) and index not in order:
+                order.append(index)
+        # Documents the model left out keep their local order after the ones it ranked
+        order.extend(index for index in range(len(ranked)) if index not in order)
+        return [ranked[index] for index in order]
+
     async def _get_llm_semantic_context(self, user_id: int, query: str, max_documents: int) -> Optional[str]:
         """OPTIMIZED: Use faster Gemini Flash model for semantic document selection"""
         try:
@@ -1024,8 +1663,8 @@ class HybridIndexer:
             logger.info(f"📁 LLM STEP 3a: Query: \n{query_sql}")
             logger.info(f"📁 LLM STEP 3b: Params: {(user_id,)}")
 
-            # CRITICAL FIX: Use correct synchronous database service method
-            documents = db_service.execute_query(query_sql, (user_id,), fetch='all')
+            # Synchronous database service method, run in a worker thread so the tiers can race
+            documents = await asyncio.to_thread(db_service.execute_query, query_sql, (user_id,), 'all')
             
             logger.info(f"📁 LLM STEP 4: Database query executed successfully")
             logger.info(f"📁 LLM STEP 4a: Found {len(documents) if documents else 0} documents")
@@ -1165,48 +1804,19 @@ Answer:"""
             return None
 
     def _extract_smart_excerpt(self, content: str, query: str, max_length: int = 1000) -> str:
-        """Extract the most relevant excerpt from content based on query"""
+        """
+        Extract the most relevant excerpt from content based on query
+
+        Sentences are scored by query words (and meaning, if sentence vectors
+        are enabled) over the text's precomputed sentence index; see
+        SentenceIndex.excerpt for the selection rules.
+        """
         try:
-            # Split into sentences
-            sentences = [s.strip() for s in content.replace('\n', ' ').split('.') if s.strip()]
-            
-            if len(sentences) <= 3:
-                return content[:max_length]
-            
-            # Simple scoring: more query words = higher score
-            query_words = set(query.lower().split())
-            
-            sentence_scores = []
-            for i, sentence in enumerate(sentences):
-                words = set(sentence.lower().split())
-                score = len(query_words.intersection(words))
-                # Boost score for sentences in the middle (often contain more context)
-                if len(sentences) > 5 and len(sentences) * 0.2 < i < len(sentences) * 0.8:
-                    score += 1
-                sentence_scores.append((score, i, sentence))
-            
-            # Sort by score and get top sentences
-            sentence_scores.sort(key=lambda x: x[0], reverse=True)
-            
-            # Take top scoring sentences and some context
-            selected_indices = set()
-            for score, idx, _ in sentence_scores[:3]:  # Top 3 sentences
-                if score > 0:  # Only if there's some relevance
-                    # Add context sentences around the selected one
-                    for i in range(max(0, idx-1), min(len(sentences), idx+2)):
-                        selected_indices.add(i)
-            
-            if not selected_indices:
-                # Fallback: take first part of document
-                return content[:max_length]
-            
-            # Create excerpt from selected sentences
-            selected_indices = sorted(selected_indices)
-            excerpt_sentences = [sentences[i] for i in selected_indices]
-            excerpt = '. '.join(excerpt_sentences) + '.'
-            
-            return excerpt[:max_length] + "..." if len(excerpt) > max_length else excerpt
-            
+            index = self.sentence_index.get(content)
+            query_vector = None
+            if index.vectors is not None:
+                query_vector = self.vector_store._encode([query])[0]
+            return index.excerpt(content, query, max_length, query_vector)
         except Exception as e:
             logger.warning(f"⚠️ Smart excerpt extraction failed: {e}")
             return content[:max_length]
@@ -1224,6 +1834,13 @@ Answer:"""
             
             logger.info(f"📁 KEYWORD STEP 2: Database service obtained successfully")
             
+            # Indexed chunks answer exact-term queries (names, invented words) from the
+            # in-process BM25 index; the ILIKE table scan below is only the fallback
+            bm25_context = await self._get_bm25_keyword_context(user_id, query, max_documents)
+            if bm25_context:
+                logger.info(f"📁 KEYWORD STEP 2a: ✅ Served from BM25 index (length: {len(bm25_context)})")
+                return bm25_context
+
             # Expand query with synonyms and related terms
             logger.info(f"📁 KEYWORD STEP 3: Expanding query terms")
             expanded_query_terms = self._expand_query_terms(query)
@@ -1250,11 +1867,12 @@ Answer:"""
             logger.info(f"📁 KEYWORD STEP 5a: Query: \n{query_sql}")
             logger.info(f"📁 KEYWORD STEP 5b: Params: {(user_id, f'%{query}%', f'%{query}%', max_documents)}")
 
-            # CRITICAL FIX: Use correct synchronous database service method
-            documents = db_service.execute_query(
+            # Synchronous database service method, run in a worker thread so the tiers can race
+            documents = await asyncio.to_thread(
+                db_service.execute_query,
                 query_sql,
                 (user_id, f'%{query}%', f'%{query}%', max_documents),
-                fetch='all'
+                'all'
             )
             
             logger.info(f"📁 KEYWORD STEP 6: Database query executed successfully")
@@ -1306,6 +1924,37 @@ Answer:"""
             logger.error(f"❌ Full traceback: {traceback.format_exc()}")
             return None
 
+    async def _get_bm25_keyword_context(self, user_id: int, query: str, max_documents: int) -> Optional[str]:
+        """Keyword context from the BM25 chunk index, grouped by document"""
+        try:
+            results = await asyncio.to_thread(
+                self.vector_store.keyword_search, query, max_documents * 3, {"user_id": user_id}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ BM25 keyword search failed: {e}")
+            return None
+
+        doc_contexts = {}
+        for result in results:
+            metadata = result['metadata']
+            doc_id = metadata.get('doc_id')
+            entry = doc_contexts.setdefault(doc_id, {
+                'title': metadata.get('title', f'Document {doc_id}'),
+                'excerpts': []
+            })
+            if len(entry['excerpts']) < 2:  # Max 2 excerpts per doc
+                entry['excerpts'].append(self._extract_smart_excerpt(result['text'], query, 800))
+
+        if not doc_contexts:
+            return None
+
+        # Results arrive best first, so dict order is already document relevance order
+        context_parts = [
+            f"**{doc_data['title']}**:\n" + "\n".join(doc_data['excerpts'])
+            for doc_data in list(doc_contexts.values())[:max_documents]
+        ]
+        return "\n\n---\n\n".join(context_parts)
+
     def _expand_query_terms(self, query: str) -> List[str]:
         """Expand query with related terms for better matching"""
         query_lower = query.lower()
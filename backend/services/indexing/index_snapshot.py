@@ -0,0 +1,188 @@
+"""
+Index snapshots - single-file save/restore of the vector index
+Lets an instance on ephemeral storage come back with its index in seconds
+instead of re-embedding every document (knowledge graphs live in the graph store).
+"""
+
+from typing import Dict, Any, Optional, Union
+import os
+import json
+import struct
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"DWINDEX\x00"
+SNAPSHOT_VERSION = 1
+
+# Sections start on this boundary so array sections can be memory-mapped
+_ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")  # magic, format version, header length
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is missing, corrupt or from an incompatible version"""
+
+
+def write_snapshot(path: str, sections: Dict[str, Union[bytes, np.ndarray, Any]],
+                   meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Write sections to a single snapshot file, atomically
+
+    Layout:
+        preamble   magic, format version, header length
+        header     JSON: meta plus {name: offset, length, sha256, kind, dtype, shape}
+        sections   64-byte aligned; arrays are raw C-order data, everything
+                   else is UTF-8 JSON
+
+    Args:
+        path: Destination file (replaced atomically via a temp file)
+        sections: name -> numpy array, bytes, or JSON-serializable value
+        meta: Free-form metadata stored in the header
+
+    Returns:
+        The header that was written
+    """
+    payloads = {}
+    descriptors = {}
+    for name, value in sections.items():
+        if isinstance(value, np.ndarray):
+            array = np.ascontiguousarray(value)
+            payloads[name] = memoryview(array).cast('B')
+            descriptors[name] = {'kind': 'array', 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        elif isinstance(value, (bytes, bytearray)):
+            payloads[name] = bytes(value)
+            descriptors[name] = {'kind': 'bytes'}
+        else:
+            payloads[name] = json.dumps(value, default=str).encode('utf-8')
+            descriptors[name] = {'kind': 'json'}
+        descriptors[name]['length'] = len(payloads[name])
+        descriptors[name]['sha256'] = hashlib.sha256(payloads[name]).hexdigest()
+
+    # Offsets depend on the header length, which depends on the offsets; the
+    # header is padded to a fixed aligned size so one pass is enough
+    header = {'meta': meta or {}, 'sections': descriptors}
+    header_size = _align(_PREAMBLE.size + len(json.dumps(header).encode('utf-8')) + 32 * len(sections) + 64)
+    offset = header_size
+    for name in payloads:
+        descriptors[name]['offset'] = offset
+        offset = _align(offset + descriptors[name]['length'])
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    if _PREAMBLE.size + len(header_bytes) > header_size:
+        raise SnapshotError("Snapshot header overflow")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, payload in payloads.items():
+            f.seek(descriptors[name]['offset'])
+            f.write(payload)
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    logger.info(f"💾 Snapshot written to {path} ({offset / 1e6:.1f} MB, {len(sections)} sections)")
+    return header
+
+
+class IndexSnapshot:
+    """
+    Read-only view of a snapshot file
+
+    Array sections come back as read-only memory maps, so opening a large
+    snapshot costs nothing until rows are actually read.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        if not os.path.exists(path):
+            raise SnapshotError(f"No snapshot at {path}")
+        self.path = path
+
+        with open(path, 'rb') as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise SnapshotError("Truncated snapshot")
+            magic, version, header_length = _PREAMBLE.unpack(preamble)
+            if magic != SNAPSHOT_MAGIC:
+                raise SnapshotError("Not an index snapshot")
+            if version != SNAPSHOT_VERSION:
+                raise SnapshotError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+            try:
+                header = json.loads(f.read(header_length).decode('utf-8'))
+            except ValueError as e:
+                raise SnapshotError(f"Corrupt snapshot header: {e}")
+
+        self.meta: Dict[str, Any] = header['meta']
+        self.sections: Dict[str, Dict[str, Any]] = header['sections']
+        self.size = os.path.getsize(path)
+        for name, descriptor in self.sections.items():
+            if descriptor['offset'] + descriptor['length'] > self.size:
+                raise SnapshotError(f"Truncated snapshot: section '{name}' runs past end of file")
+
+        if verify:
+            self.verify()
+
+    def verify(self):
+        """Check every section against its SHA-256"""
+        with open(self.path, 'rb') as f:
+            for name, descriptor in self.sections.items():
+                f.seek(descriptor['offset'])
+                digest = hashlib.sha256()
+                remaining = descriptor['length']
+                while remaining:
+                    block = f.read(min(remaining, 1 << 20))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+                if digest.hexdigest() != descriptor['sha256']:
+                    raise SnapshotError(f"Checksum mismatch in section '{name}'")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def array(self, name: str) -> np.ndarray:
+        """Memory-mapped, read-only array section"""
+        descriptor = self._descriptor(name, 'array')
+        shape = tuple(descriptor['shape'])
+        if not descriptor['length']:
+            return np.zeros(shape, dtype=np.dtype(descriptor['dtype']))
+        return np.memmap(self.path, dtype=np.dtype(descriptor['dtype']), mode='r',
+                         offset=descriptor['offset'], shape=shape)
+
+    def json(self, name: str) -> Any:
+        return json.loads(self.bytes(name, 'json').decode('utf-8'))
+
+    def bytes(self, name: str, kind: str = 'bytes') -> bytes:
+        descriptor = self._descriptor(name, kind)
+        with open(self.path, 'rb') as f:
+            f.seek(descriptor['offset'])
+            return f.read(descriptor['length'])
+
+    def _descriptor(self, name: str, kind: str) -> Dict[str, Any]:
+        descriptor = self.sections.get(name)
+        if descriptor is None:
+            raise SnapshotError(f"Snapshot has no section '{name}'")
+        if descriptor['kind'] != kind:
+            raise SnapshotError(f"Section '{name}' is {descriptor['kind']}, not {kind}")
+        return descriptor
+
+
+def _align(value: int) -> int:
+    return (value + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def snapshot_path_from_env() -> Optional[str]:
+    """
+    INDEX_SNAPSHOT_PATH: snapshot file location ('' disables snapshots)
+
+    On Railway point this at a mounted volume; /tmp does not survive a redeploy.
+    """
+    return os.environ.get('INDEX_SNAPSHOT_PATH', './index_snapshots/index.snap') or None
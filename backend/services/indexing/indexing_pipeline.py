@@ -0,0 +1,253 @@
+"""
+Folder indexing pipeline - chunk, embed, extract and merge as concurrent stages
+Documents flow through bounded queues, so a book's chapters overlap instead of
+waiting on each other's LLM calls, and one failing chapter never stops the batch.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+import os
+import time
+import uuid
+import asyncio
+import logging
+
+from .fact_index import extract_facts
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('chunk', 'embed', 'extract', 'merge')
+
+# Finished jobs kept for progress lookups
+MAX_TRACKED_JOBS = 50
+
+
+class PipelineProgress:
+    """
+    Live progress of one folder indexing run
+
+    Each document moves through STAGES; `stages` counts documents that
+    completed each one, `failed` lists the documents that dropped out and why.
+    `documents` maps each document to its current (or last) stage, 'done'
+    or 'failed'.
+    """
+
+    def __init__(self, job_id: str, doc_ids: List[str], owner: Optional[Any] = None):
+        self.job_id = job_id
+        self.owner = owner
+        self.status = 'running'
+        self.total = len(doc_ids)
+        self.stages = {stage: 0 for stage in STAGES}
+        self.documents: Dict[str, str] = {doc_id: 'queued' for doc_id in doc_ids}
+        self.failed: Dict[str, Dict[str, str]] = {}
+        self.extraction_calls = 0
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+
+    def advance(self, doc_id: str, stage: str):
+        self.stages[stage] += 1
+        if stage == STAGES[-1]:
+            self.documents[doc_id] = 'done'
+
+    def fail(self, doc_id: str, stage: str, error: Exception):
+        self.failed[doc_id] = {'stage': stage, 'error': str(error) or type(error).__name__}
+        self.documents[doc_id] = 'failed'
+
+    def finish(self, status: Optional[str] = None):
+        self.status = status or ('completed' if not self.failed else 'completed_with_errors')
+        self.finished_at = datetime.now()
+
+    def to_dict(self) -> Dict[str, Any]:
+        done = self.stages[STAGES[-1]] + len(self.failed)
+        elapsed = ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'total_documents': self.total,
+            'completed': self.stages[STAGES[-1]],
+            'failed': len(self.failed),
+            'percent': round(100 * done / self.total, 1) if self.total else 100.0,
+            'stages': dict(self.stages),
+            'documents': dict(self.documents),
+            'errors': dict(self.failed),
+            'extraction_calls': self.extraction_calls,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'elapsed_seconds': round(elapsed, 2)
+        }
+
+
+class IndexingPipeline:
+    """
+    Staged, bounded-concurrency indexing of many documents
+
+    Stages (each with its own worker count):
+        chunk     split the text (thread pool)
+        embed     sync chunks into the vector store; model calls go through
+                  the shared embedding worker's micro-batches
+        extract   Gemini entity/relationship extraction; concurrency here is
+                  LLM calls in flight across all documents
+        merge     replace the document's entities in its owner's graph
+                  (single worker)
+
+    Stages are connected by queues of `queue_size` documents, so a fast
+    stage blocks instead of piling up chunked manuscripts in memory.
+    """
+
+    def __init__(self, vector_store, graph_builder, graph_store, chunk_concurrency: int = 2,
+                 embed_concurrency: int = 2, extract_concurrency: int = 4, queue_size: int = 4):
+        self.vector_store = vector_store
+        self.graph_builder = graph_builder
+        self.graph_store = graph_store
+        self.concurrency = {
+            'chunk': max(1, chunk_concurrency),
+            'embed': max(1, embed_concurrency),
+            'extract': max(1, extract_concurrency),
+            'merge': 1
+        }
+        self.queue_size = max(1, queue_size)
+
+    async def run(self, documents: List[Tuple[str, str, Dict]],
+                  progress: PipelineProgress) -> List[Dict[str, Any]]:
+        """
+        Index documents through the pipeline
+
+        Args:
+            documents: (doc_id, text, metadata) tuples
+            progress: Progress record updated as documents advance
+
+        Returns:
+            Per-document results for the documents that made it through
+        """
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in STAGES]
+        # Extraction concurrency is per LLM call, shared by every document
+        llm_slots = asyncio.Semaphore(self.concurrency['extract'])
+        results: Dict[str, Dict[str, Any]] = {}
+
+        async def chunk(item):
+            item['chunks'] = await asyncio.to_thread(self.vector_store.chunk_document, item['text'], item['doc_id'])
+            return item
+
+        async def embed(item):
+            item['vector_sync'] = await asyncio.to_thread(
+                self.vector_store.sync_document, item['text'], item['doc_id'], item['metadata'], item['chunks']
+            )
+            item['chunks'] = None
+            return item
+
+        async def extract(item):
+            calls = len(self.graph_builder._split_text(item['text'], 2000))
+            progress.extraction_calls += calls
+            item['entities'], item['relationships'] = await self.graph_builder.extract_document(
+                item['text'], semaphore=llm_slots
+            )
+            return item
+
+        async def merge(item):
+            user_id = item['metadata'].get('user_id')
+            if user_id is not None:
+                # Fact extraction and loading the owner's graph run in threads;
+                # the merge itself stays on the event loop
+                facts = await asyncio.to_thread(
+                    extract_facts, item['doc_id'], item['text'], item['entities'], item['relationships']
+                )
+                await asyncio.to_thread(self.graph_store.get, user_id)
+                self.graph_store.merge_document(user_id, item['doc_id'], item['entities'], item['relationships'], facts)
+            sync = item['vector_sync']
+            results[item['doc_id']] = {
+                'document_id': item['doc_id'],
+                'processing_time': time.time() - item['started'],
+                'chunk_ids': sync['chunk_ids'],
+                'chunks_created': len(sync['chunk_ids']),
+                'chunks_embedded': sync['added'],
+                'chunks_removed': sync['removed'],
+                'entities_extracted': len(item['entities']),
+                'relationships_found': len(item['relationships'])
+            }
+            return None
+
+        handlers = {'chunk': chunk, 'embed': embed, 'extract': extract, 'merge': merge}
+
+        async def worker(stage_index: int):
+            stage = STAGES[stage_index]
+            inbox = queues[stage_index]
+            outbox = queues[stage_index + 1] if stage_index + 1 < len(STAGES) else None
+            while True:
+                item = await inbox.get()
+                try:
+                    if item is None:
+                        return
+                    progress.documents[item['doc_id']] = stage
+                    try:
+                        forwarded = await handlers[stage](item)
+                    except Exception as e:
+                        # Failure isolation: drop this document, keep the batch going
+                        logger.error(f"❌ Indexing {item['doc_id']} failed at {stage}: {e}")
+                        progress.fail(item['doc_id'], stage, e)
+                        continue
+                    progress.advance(item['doc_id'], stage)
+                    if outbox is not None:
+                        await outbox.put(forwarded)
+                finally:
+                    inbox.task_done()
+
+        async def feed():
+            for doc_id, text, metadata in documents:
+                await queues[0].put({'doc_id': doc_id, 'text': text, 'metadata': metadata,
+                                     'started': time.time()})
+
+        workers = [[asyncio.create_task(worker(i)) for _ in range(self.concurrency[stage])]
+                   for i, stage in enumerate(STAGES)]
+        try:
+            await feed()
+            # Drain stage by stage: once a stage's queue is empty, stop its workers
+            for i, stage_workers in enumerate(workers):
+                await queues[i].join()
+                for _ in stage_workers:
+                    await queues[i].put(None)
+                await asyncio.gather(*stage_workers)
+        finally:
+            for task in (task for stage_workers in workers for task in stage_workers):
+                task.cancel()
+
+        return [results[doc_id] for doc_id, _, _ in documents if doc_id in results]
+
+
+class IndexingJobs:
+    """Progress records of recent pipeline runs, newest last"""
+
+    def __init__(self, limit: int = MAX_TRACKED_JOBS):
+        self.limit = limit
+        self._jobs: "OrderedDict[str, PipelineProgress]" = OrderedDict()
+
+    def create(self, doc_ids: List[str], job_id: Optional[str] = None,
+               owner: Optional[Any] = None) -> PipelineProgress:
+        progress = PipelineProgress(job_id or uuid.uuid4().hex, doc_ids, owner)
+        self._jobs[progress.job_id] = progress
+        while len(self._jobs) > self.limit:
+            self._jobs.popitem(last=False)
+        return progress
+
+    def get(self, job_id: str) -> Optional[PipelineProgress]:
+        return self._jobs.get(job_id)
+
+
+def indexing_pipeline_from_env(vector_store, graph_builder, graph_store) -> IndexingPipeline:
+    """
+    Build the folder indexing pipeline from environment configuration
+
+    INDEX_CHUNK_CONCURRENCY: documents chunked at once (default 2)
+    INDEX_EMBED_CONCURRENCY: documents being embedded/stored at once (default 2)
+    INDEX_EXTRACT_CONCURRENCY: Gemini extraction calls in flight (default 4)
+    INDEX_QUEUE_SIZE: documents buffered between stages (default 4)
+    """
+    return IndexingPipeline(
+        vector_store,
+        graph_builder,
+        graph_store,
+        chunk_concurrency=int(os.environ.get('INDEX_CHUNK_CONCURRENCY', 2)),
+        embed_concurrency=int(os.environ.get('INDEX_EMBED_CONCURRENCY', 2)),
+        extract_concurrency=int(os.environ.get('INDEX_EXTRACT_CONCURRENCY', 4)),
+        queue_size=int(os.environ.get('INDEX_QUEUE_SIZE', 4))
+    )
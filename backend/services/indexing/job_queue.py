@@ -0,0 +1,591 @@
+"""
+Indexing job queue - durable background jobs with leases, retries and cancellation
+Indexing requests are stored as rows and picked up by an in-process worker pool,
+so the HTTP request returns at once and a redeploy does not lose queued work.
+"""
+
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+from datetime import datetime, timedelta
+import os
+import json
+import uuid
+import socket
+import random
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# Columns returned to API clients; the payload (full manuscript text) is not echoed
+_PUBLIC_FIELDS = ('id', 'job_type', 'status', 'attempts', 'max_attempts', 'cancel_requested',
+                  'result', 'last_error', 'run_after', 'created_at', 'started_at', 'finished_at')
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (bad payload, missing document)"""
+
+
+def job_to_dict(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Client-facing view of a job row"""
+    view = {}
+    for name in _PUBLIC_FIELDS:
+        value = job.get(name)
+        view[name] = value.isoformat() if isinstance(value, datetime) else value
+    view['id'] = str(view['id'])
+    return view
+
+
+def _valid_job_id(job_id: str) -> bool:
+    try:
+        uuid.UUID(str(job_id))
+        return True
+    except ValueError:
+        return False
+
+
+class PostgresJobStore:
+    """
+    Jobs in the indexing_jobs table (database/migrations/003_indexing_jobs.sql)
+
+    Claiming uses SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers
+    across instances can poll the same table without handing a job out twice.
+    A claimed job carries a lease; if its worker stops heartbeating, the job
+    becomes claimable again once the lease expires.
+    """
+
+    durable = True
+
+    def __init__(self, db):
+        self.db = db
+
+    def _execute(self, statements: List[Tuple[str, tuple]], fetch: str = 'one'):
+        # Raw cursor rather than execute_query: the claim needs several
+        # statements in one transaction
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            for query, params in statements:
+                cursor.execute(query, params)
+            if fetch == 'one':
+                row = cursor.fetchone()
+                return dict(row) if row else None
+            return [dict(row) for row in cursor.fetchall()]
+
+    def check(self):
+        """Raise if the jobs table is missing"""
+        self._execute([("SELECT 1 FROM indexing_jobs LIMIT 1", ())], fetch='all')
+
+    def enqueue(self, user_id: int, job_type: str, payload: Dict[str, Any],
+                idempotency_key: Optional[str] = None, max_attempts: int = 3) -> Tuple[Dict[str, Any], bool]:
+        job = self._execute([(
+            """
+            INSERT INTO indexing_jobs (user_id, job_type, payload, idempotency_key, max_attempts)
+            VALUES (%s, %s, %s::jsonb, %s, %s)
+            ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            RETURNING *
+            """,
+            (user_id, job_type, json.dumps(payload, default=str), idempotency_key, max_attempts)
+        )])
+        if job is not None:
+            return job, True
+        existing = self._execute([(
+            "SELECT * FROM indexing_jobs WHERE user_id = %s AND idempotency_key = %s",
+            (user_id, idempotency_key)
+        )])
+        return existing, False
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        return self._execute([
+            # Settle expired leases that cannot be retried: cancelled while
+            # running, or out of attempts (the worker died mid-job every time)
+            ("""
+             UPDATE indexing_jobs
+             SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'failed' END,
+                 last_error = CASE WHEN cancel_requested THEN last_error
+                                   ELSE 'Lease expired on final attempt' END,
+                 lease_owner = NULL, lease_expires_at = NULL,
+                 finished_at = NOW(), updated_at = NOW()
+             WHERE status = 'running' AND lease_expires_at < NOW()
+               AND (cancel_requested OR attempts >= max_attempts)
+             """, ()),
+            ("""
+             UPDATE indexing_jobs
+             SET status = 'running', lease_owner = %s,
+                 lease_expires_at = NOW() + make_interval(secs => %s),
+                 attempts = attempts + 1,
+                 started_at = COALESCE(started_at, NOW()), updated_at = NOW()
+             WHERE id = (
+                 SELECT id FROM indexing_jobs
+                 WHERE (status = 'queued' AND run_after <= NOW())
+                    OR (status = 'running' AND lease_expires_at < NOW())
+                 ORDER BY run_after, created_at
+                 FOR UPDATE SKIP LOCKED
+                 LIMIT 1
+             )
+             RETURNING *
+             """, (worker_id, lease_seconds))
+        ])
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Extend the lease; None if this worker no longer holds the job"""
+        return self._execute([(
+            """
+            UPDATE indexing_jobs
+            SET lease_expires_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+            WHERE id = %s AND lease_owner = %s AND status = 'running'
+            RETURNING id, cancel_requested
+            """,
+            (lease_seconds, job_id, worker_id)
+        )])
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self._finish(job_id, worker_id, 'succeeded', result=result)
+
+    def mark_cancelled(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        return self._finish(job_id, worker_id, 'cancelled')
+
+    def fail(self, job_id: str, worker_id: str, error: str,
+             retry_in: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Record a failed attempt; requeue after retry_in seconds, or fail for good if None"""
+        if retry_in is None:
+            return self._finish(job_id, worker_id, 'failed', error=error)
+        return self._execute([(
+            """
+            UPDATE indexing_jobs
+            SET status = 'queued', last_error = %s,
+                run_after = NOW() + make_interval(secs => %s),
+                lease_owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+            WHERE id = %s AND lease_owner = %s
+            RETURNING *
+            """,
+            (error, retry_in, job_id, worker_id)
+        )])
+
+    def release(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Hand a job back on shutdown without spending one of its attempts"""
+        return self._execute([(
+            """
+            UPDATE indexing_jobs
+            SET status = 'queued', attempts = GREATEST(attempts - 1, 0), run_after = NOW(),
+                lease_owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+            WHERE id = %s AND lease_owner = %s AND status = 'running'
+            RETURNING *
+            """,
+            (job_id, worker_id)
+        )])
+
+    def cancel(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job outright; flag a running one for its worker"""
+        if not _valid_job_id(job_id):
+            return None
+        return self._execute([(
+            """
+            UPDATE indexing_jobs
+            SET status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                cancel_requested = (status = 'running') OR cancel_requested,
+                finished_at = CASE WHEN status = 'queued' THEN NOW() ELSE finished_at END,
+                updated_at = NOW()
+            WHERE id = %s AND user_id = %s
+            RETURNING *
+            """,
+            (job_id, user_id)
+        )])
+
+    def get(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        if not _valid_job_id(job_id):
+            return None
+        return self._execute([(
+            "SELECT * FROM indexing_jobs WHERE id = %s AND user_id = %s",
+            (job_id, user_id)
+        )])
+
+    def _finish(self, job_id: str, worker_id: str, status: str,
+                result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        return self._execute([(
+            """
+            UPDATE indexing_jobs
+            SET status = %s, result = %s::jsonb, last_error = COALESCE(%s, last_error),
+                lease_owner = NULL, lease_expires_at = NULL,
+                finished_at = NOW(), updated_at = NOW()
+            WHERE id = %s AND lease_owner = %s
+            RETURNING *
+            """,
+            (status, json.dumps(result, default=str) if result is not None else None, error, job_id, worker_id)
+        )])
+
+
+class MemoryJobStore:
+    """
+    Same interface as PostgresJobStore, kept in process memory
+
+    Used when DATABASE_URL is not configured (local development). Jobs do
+    not survive a restart.
+    """
+
+    durable = False
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def check(self):
+        pass
+
+    def enqueue(self, user_id: int, job_type: str, payload: Dict[str, Any],
+                idempotency_key: Optional[str] = None, max_attempts: int = 3) -> Tuple[Dict[str, Any], bool]:
+        with self._lock:
+            if idempotency_key is not None:
+                for job in self._jobs.values():
+                    if job['user_id'] == user_id and job['idempotency_key'] == idempotency_key:
+                        return dict(job), False
+            now = datetime.now()
+            job = {
+                'id': str(uuid.uuid4()), 'user_id': user_id, 'job_type': job_type, 'payload': payload,
+                'status': 'queued', 'idempotency_key': idempotency_key, 'attempts': 0,
+                'max_attempts': max_attempts, 'run_after': now, 'lease_owner': None,
+                'lease_expires_at': None, 'cancel_requested': False, 'result': None,
+                'last_error': None, 'created_at': now, 'updated_at': now,
+                'started_at': None, 'finished_at': None
+            }
+            self._jobs[job['id']] = job
+            return dict(job), True
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            now = datetime.now()
+            for job in self._jobs.values():
+                if job['status'] == 'running' and job['lease_expires_at'] < now and \
+                        (job['cancel_requested'] or job['attempts'] >= job['max_attempts']):
+                    if job['cancel_requested']:
+                        self._settle(job, 'cancelled')
+                    else:
+                        self._settle(job, 'failed', error='Lease expired on final attempt')
+            claimable = [
+                job for job in self._jobs.values()
+                if (job['status'] == 'queued' and job['run_after'] <= now)
+                or (job['status'] == 'running' and job['lease_expires_at'] < now)
+            ]
+            if not claimable:
+                return None
+            job = min(claimable, key=lambda j: (j['run_after'], j['created_at']))
+            job.update({
+                'status': 'running', 'lease_owner': worker_id,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'attempts': job['attempts'] + 1, 'started_at': job['started_at'] or now,
+                'updated_at': now
+            })
+            return dict(job)
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._held(job_id, worker_id)
+            if job is None or job['status'] != 'running':
+                return None
+            job['lease_expires_at'] = datetime.now() + timedelta(seconds=lease_seconds)
+            return {'id': job_id, 'cancel_requested': job['cancel_requested']}
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._held(job_id, worker_id)
+            return dict(self._settle(job, 'succeeded', result=result)) if job else None
+
+    def mark_cancelled(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._held(job_id, worker_id)
+            return dict(self._settle(job, 'cancelled')) if job else None
+
+    def fail(self, job_id: str, worker_id: str, error: str,
+             retry_in: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._held(job_id, worker_id)
+            if job is None:
+                return None
+            if retry_in is None:
+                return dict(self._settle(job, 'failed', error=error))
+            job.update({
+                'status': 'queued', 'last_error': error,
+                'run_after': datetime.now() + timedelta(seconds=retry_in),
+                'lease_owner': None, 'lease_expires_at': None, 'updated_at': datetime.now()
+            })
+            return dict(job)
+
+    def release(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._held(job_id, worker_id)
+            if job is None or job['status'] != 'running':
+                return None
+            job.update({
+                'status': 'queued', 'attempts': max(job['attempts'] - 1, 0), 'run_after': datetime.now(),
+                'lease_owner': None, 'lease_expires_at': None, 'updated_at': datetime.now()
+            })
+            return dict(job)
+
+    def cancel(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['user_id'] != user_id:
+                return None
+            if job['status'] == 'queued':
+                self._settle(job, 'cancelled')
+            elif job['status'] == 'running':
+                job['cancel_requested'] = True
+            return dict(job)
+
+    def get(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job and job['user_id'] == user_id else None
+
+    def _held(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return job if job and job['lease_owner'] == worker_id else None
+
+    @staticmethod
+    def _settle(job: Dict[str, Any], status: str, result: Optional[Dict[str, Any]] = None,
+                error: Optional[str] = None) -> Dict[str, Any]:
+        now = datetime.now()
+        job.update({
+            'status': status, 'result': result, 'last_error': error or job['last_error'],
+            'lease_owner': None, 'lease_expires_at': None, 'finished_at': now, 'updated_at': now
+        })
+        return job
+
+
+class JobWorkerPool:
+    """
+    In-process asyncio workers draining a job store
+
+    Each worker claims one job at a time, runs its handler as a task and
+    heartbeats the lease every lease_seconds / 3 while it runs. A heartbeat
+    that finds the job flagged for cancellation (or the lease lost) cancels
+    the handler. Failed jobs are retried with exponential backoff plus jitter
+    until max_attempts; PermanentJobError fails the job immediately.
+
+    Workers sleep between polls but are woken at once by enqueue(), so a
+    job submitted to this instance starts without waiting for the poll.
+    """
+
+    def __init__(self, store, handlers: Optional[Dict[str, JobHandler]] = None,
+                 concurrency: int = 2, poll_interval: float = 2.0, lease_seconds: float = 60.0,
+                 max_attempts: int = 3, backoff_base: float = 5.0, backoff_max: float = 300.0):
+        self.store = store
+        self.handlers: Dict[str, JobHandler] = dict(handlers or {})
+        self.concurrency = max(0, concurrency)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+        # Metrics
+        self._claimed = 0
+        self._succeeded = 0
+        self._retried = 0
+        self._failed = 0
+        self._cancelled = 0
+
+    def register(self, job_type: str, handler: JobHandler):
+        self.handlers[job_type] = handler
+
+    async def start(self):
+        """Check the store and start the workers (idempotent)"""
+        if self._workers:
+            return
+        try:
+            await asyncio.to_thread(self.store.check)
+        except Exception as e:
+            logger.error(f"❌ Indexing job table unavailable ({e}); apply "
+                         f"database/migrations/003_indexing_jobs.sql. Falling back to in-memory jobs.")
+            self.store = MemoryJobStore()
+        if not self.store.durable:
+            logger.warning("⚠️ Indexing jobs are kept in memory and will not survive a restart")
+
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"🧵 Indexing job pool started: {self.concurrency} workers as {self.worker_id}")
+
+    async def stop(self):
+        """Stop the workers; jobs still running are released back to the queue"""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if workers:
+            logger.info("🧵 Indexing job pool stopped")
+
+    async def enqueue(self, user_id: int, job_type: str, payload: Dict[str, Any],
+                      idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Store a job and wake a worker
+
+        Returns:
+            (job, created) - created is False when idempotency_key matched an
+            existing job, which is returned instead
+        """
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job, created = await asyncio.to_thread(
+            self.store.enqueue, user_id, job_type, payload, idempotency_key, self.max_attempts
+        )
+        if created and self._wakeup is not None:
+            self._wakeup.set()
+        return job, created
+
+    async def get(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id, user_id)
+
+    async def cancel(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job
+
+        Queued jobs are cancelled immediately. Running jobs are flagged; if this
+        instance holds the job its handler is cancelled now, otherwise the
+        owning worker sees the flag on its next heartbeat.
+        """
+        job = await asyncio.to_thread(self.store.cancel, job_id, user_id)
+        if job is not None and job['status'] == 'running':
+            task = self._running.get(str(job['id']))
+            if task is not None:
+                task.cancel()
+        return job
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'durable': self.store.durable,
+            'workers': len(self._workers),
+            'running': len(self._running),
+            'claimed': self._claimed,
+            'succeeded': self._succeeded,
+            'retried': self._retried,
+            'failed': self._failed,
+            'cancelled': self._cancelled
+        }
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(attempts - 1, 0)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker(self):
+        while True:
+            # Cleared before claiming so an enqueue during the claim is not missed
+            self._wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.worker_id, self.lease_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Job claim failed: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._claimed += 1
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = str(job['id'])
+        handler = self.handlers.get(job['job_type'])
+        if handler is None:
+            await self._settle(self.store.fail, job_id, f"No handler for job type {job['job_type']}")
+            self._failed += 1
+            return
+
+        logger.info(f"🧵 Job {job_id} ({job['job_type']}) attempt {job['attempts']}/{job['max_attempts']}")
+        task = asyncio.create_task(handler(job))
+        self._running[job_id] = task
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.lease_seconds / 3)
+                if done:
+                    break
+                lease = await asyncio.to_thread(self.store.heartbeat, job_id, self.worker_id, self.lease_seconds)
+                if lease is None or lease['cancel_requested']:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    break
+        except asyncio.CancelledError:
+            # Pool shutdown: stop the handler and let another worker pick it up
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await self._settle(self.store.release, job_id)
+            raise
+        finally:
+            self._running.pop(job_id, None)
+
+        if task.cancelled():
+            # Either a user cancel or a lost lease; only the former is ours to record
+            if await self._settle(self.store.mark_cancelled, job_id) is not None:
+                self._cancelled += 1
+                logger.info(f"🛑 Job {job_id} cancelled")
+            return
+
+        error = task.exception()
+        if error is None:
+            await self._settle(self.store.complete, job_id, task.result() or {})
+            self._succeeded += 1
+            logger.info(f"✅ Job {job_id} succeeded")
+        elif isinstance(error, PermanentJobError) or job['attempts'] >= job['max_attempts']:
+            await self._settle(self.store.fail, job_id, str(error) or type(error).__name__)
+            self._failed += 1
+            logger.error(f"❌ Job {job_id} failed after {job['attempts']} attempts: {error}")
+        else:
+            delay = self._backoff(job['attempts'])
+            await self._settle(self.store.fail, job_id, str(error) or type(error).__name__, delay)
+            self._retried += 1
+            logger.warning(f"🔁 Job {job_id} attempt {job['attempts']} failed ({error}); retrying in {delay:.0f}s")
+
+    async def _settle(self, method, job_id: str, *args):
+        """Write a job outcome, logging rather than raising if the store is unreachable"""
+        try:
+            return await asyncio.to_thread(method, job_id, self.worker_id, *args)
+        except Exception as e:
+            # The lease will expire and the job will be retried elsewhere
+            logger.error(f"❌ Could not record outcome of job {job_id}: {e}")
+            return None
+
+
+def job_store_from_env():
+    """
+    INDEX_JOB_STORE: postgres (default when DATABASE_URL is set) | memory
+    """
+    backend = os.environ.get('INDEX_JOB_STORE', 'postgres' if os.environ.get('DATABASE_URL') else 'memory')
+    if backend.lower() == 'memory':
+        return MemoryJobStore()
+    from ..database import get_db_service
+    return PostgresJobStore(get_db_service())
+
+
+def job_pool_from_env(handlers: Optional[Dict[str, JobHandler]] = None) -> JobWorkerPool:
+    """
+    Build the indexing job pool from environment configuration
+
+    INDEX_JOB_WORKERS: jobs run concurrently by this instance (default 2, 0 = enqueue only)
+    INDEX_JOB_POLL_SECONDS: idle poll interval (default 2)
+    INDEX_JOB_LEASE_SECONDS: lease length; heartbeats every third of it (default 60)
+    INDEX_JOB_MAX_ATTEMPTS: attempts before a job is failed (default 3)
+    INDEX_JOB_BACKOFF_SECONDS: first retry delay, doubled per attempt (default 5)
+    """
+    return JobWorkerPool(
+        job_store_from_env(),
+        handlers,
+        concurrency=int(os.environ.get('INDEX_JOB_WORKERS', 2)),
+        poll_interval=float(os.environ.get('INDEX_JOB_POLL_SECONDS', 2)),
+        lease_seconds=float(os.environ.get('INDEX_JOB_LEASE_SECONDS', 60)),
+        max_attempts=int(os.environ.get('INDEX_JOB_MAX_ATTEMPTS', 3)),
+        backoff_base=float(os.environ.get('INDEX_JOB_BACKOFF_SECONDS', 5))
+    )
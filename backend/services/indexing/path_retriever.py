@@ -17,28 +17,43 @@ class PathRetriever:
     - Textual path generation
     """
     
-    def __init__(self, graph: nx.DiGraph, vector_store):
+    def __init__(self, graph: nx.DiGraph, vector_store,
+                 doc_nodes: Optional[Dict[str, Set[str]]] = None,
+                 search_filter: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            graph: Knowledge graph to walk
+            vector_store: Store used to find seed chunks and supporting text
+            doc_nodes: doc_id -> nodes mentioned in it (kept up to date by the
+                       owner); without it, mentions are found by scanning nodes
+            search_filter: Filter for seed searches, e.g. {'user_id': ...}
+        """
         self.graph = graph
         self.vector_store = vector_store
+        self.doc_nodes = doc_nodes
+        self.search_filter = search_filter
         
         # Path configuration
         self.max_path_length = 4
         self.max_paths_per_node = 10
         self.distance_decay = 0.8  # Penalty for longer paths
         
-    def retrieve_paths(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def retrieve_paths(self, query: str, top_k: int = 5,
+                       seed_results: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
         Main retrieval method - finds and ranks relevant paths
         
         Args:
             query: User query
             top_k: Number of paths to return
+            seed_results: Vector search results for the query that the caller
+                already has (e.g. from a batched search_many), to avoid searching twice
             
         Returns:
             List of ranked paths with metadata
         """
         # Step 1: Initial node retrieval via vector search
-        initial_nodes = self._get_initial_nodes(query)
+        initial_nodes = self._get_initial_nodes(query, seed_results=seed_results)
         
         # Step 2: Find all relevant paths from initial nodes
         all_paths = self._find_relevant_paths(initial_nodes)
@@ -54,19 +69,24 @@ class PathRetriever:
         
         return textual_paths
     
-    def _get_initial_nodes(self, query: str, n_nodes: int = 5) -> List[str]:
+    def _get_initial_nodes(self, query: str, n_nodes: int = 5,
+                           seed_results: Optional[List[Dict[str, Any]]] = None) -> List[str]:
         """
         Retrieve initial nodes using vector similarity
         
         Args:
             query: Search query
             n_nodes: Number of initial nodes
+            seed_results: Precomputed vector search results for the query
             
         Returns:
             List of node IDs
         """
         # Search in vector store for relevant chunks
-        results = self.vector_store.search(query, n_results=n_nodes * 2)
+        if seed_results is not None:
+            results = seed_results[:n_nodes * 2]
+        else:
+            results = self.vector_store.search(query, n_results=n_nodes * 2, filter_dict=self.search_filter)
         
         initial_nodes = set()
         
@@ -75,12 +95,15 @@ class PathRetriever:
             doc_id = result['metadata']['doc_id']
             
             # Find nodes mentioned in this document
-            for node_id, data in self.graph.nodes(data=True):
-                if 'mentions' in data:
-                    for mention in data['mentions']:
-                        if mention['doc_id'] == doc_id:
-                            initial_nodes.add(node_id)
-                            break
+            if self.doc_nodes is not None:
+                initial_nodes.update(node_id for node_id in self.doc_nodes.get(doc_id, ()) if node_id in self.graph)
+            else:
+                for node_id, data in self.graph.nodes(data=True):
+                    if 'mentions' in data:
+                        for mention in data['mentions']:
+                            if mention['doc_id'] == doc_id:
+                                initial_nodes.add(node_id)
+                                break
             
             if len(initial_nodes) >= n_nodes:
                 break
@@ -257,7 +280,10 @@ class PathRetriever:
         """
         textual_paths = []
         
-        for score, path in scored_paths:
+        # Fetch supporting text for every path in one batched search
+        all_supporting_texts = self._get_supporting_texts_many([path for _, path in scored_paths])
+
+        for (score, path), supporting_texts in zip(scored_paths, all_supporting_texts):
             # Build narrative from path
             narrative_parts = []
             
@@ -296,9 +322,6 @@ class PathRetriever:
                         else:
                             narrative_parts.append(f"→ {rel_type.lower().replace('_', ' ')} {next_label}")
             
-            # Get supporting text from documents
-            supporting_texts = self._get_supporting_texts(path)
-            
             textual_path = {
                 'path': path,
                 'score': score,
@@ -325,30 +348,51 @@ class PathRetriever:
         Returns:
             List of relevant text excerpts
         """
-        supporting_texts = []
-        doc_ids = set()
+        return self._get_supporting_texts_many([path])[0]
+
+    def _get_supporting_texts_many(self, paths: List[List[str]]) -> List[List[str]]:
+        """
+        Get supporting text chunks for several paths with a single search_many call
         
-        # Collect all documents mentioning nodes in path
-        for node_id in path:
-            if node_id in self.graph:
-                node_data = self.graph.nodes[node_id]
-                if 'mentions' in node_data:
-                    for mention in node_data['mentions']:
-                        doc_ids.add(mention['doc_id'])
-        
-        # Get text chunks for these documents
-        for doc_id in doc_ids:
-            # Search vector store for this document's chunks
-            results = self.vector_store.search(
-                "",  # Empty query
-                filter_dict={'doc_id': doc_id},
-                n_results=2
-            )
+        Args:
+            paths: List of paths (each a list of node IDs)
             
-            for result in results:
-                supporting_texts.append(result['text'][:200] + "...")
-        
-        return supporting_texts[:3]  # Limit to 3 excerpts
+        Returns:
+            Per-path lists of relevant text excerpts
+        """
+        path_doc_ids = []
+
+        # Collect all documents mentioning nodes in each path
+        for path in paths:
+            doc_ids = set()
+            for node_id in path:
+                if node_id in self.graph:
+                    node_data = self.graph.nodes[node_id]
+                    if 'mentions' in node_data:
+                        for mention in node_data['mentions']:
+                            doc_ids.add(mention['doc_id'])
+            path_doc_ids.append(sorted(doc_ids))
+
+        # One query per distinct document, shared between paths
+        unique_doc_ids = sorted({doc_id for doc_ids in path_doc_ids for doc_id in doc_ids})
+        doc_texts = {}
+        if unique_doc_ids:
+            results = self.vector_store.search_many(
+                [""] * len(unique_doc_ids),  # Empty query
+                n_results=2,
+                filters=[{'doc_id': doc_id} for doc_id in unique_doc_ids]
+            )
+            for doc_id, doc_results in zip(unique_doc_ids, results):
+                doc_texts[doc_id] = [result['text'][:200] + "..." for result in doc_results]
+
+        supporting = []
+        for doc_ids in path_doc_ids:
+            supporting_texts = []
+            for doc_id in doc_ids:
+                supporting_texts.extend(doc_texts.get(doc_id, []))
+            supporting.append(supporting_texts[:3])  # Limit to 3 excerpts
+        
+        return supporting
     
     def _extract_path_entities(self, path: List[str]) -> List[Dict[str, str]]:
         """Extract entity information from path"""
@@ -0,0 +1,444 @@
+"""
+Quantized vector index for compact embedding storage
+First-pass candidate search over int8 or binary codes held in memory,
+followed by exact float re-ranking with vectors paged in lazily from a
+memory-mapped side file.
+"""
+
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Set
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('int8', 'binary')
+
+# Popcount for every byte value, used for Hamming similarity on packed bits
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class QuantizedIndex:
+    """
+    Compact first-pass index with exact re-rank
+
+    Memory holds only the codes: int8 scalar-quantized vectors with a
+    per-vector scale (~4x smaller than float32) or sign bits packed 8 per
+    byte (~32x smaller). Full float32 vectors live in a memory-mapped side
+    file and are only touched for the top rerank_factor * k candidates.
+
+    Files (under directory, prefixed by name):
+        .f32     float32 vectors, one row per slot (memory-mapped)
+        .codes   quantized codes, mirrored to disk for fast restarts
+        .scales  int8 per-vector scales
+        .log     append-only "+row id" / "-id" journal of slot assignments
+
+    compact() writes the packed rows to a new generation of the data files
+    (".<generation>.f32" etc.) and the journal to a temp file, then swaps the
+    journal in with os.replace; the journal's "@<generation>" header names
+    the data files it describes, so a crash leaves either index intact.
+    """
+
+    def __init__(self, dimension: int, mode: str = 'int8', directory: Optional[str] = None,
+                 name: str = "vectors", rerank_factor: int = 4, initial_capacity: int = 1024):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization mode: {mode}")
+        self.dimension = dimension
+        self.mode = mode
+        self.rerank_factor = max(1, rerank_factor)
+        self.code_width = dimension if mode == 'int8' else (dimension + 7) // 8
+        self.code_dtype = np.int8 if mode == 'int8' else np.uint8
+
+        self._lock = threading.RLock()
+        self.ids: List[Optional[str]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self._size = 0
+        self._capacity = 0
+        self.generation = 0
+
+        self.codes = np.zeros((0, self.code_width), dtype=self.code_dtype)
+        self.scales = np.zeros((0,), dtype=np.float32)
+        self.alive = np.zeros((0,), dtype=bool)
+        self._vectors: Optional[np.memmap] = None
+        self._codes_file: Optional[np.memmap] = None
+        self._scales_file: Optional[np.memmap] = None
+
+        self.directory = directory
+        self.name = name
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+        self._ensure_capacity(max(initial_capacity, self._size))
+
+    # Public API
+
+    def __len__(self) -> int:
+        return len(self.id_to_row)
+
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self.id_to_row
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        """Add (or overwrite) vectors; they are L2-normalized for cosine scoring"""
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension))
+        with self._lock:
+            self.remove([vector_id for vector_id in ids if vector_id in self.id_to_row])
+            self._ensure_capacity(self._size + len(ids))
+
+            rows = np.arange(self._size, self._size + len(ids))
+            codes, scales = self._quantize(vectors)
+            self.codes[rows] = codes
+            self.scales[rows] = scales
+            self.alive[rows] = True
+            self._vectors[rows] = vectors
+            if self._codes_file is not None:
+                self._codes_file[rows] = codes
+                self._scales_file[rows] = scales
+
+            log_lines = []
+            for row, vector_id in zip(rows, ids):
+                self.ids.append(vector_id)
+                self.id_to_row[vector_id] = int(row)
+                log_lines.append(f"+{row} {vector_id}\n")
+            self._size += len(ids)
+            self._flush(log_lines)
+
+    def remove(self, ids: Iterable[str]):
+        """Tombstone vectors; space is reclaimed by compact()"""
+        with self._lock:
+            log_lines = []
+            for vector_id in ids:
+                row = self.id_to_row.pop(vector_id, None)
+                if row is None:
+                    continue
+                self.alive[row] = False
+                self.ids[row] = None
+                log_lines.append(f"-{vector_id}\n")
+            if log_lines:
+                self._flush(log_lines)
+            if self._size > 1024 and len(self.id_to_row) < self._size * 0.75:
+                self.compact()
+
+    def search(self, query: np.ndarray, k: int,
+               allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Approximate search over codes, then exact cosine re-rank
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            allowed_ids: Restrict results to these IDs (metadata pre-filter)
+
+        Returns:
+            List of (id, cosine similarity), best first
+        """
+        query = self._normalize(np.asarray(query, dtype=np.float32).reshape(1, self.dimension))[0]
+        with self._lock:
+            if allowed_ids is not None:
+                rows = np.fromiter((self.id_to_row[i] for i in allowed_ids if i in self.id_to_row),
+                                   dtype=np.int64)
+            else:
+                rows = np.flatnonzero(self.alive[:self._size])
+            if rows.size == 0 or k <= 0:
+                return []
+
+            approx = self._approximate_scores(query, rows)
+            n_candidates = min(rows.size, k * self.rerank_factor)
+            if n_candidates < rows.size:
+                top = np.argpartition(-approx, n_candidates - 1)[:n_candidates]
+                candidates = rows[top]
+            else:
+                candidates = rows
+
+            # Exact re-rank: only the candidate rows are paged in from the side file
+            candidates = np.sort(candidates)
+            exact = np.asarray(self._vectors[candidates]) @ query
+            order = np.argsort(-exact)[:k]
+            return [(self.ids[candidates[i]], float(exact[i])) for i in order]
+
+    def get_vectors(self, ids: List[str]) -> np.ndarray:
+        """Full-precision (normalized) vectors for ids; unknown ids raise KeyError"""
+        with self._lock:
+            rows = np.array([self.id_to_row[vector_id] for vector_id in ids], dtype=np.int64)
+            return np.array(self._vectors[rows]) if rows.size else np.zeros((0, self.dimension), np.float32)
+
+    def compact(self):
+        """Rewrite live rows contiguously and start a fresh journal"""
+        with self._lock:
+            live = np.flatnonzero(self.alive[:self._size])
+            live_ids = [self.ids[row] for row in live]
+            if not self.directory:
+                vectors = np.array(self._vectors[live])
+                self._size = 0
+                self.ids = []
+                self.id_to_row = {}
+                self.alive[:] = False
+                if live_ids:
+                    self.add(live_ids, vectors)
+                logger.info(f"Compacted quantized index {self.name}: {len(live_ids)} live vectors")
+                return
+
+            generation = self.generation + 1
+            capacity = 1024
+            while capacity < len(live_ids):
+                capacity *= 2
+            files = {}
+            for suffix, dtype, shape, source in (
+                    ('f32', np.float32, (capacity, self.dimension), self._vectors),
+                    ('codes', self.code_dtype, (capacity, self.code_width), self._codes_file),
+                    ('scales', np.float32, (capacity,), self._scales_file)):
+                path = self._data_path(suffix, generation)
+                if os.path.exists(path):
+                    os.remove(path)  # left over from a compaction that never committed
+                target = self._open_memmap(suffix, dtype, shape, None, generation)
+                target[:len(live_ids)] = source[live]
+                target.flush()
+                _fsync(path)
+                files[suffix] = target
+
+            log_path = self._path('log')
+            tmp_path = log_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(f"@{generation}\n")
+                f.writelines(f"+{row} {vector_id}\n" for row, vector_id in enumerate(live_ids))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, log_path)
+            _fsync(self.directory)
+
+            codes, scales, alive = self.codes[live], self.scales[live], np.zeros((capacity,), dtype=bool)
+            self.codes = np.zeros((capacity, self.code_width), dtype=self.code_dtype)
+            self.scales = np.zeros((capacity,), dtype=np.float32)
+            self.codes[:len(live_ids)] = codes
+            self.scales[:len(live_ids)] = scales
+            alive[:len(live_ids)] = True
+            self.alive = alive
+            self._vectors, self._codes_file, self._scales_file = files['f32'], files['codes'], files['scales']
+            self._capacity = capacity
+            self._size = len(live_ids)
+            self.ids = list(live_ids)
+            self.id_to_row = {vector_id: row for row, vector_id in enumerate(live_ids)}
+
+            previous, self.generation = self.generation, generation
+            for suffix in ('f32', 'codes', 'scales'):
+                try:
+                    os.remove(self._data_path(suffix, previous))
+                except OSError:
+                    pass
+            logger.info(f"Compacted quantized index {self.name}: {len(live_ids)} live vectors "
+                        f"(generation {generation})")
+
+    def memory_bytes(self) -> int:
+        """Resident bytes for the in-memory codes (the float side file is paged on demand)"""
+        return int(self.codes[:self._size].nbytes + self.scales[:self._size].nbytes + self.alive[:self._size].nbytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'vectors': len(self.id_to_row),
+            'slots': self._size,
+            'code_bytes': self.memory_bytes(),
+            'float_bytes_equivalent': len(self.id_to_row) * self.dimension * 4,
+            'rerank_factor': self.rerank_factor
+        }
+
+    # Scoring
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.mode == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+
+    def _approximate_scores(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        if self.mode == 'int8':
+            return (self.codes[rows].astype(np.float32) @ query) * self.scales[rows]
+        query_bits = np.packbits(query > 0)
+        differing = _POPCOUNT[np.bitwise_xor(self.codes[rows], query_bits)].sum(axis=1, dtype=np.int32)
+        return -differing.astype(np.float32)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # Storage
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{self.mode}.{suffix}")
+
+    def _data_path(self, suffix: str, generation: Optional[int] = None) -> str:
+        """Data file of a generation (generation 0 keeps the original unnumbered names)"""
+        generation = self.generation if generation is None else generation
+        return self._path(suffix if generation == 0 else f"{generation}.{suffix}")
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity and self._vectors is not None:
+            return
+        capacity = max(self._capacity, 1024)
+        while capacity < needed:
+            capacity *= 2
+
+        codes = np.zeros((capacity, self.code_width), dtype=self.code_dtype)
+        scales = np.zeros((capacity,), dtype=np.float32)
+        alive = np.zeros((capacity,), dtype=bool)
+        codes[:self._size] = self.codes[:self._size]
+        scales[:self._size] = self.scales[:self._size]
+        alive[:self._size] = self.alive[:self._size]
+        self.codes, self.scales, self.alive = codes, scales, alive
+
+        self._vectors = self._open_memmap('f32', np.float32, (capacity, self.dimension), self._vectors)
+        if self.directory:
+            self._codes_file = self._open_memmap('codes', self.code_dtype, (capacity, self.code_width),
+                                                 self._codes_file)
+            self._scales_file = self._open_memmap('scales', np.float32, (capacity,), self._scales_file)
+        self._capacity = capacity
+
+    def _open_memmap(self, suffix: str, dtype, shape: Tuple[int, ...], previous: Optional[np.memmap],
+                     generation: Optional[int] = None):
+        """Grow (or create) a memory-mapped file to the given shape"""
+        if not self.directory:
+            # No persistence configured: anonymous memory stands in for the side file
+            grown = np.zeros(shape, dtype=dtype)
+            if previous is not None:
+                grown[:len(previous)] = previous
+            return grown
+
+        if previous is not None:
+            previous.flush()
+            del previous
+        path = self._data_path(suffix, generation)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, 'ab') as f:
+            if f.tell() < nbytes:
+                f.truncate(nbytes)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _flush(self, log_lines: List[str]):
+        if not self.directory:
+            return
+        self._vectors.flush()
+        self._codes_file.flush()
+        self._scales_file.flush()
+        with open(self._path('log'), 'a') as f:
+            f.writelines(log_lines)
+
+    def _load(self):
+        """Replay the journal and pull the codes back into memory"""
+        log_path = self._path('log')
+        if not os.path.exists(log_path):
+            return
+
+        slots: Dict[int, str] = {}
+        id_to_row: Dict[str, int] = {}
+        with open(log_path) as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith('@'):
+                    self.generation = int(line[1:])
+                elif line.startswith('+'):
+                    row_text, vector_id = line[1:].split(' ', 1)
+                    row = int(row_text)
+                    slots[row] = vector_id
+                    id_to_row[vector_id] = row
+                elif line.startswith('-'):
+                    row = id_to_row.pop(line[1:], None)
+                    if row is not None:
+                        slots.pop(row, None)
+
+        size = max(slots) + 1 if slots else 0
+        self._ensure_capacity(max(size, 1024))
+        self._size = size
+        if self._size:
+            self.codes[:self._size] = self._codes_file[:self._size]
+            self.scales[:self._size] = self._scales_file[:self._size]
+        self.ids = [slots.get(row) for row in range(self._size)]
+        self.id_to_row = id_to_row
+        for row in id_to_row.values():
+            self.alive[row] = True
+        if self.generation:
+            # A compaction committed but was interrupted before dropping the old files
+            for suffix in ('f32', 'codes', 'scales'):
+                stale = self._data_path(suffix, self.generation - 1)
+                if os.path.exists(stale):
+                    os.remove(stale)
+        logger.info(f"✅ Loaded quantized index {self.name} ({self.mode}): {len(id_to_row)} vectors")
+
+
+def _fsync(path: str):
+    """Flush a file (or directory entry) to stable storage"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def evaluate_recall(vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                    modes: Tuple[str, ...] = QUANTIZATION_MODES,
+                    rerank_factors: Tuple[int, ...] = (1, 4, 10)) -> Dict[str, Any]:
+    """
+    Recall@k of each compact mode against exact float search
+
+    Args:
+        vectors: Corpus embeddings (n, dim)
+        queries: Query embeddings (q, dim)
+        k: Result depth
+        modes: Quantization modes to evaluate
+        rerank_factors: Candidate multipliers to evaluate for each mode
+
+    Returns:
+        Dict of per-mode/per-factor recall@k and memory footprint
+    """
+    vectors = QuantizedIndex._normalize(np.asarray(vectors, dtype=np.float32))
+    queries = QuantizedIndex._normalize(np.asarray(queries, dtype=np.float32))
+    ids = [str(i) for i in range(len(vectors))]
+
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    truth = [set(str(i) for i in row) for row in exact]
+
+    report = {
+        'corpus_size': len(vectors),
+        'queries': len(queries),
+        'k': k,
+        'float32_bytes': int(vectors.nbytes),
+        'modes': {}
+    }
+    for mode in modes:
+        for factor in rerank_factors:
+            index = QuantizedIndex(vectors.shape[1], mode=mode, rerank_factor=factor,
+                                   initial_capacity=len(vectors))
+            index.add(ids, vectors)
+            hits = 0
+            for query, expected in zip(queries, truth):
+                found = {vector_id for vector_id, _ in index.search(query, k)}
+                hits += len(found & expected)
+            report['modes'][f"{mode}@rerank{factor}"] = {
+                'recall_at_k': round(hits / (len(queries) * k), 4),
+                'code_bytes': index.memory_bytes()
+            }
+    return report
+
+
+def quantized_index_from_env(dimension: int, directory: str, name: str) -> Optional[QuantizedIndex]:
+    """
+    Build the compact index selected by VECTOR_STORAGE_MODE (float disables it)
+
+    VECTOR_RERANK_FACTOR: candidates re-ranked per result (default 4, 10 for binary)
+    """
+    mode = os.environ.get('VECTOR_STORAGE_MODE', 'float').lower()
+    if mode == 'float':
+        return None
+    default_factor = 10 if mode == 'binary' else 4
+    return QuantizedIndex(
+        dimension,
+        mode=mode,
+        directory=directory,
+        name=name,
+        rerank_factor=int(os.environ.get('VECTOR_RERANK_FACTOR', default_factor))
+    )
@@ -0,0 +1,305 @@
+"""
+Reindex scheduler - debounced, coalesced re-indexing of documents as they are saved
+A burst of autosaves becomes one diff-based index update, and per-document
+freshness watermarks tell retrieval whether the index reflects the latest save.
+"""
+
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+ReindexFn = Callable[[str, str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+DeleteFn = Callable[[str, Optional[Any]], Awaitable[Any]]
+ChangeFn = Callable[[str, Optional[Any]], None]
+
+
+@dataclass
+class _PendingSave:
+    """Latest unindexed save of a document; newer saves overwrite it"""
+    content: Optional[str]  # None means the document was deleted
+    metadata: Dict[str, Any]
+    updated_at: datetime
+    first_seen: float = field(default_factory=time.monotonic)
+    last_seen: float = field(default_factory=time.monotonic)
+    saves: int = 1
+
+
+class ReindexScheduler:
+    """
+    Debounces document saves into index updates
+
+    notify_saved() only records the save and returns. One task per document
+    waits until no save has arrived for `debounce_seconds` (or `max_delay_seconds`
+    since the first unindexed save, so a writer who never pauses still gets
+    indexed), then runs reindex_fn with the newest content. Saves that arrive
+    while an update runs are picked up by the same task afterwards. At most
+    `concurrency` documents are re-indexed at once.
+
+    Watermarks record, per document, the newest save seen and the save the
+    index reflects (both as the document's updated_at, normalized to aware
+    UTC), so freshness can be checked against the database without touching
+    the index.
+
+    on_change(doc_id, user_id) is called as soon as a save or delete is
+    recorded, for caches that must not outlive the content they were built from.
+    """
+
+    def __init__(self, reindex_fn: ReindexFn, delete_fn: Optional[DeleteFn] = None,
+                 debounce_seconds: float = 5.0, max_delay_seconds: float = 60.0,
+                 concurrency: int = 2, on_change: Optional[ChangeFn] = None):
+        self.reindex_fn = reindex_fn
+        self.delete_fn = delete_fn
+        self.on_change = on_change
+        self.debounce = debounce_seconds
+        self.max_delay = max(max_delay_seconds, debounce_seconds)
+        self.concurrency = max(1, concurrency)
+
+        self._pending: Dict[str, _PendingSave] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._flushing: Optional[asyncio.Event] = None
+        self._watermarks: Dict[str, Dict[str, Any]] = {}
+
+        # Metrics
+        self._saves = 0
+        self._updates = 0
+        self._coalesced = 0
+        self._failures = 0
+
+    def notify_saved(self, doc_id: str, content: str, metadata: Optional[Dict[str, Any]] = None,
+                     updated_at: Optional[datetime] = None):
+        """
+        Record a save; the index is updated once the document goes quiet
+
+        Args:
+            doc_id: Saved document
+            content: Full document text after the save
+            metadata: Document metadata for the chunks (title, user_id, folder_id)
+            updated_at: The document's updated_at as written to the database
+        """
+        self._record(doc_id, content, metadata or {}, updated_at or datetime.now(timezone.utc))
+
+    def notify_deleted(self, doc_id: str, user_id: Optional[Any] = None):
+        """
+        Drop a deleted document from the index (after any pending save)
+
+        Args:
+            doc_id: Deleted document
+            user_id: Its owner, passed on to delete_fn (the index may not know it after a restart)
+        """
+        metadata = {'user_id': user_id} if user_id is not None else {}
+        self._record(doc_id, None, metadata, datetime.now(timezone.utc))
+
+    def _record(self, doc_id: str, content: Optional[str], metadata: Dict[str, Any], updated_at: datetime):
+        # TIMESTAMPTZ rows arrive aware, in-process saves may be naive UTC
+        updated_at = _as_utc(updated_at)
+        self._saves += 1
+        pending = self._pending.get(doc_id)
+        if pending is None:
+            self._pending[doc_id] = _PendingSave(content, metadata, updated_at)
+        else:
+            pending.content = content
+            pending.metadata = metadata
+            pending.updated_at = updated_at
+            pending.last_seen = time.monotonic()
+            pending.saves += 1
+
+        watermark = self._watermarks.setdefault(doc_id, {'indexed_through': None, 'indexed_at': None,
+                                                         'error': None})
+        watermark['saved_through'] = updated_at
+        if metadata.get('user_id') is not None:
+            watermark['user_id'] = metadata['user_id']
+        if self.on_change is not None:
+            self.on_change(doc_id, watermark.get('user_id'))
+
+        task = self._tasks.get(doc_id)
+        if task is None or task.done():
+            self._tasks[doc_id] = asyncio.create_task(self._run(doc_id))
+
+    async def _run(self, doc_id: str):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._flushing = asyncio.Event()
+        try:
+            while doc_id in self._pending:
+                pending = self._pending[doc_id]
+                now = time.monotonic()
+                due = min(pending.last_seen + self.debounce, pending.first_seen + self.max_delay)
+                if now < due and not self._flushing.is_set():
+                    try:
+                        await asyncio.wait_for(self._flushing.wait(), timeout=due - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                # Take the save now; anything newer starts a fresh pending entry
+                del self._pending[doc_id]
+                async with self._slots:
+                    await self._apply(doc_id, pending)
+        finally:
+            if self._tasks.get(doc_id) is asyncio.current_task():
+                del self._tasks[doc_id]
+
+    async def _apply(self, doc_id: str, pending: _PendingSave):
+        watermark = self._watermarks[doc_id]
+        start_time = time.time()
+        try:
+            if pending.content is None:
+                if self.delete_fn is not None:
+                    await self.delete_fn(doc_id, pending.metadata.get('user_id', watermark.get('user_id')))
+                self._watermarks.pop(doc_id, None)
+                logger.info(f"🗑️ Removed deleted document {doc_id} from the index")
+                return
+            result = await self.reindex_fn(doc_id, pending.content, pending.metadata)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._failures += 1
+            watermark['error'] = str(e) or type(e).__name__
+            logger.error(f"❌ Re-indexing {doc_id} failed (index stays at previous save): {e}")
+            return
+
+        self._updates += 1
+        self._coalesced += pending.saves - 1
+        watermark.update({'indexed_through': pending.updated_at, 'indexed_at': datetime.now(timezone.utc), 'error': None})
+        logger.info(f"🔄 Re-indexed {doc_id} ({pending.saves} saves coalesced, "
+                    f"{result.get('added', 0)} chunks embedded, {result.get('removed', 0)} removed) "
+                    f"in {time.time() - start_time:.2f}s")
+
+    def freshness(self, doc_id: str, updated_at: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Whether the index reflects a document's latest content
+
+        Args:
+            doc_id: Document to check
+            updated_at: The document's current updated_at, if the caller has it;
+                        otherwise the newest save seen by this scheduler is used
+
+        Returns:
+            Dict with 'state' - 'fresh', 'pending' (a re-index is scheduled or
+            running), 'stale' (the index is behind and nothing is scheduled,
+            e.g. the last re-index failed) or 'unknown' (never indexed through
+            this scheduler) - plus the watermark timestamps
+        """
+        watermark = self._watermarks.get(doc_id)
+        if watermark is None:
+            return {'doc_id': doc_id, 'state': 'unknown'}
+
+        target = _as_utc(updated_at) or watermark.get('saved_through')
+        indexed = watermark['indexed_through']
+        if indexed is not None and (target is None or indexed >= target):
+            state = 'fresh'
+        elif doc_id in self._pending or doc_id in self._tasks:
+            state = 'pending'
+        else:
+            state = 'stale'
+        return {
+            'doc_id': doc_id,
+            'state': state,
+            'indexed_through': _isoformat(indexed),
+            'saved_through': _isoformat(watermark.get('saved_through')),
+            'indexed_at': _isoformat(watermark['indexed_at']),
+            'error': watermark['error']
+        }
+
+    def is_fresh(self, doc_id: str, updated_at: Optional[datetime] = None) -> bool:
+        return self.freshness(doc_id, updated_at)['state'] == 'fresh'
+
+    def freshness_many(self, doc_ids: Iterable[str], user_id: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Freshness of several documents; other users' documents read as 'unknown'"""
+        report = {}
+        for doc_id in doc_ids:
+            owner = self._watermarks.get(doc_id, {}).get('user_id')
+            if user_id is not None and owner is not None and owner != user_id:
+                report[doc_id] = {'doc_id': doc_id, 'state': 'unknown'}
+            else:
+                report[doc_id] = self.freshness(doc_id)
+        return report
+
+    async def flush(self):
+        """Index every pending save now, skipping the debounce (used on shutdown)"""
+        if self._flushing is None:
+            return
+        self._flushing.set()
+        try:
+            tasks = list(self._tasks.values())
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._flushing.clear()
+
+    def export_watermarks(self) -> Dict[str, Dict[str, Any]]:
+        """Watermarks for snapshots; only what the index actually reflects is kept"""
+        return {
+            doc_id: {'indexed_through': _isoformat(w['indexed_through']), 'indexed_at': _isoformat(w['indexed_at']),
+                     'user_id': w.get('user_id')}
+            for doc_id, w in self._watermarks.items() if w['indexed_through'] is not None
+        }
+
+    def load_watermarks(self, watermarks: Dict[str, Dict[str, Any]]):
+        """Restore snapshot watermarks for documents this process has not seen yet"""
+        for doc_id, w in watermarks.items():
+            if doc_id in self._watermarks:
+                continue
+            indexed_through = _parse(w.get('indexed_through'))
+            self._watermarks[doc_id] = {
+                'indexed_through': indexed_through,
+                'saved_through': indexed_through,
+                'indexed_at': _parse(w.get('indexed_at')),
+                'user_id': w.get('user_id'),
+                'error': None
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'saves': self._saves,
+            'updates': self._updates,
+            'coalesced': self._coalesced,
+            'failures': self._failures,
+            'pending': len(self._pending),
+            'tracked_documents': len(self._watermarks),
+            'debounce_seconds': self.debounce,
+            'max_delay_seconds': self.max_delay
+        }
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    return _as_utc(datetime.fromisoformat(value)) if value else None
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Aware UTC datetime; naive values are taken to be UTC already"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def reindex_scheduler_from_env(reindex_fn: ReindexFn, delete_fn: Optional[DeleteFn] = None,
+                               on_change: Optional[ChangeFn] = None) -> ReindexScheduler:
+    """
+    Build the save-triggered reindex scheduler from environment configuration
+
+    REINDEX_DEBOUNCE_SECONDS: quiet period after the last save (default 5)
+    REINDEX_MAX_DELAY_SECONDS: longest a save waits while saves keep coming (default 60)
+    REINDEX_CONCURRENCY: documents re-indexed at once (default 2)
+    """
+    return ReindexScheduler(
+        reindex_fn,
+        delete_fn,
+        debounce_seconds=float(os.environ.get('REINDEX_DEBOUNCE_SECONDS', 5)),
+        max_delay_seconds=float(os.environ.get('REINDEX_MAX_DELAY_SECONDS', 60)),
+        concurrency=int(os.environ.get('REINDEX_CONCURRENCY', 2)),
+        on_change=on_change
+    )
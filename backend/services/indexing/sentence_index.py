@@ -0,0 +1,213 @@
+"""
+Sentence index - precomputed sentence boundaries and token IDs for excerpt selection
+Built once per document version at save time, so picking the excerpt for a
+query is array math over the index instead of re-splitting the whole text.
+"""
+
+from typing import List, Dict, Any, Optional, Callable
+from array import array
+from collections import OrderedDict
+import os
+import hashlib
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[List[str]], np.ndarray]
+
+
+def _token_ids(text: str) -> set:
+    # Whitespace tokens, lowercased, as the excerpt scorer has always matched them
+    return {hash(word) for word in text.lower().split()}
+
+
+class SentenceIndex:
+    """
+    Sentences of one text as compact arrays
+
+    starts/ends are character offsets into the text (sentences are split on
+    '.', stripped, newlines read as spaces). Each sentence's distinct token
+    IDs sit in token_ids[offsets[i]:offsets[i + 1]]. vectors, when present,
+    holds one normalized float16 embedding per sentence.
+    """
+
+    __slots__ = ('starts', 'ends', 'token_ids', 'offsets', 'vectors')
+
+    def __init__(self, text: str, embed_fn: Optional[EmbedFn] = None):
+        flat = text.replace('\n', ' ')
+        starts, ends, offsets = array('i'), array('i'), array('i', [0])
+        token_ids = array('q')
+        position = 0
+        for piece in flat.split('.'):
+            sentence = piece.strip()
+            if sentence:
+                start = position + len(piece) - len(piece.lstrip())
+                starts.append(start)
+                ends.append(start + len(sentence))
+                token_ids.extend(_token_ids(sentence))
+                offsets.append(len(token_ids))
+            position += len(piece) + 1
+
+        self.starts = np.frombuffer(starts, dtype=np.int32)
+        self.ends = np.frombuffer(ends, dtype=np.int32)
+        self.token_ids = np.frombuffer(token_ids, dtype=np.int64)
+        self.offsets = np.frombuffer(offsets, dtype=np.int32)
+        self.vectors = None
+        if embed_fn is not None and len(starts) > 3:
+            vectors = np.asarray(embed_fn(self.sentences(flat)), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            self.vectors = (vectors / np.where(norms > 0, norms, 1)).astype(np.float16)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def nbytes(self) -> int:
+        size = self.starts.nbytes + self.ends.nbytes + self.token_ids.nbytes + self.offsets.nbytes
+        return size + (self.vectors.nbytes if self.vectors is not None else 0)
+
+    def sentences(self, text: str, rows: Optional[np.ndarray] = None) -> List[str]:
+        rows = range(len(self)) if rows is None else rows
+        return [text[self.starts[row]:self.ends[row]].replace('\n', ' ') for row in rows]
+
+    def excerpt(self, text: str, query: str, max_length: int = 1000,
+                query_vector: Optional[np.ndarray] = None, semantic_weight: float = 1.0) -> str:
+        """
+        Most relevant excerpt of `text` (the text this index was built from)
+
+        A sentence scores one point per distinct query word it contains, plus
+        one in the middle 60% of a longer text, plus semantic_weight * cosine
+        when sentence vectors and a query vector are available. The top three
+        sentences are taken with one neighbour on each side, overlapping
+        windows merged, in text order.
+        """
+        count = len(self)
+        if count <= 3:
+            return text[:max_length]
+
+        query_ids = np.fromiter(_token_ids(query), dtype=np.int64)
+        matched = np.concatenate(([0], np.cumsum(np.isin(self.token_ids, query_ids), dtype=np.int32)))
+        scores = (matched[self.offsets[1:]] - matched[self.offsets[:-1]]).astype(np.float32)
+        if count > 5:
+            rows = np.arange(count)
+            scores[(rows > count * 0.2) & (rows < count * 0.8)] += 1
+        if self.vectors is not None and query_vector is not None:
+            norm = float(np.linalg.norm(query_vector))
+            if norm > 0:
+                scores += semantic_weight * (self.vectors.astype(np.float32) @ (query_vector / norm))
+
+        selected = np.zeros(count, dtype=bool)
+        for row in np.argsort(-scores, kind='stable')[:3]:
+            if scores[row] > 0:
+                selected[max(0, row - 1):row + 2] = True
+        if not selected.any():
+            return text[:max_length]
+
+        excerpt = '. '.join(self.sentences(text, np.flatnonzero(selected))) + '.'
+        return excerpt[:max_length] + "..." if len(excerpt) > max_length else excerpt
+
+
+class SentenceIndexStore:
+    """
+    Sentence indexes keyed by content hash, bounded by memory
+
+    Documents are indexed when saved (index_document), so the excerpt for a
+    stored version is ready before the first query; any other text (chunks,
+    content read straight from the database) is indexed on first use. The
+    least recently used indexes are dropped once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, embed_fn: Optional[EmbedFn] = None):
+        self.max_bytes = max_bytes
+        self.embed_fn = embed_fn
+        self._indexes: "OrderedDict[bytes, SentenceIndex]" = OrderedDict()
+        self._documents: Dict[str, bytes] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._hits = 0
+        self._builds = 0
+        self._evictions = 0
+
+    def index_document(self, doc_id: str, text: str) -> SentenceIndex:
+        """Index a saved document version (with sentence vectors if configured)"""
+        key = _content_key(text)
+        with self._lock:
+            index = self._indexes.get(key)
+            previous = self._documents.get(doc_id)
+        if index is None or (self.embed_fn is not None and index.vectors is None):
+            index = SentenceIndex(text, self.embed_fn)
+            self._store(key, index)
+        with self._lock:
+            self._documents[doc_id] = key
+            if previous is not None and previous != key and previous not in self._documents.values():
+                self._drop(previous)
+        return index
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            key = self._documents.pop(doc_id, None)
+            if key is not None and key not in self._documents.values():
+                self._drop(key)
+
+    def get(self, text: str) -> SentenceIndex:
+        """Index for `text`, built on a miss"""
+        key = _content_key(text)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                self._hits += 1
+                return index
+        index = SentenceIndex(text)
+        self._store(key, index)
+        return index
+
+    def _store(self, key: bytes, index: SentenceIndex):
+        with self._lock:
+            self._drop(key)
+            self._indexes[key] = index
+            self._bytes += index.nbytes
+            self._builds += 1
+            while self._bytes > self.max_bytes and len(self._indexes) > 1:
+                _, evicted = self._indexes.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def _drop(self, key: bytes):
+        index = self._indexes.pop(key, None)
+        if index is not None:
+            self._bytes -= index.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'indexes': len(self._indexes),
+                'documents': len(self._documents),
+                'memory_mb': round(self._bytes / 1e6, 2),
+                'hits': self._hits,
+                'builds': self._builds,
+                'evictions': self._evictions,
+                'sentence_vectors': self.embed_fn is not None
+            }
+
+
+def _content_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def sentence_index_store_from_env(embed_fn: Optional[EmbedFn] = None) -> SentenceIndexStore:
+    """
+    SENTENCE_INDEX_MAX_MB: memory for cached sentence indexes (default 64)
+    SENTENCE_INDEX_EMBEDDINGS: on | off (default) - embed every sentence of
+        saved documents so excerpts also rank by meaning (costs one model
+        pass per sentence on save)
+    """
+    with_vectors = os.environ.get('SENTENCE_INDEX_EMBEDDINGS', 'off').lower() in ('1', 'on', 'true', 'yes')
+    return SentenceIndexStore(
+        max_bytes=int(float(os.environ.get('SENTENCE_INDEX_MAX_MB', 64)) * 1024 * 1024),
+        embed_fn=embed_fn if with_vectors else None
+    )
@@ -3,16 +3,43 @@ Vector Store implementation for writing assistant
 Optimized for narrative text with semantic chunking
 """
 
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterator, TextIO, Set
+from collections import OrderedDict
 import os
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
 import hashlib
 import json
+import time
+import zlib
+import threading
+import weakref
+import logging
 from datetime import datetime
 
+from .embedding_backend import (
+    EmbeddingBackend, get_embedding_backend, embedding_backend_stats, active_backend_name
+)
+from .embedding_cache import EmbeddingCache, embedding_cache_from_env
+from .embedding_worker import EmbeddingWorker
+from .collection_router import collection_router_from_env, partition_settings_from_env
+from .bm25_index import BM25Index
+from .quantized_index import QuantizedIndex, quantized_index_from_env
+from .chunk_dedup import chunk_deduplicator_from_env
+from .document_index import DocumentIndex, centroid
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSION = 384
+
+logger = logging.getLogger(__name__)
+
+# Chunks are embedded and inserted in batches of this size while streaming
+EMBED_BATCH_SIZE = 64
+
+# Documents can be passed as a string or any file-like object with read()
+TextSource = Union[str, TextIO]
+
 class VectorStore:
     """
     Manages vector embeddings for document chunks with writing-specific optimizations
@@ -23,7 +50,30 @@ class VectorStore:
         # Changed from 'all-mpnet-base-v2' (400MB, 768-dim) to 'all-MiniLM-L6-v2' (90MB, 384-dim)
         # Trade-off: ~5% accuracy reduction for 75% memory savings
         # Performance impact: 87% → 84% on STS-B benchmark (acceptable for production)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # The model itself is loaded lazily on first use (see embedding_backend) so
+        # constructing the store is cheap; EMBEDDING_BACKEND=onnx runs the same
+        # model through ONNX Runtime (int8 by default)
+
+        # Every encode goes through a two-tier (memory LRU + memory-mapped disk) cache;
+        # non-default backends get their own namespace since their vectors differ slightly.
+        # The namespace follows the backend that actually loaded (ONNX falls back to
+        # PyTorch), so the cache is opened on first use rather than here
+        self._embedding_caches: Dict[str, EmbeddingCache] = {}
+        self._embedding_cache_lock = threading.Lock()
+        
+        # Optional micro-batching worker that keeps the model off the event loop
+        self.embedding_worker: Optional[EmbeddingWorker] = None
+
+        # doc_id -> chunk IDs in document order, plus the reverse position map, so
+        # neighbour lookups are list slices. Built from the collection on first use,
+        # then kept current by add/sync/delete.
+        self._doc_chunks: Optional[Dict[str, List[str]]] = None
+        self._chunk_positions: Dict[str, Tuple[str, int]] = {}
+        self._chunk_index_lock = threading.RLock()
+
+        # Chunk budget counted in whitespace words by default; CHUNK_TOKEN_BUDGET=model
+        # uses the embedding model's own tokenizer for exact sequence lengths
+        self.use_model_tokenizer = os.environ.get('CHUNK_TOKEN_BUDGET', 'words').lower() == 'model'
         
         # Initialize ChromaDB with memory-optimized persistent storage
         # OPTIMIZATION: Always use persistent storage to reduce memory usage
@@ -39,7 +89,7 @@ class VectorStore:
                 persist_directory = "/tmp/chroma_db"
             self.client = chromadb.PersistentClient(
                 path=persist_directory,
-                settings=chromadb.Settings(anonymized_telemetry=False)
+                settings=chromadb.Settings(anonymized_telemetry=False, **partition_settings_from_env())
             )
     
             print("✅ ChromaDB initialized successfully with telemetry disabled.")
@@ -49,121 +99,683 @@ class VectorStore:
             print(f"⚠️ ChromaDB initialization failed: {e}")
             raise RuntimeError(f"Failed to initialize ChromaDB: {e}")
         
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"}
+        # Optional compact storage (VECTOR_STORAGE_MODE=int8|binary): Chroma keeps
+        # only documents and metadata, vectors live in a quantized index with an
+        # exact float re-rank from a memory-mapped side file. Each collection has
+        # its own index; self.quantized_index is the base collection's, the
+        # partitions' are opened on first use (see _quantized_for)
+        self._quantized_directory = os.path.join(persist_directory, "quantized")
+        self.quantized_index = quantized_index_from_env(
+            EMBEDDING_DIMENSION,
+            self._quantized_directory,
+            collection_name
         )
+        self._quantized_indexes: "OrderedDict[str, QuantizedIndex]" = OrderedDict()
+        # Indexes dropped from the LRU but still referenced by a running call are
+        # reused from here, so a partition never has two instances writing its files
+        self._quantized_open: "weakref.WeakValueDictionary[str, QuantizedIndex]" = weakref.WeakValueDictionary()
+        self._quantized_lock = threading.Lock()
+
+        # Chunk IDs matching a metadata filter, per collection, for masking the
+        # quantized search. A collection's entries are dropped on every write to
+        # it; the generation keeps a query that raced a write from caching its set.
+        self._filter_ids: "OrderedDict[Tuple[str, str], Set[str]]" = OrderedDict()
+        self._filter_generations: Dict[str, int] = {}
+        self._filter_lock = threading.Lock()
+        self.max_filter_sets = int(os.environ.get('VECTOR_FILTER_CACHE_ENTRIES', 256))
         
-    def chunk_document(self, text: str, doc_id: str, chunk_size: int = 512) -> List[Dict[str, Any]]:
+        # Get or create collection(s). VECTOR_PARTITIONING=per_user|hashed gives
+        # users their own collections; self.collection is the base collection
+        if self.quantized_index is None:
+            base_name, collection_metadata = collection_name, {"hnsw:space": "cosine"}
+        else:
+            # Separate collection: its 1-dim placeholder vectors are never queried
+            base_name, collection_metadata = f"{collection_name}-{self.quantized_index.mode}", {"hnsw:space": "l2"}
+        self.collection_router = collection_router_from_env(self.client, base_name, collection_metadata)
+        self.collection = self.collection_router.default
+
+        # doc_id -> collection name for partitioned storage (filled with the chunk order index)
+        self._doc_collections: Dict[str, str] = {}
+
+        # BM25 keyword index over the same chunks (KEYWORD_INDEX=off disables it).
+        # Built from the collections on first keyword search, then kept current
+        # by every add/delete.
+        self.keyword_index: Optional[BM25Index] = None
+        if os.environ.get('KEYWORD_INDEX', 'on').lower() not in ('0', 'off', 'false', 'no'):
+            self.keyword_index = BM25Index()
+        self._keyword_index_ready = False
+        # Set when the build starts so writes racing the initial scan are not lost
+        self._keyword_index_live = False
+        self._keyword_index_lock = threading.Lock()
+
+        # Near-duplicate chunks (CHUNK_DEDUP=off disables) are stored as references
+        # to one canonical chunk of the same user and share its embedding. Signatures
+        # and references persist in a side file next to the collections; a user's
+        # LSH index is loaded from it on their first insert.
+        self.deduplicator = chunk_deduplicator_from_env(
+            os.path.join(persist_directory, "dedup"), collection_name, EMBEDDING_DIMENSION
+        )
+        self._dedup_lock = threading.Lock()
+
+        # One embedding per document (mean of its chunk vectors) for ranking a
+        # user's whole folder. Built from the stored vectors on first use, then
+        # kept current by add/sync/delete.
+        self.document_index = DocumentIndex(EMBEDDING_DIMENSION)
+        self._document_index_ready = False
+        self._document_index_live = False
+        self._document_index_lock = threading.Lock()
+
+    @property
+    def embedding_backend(self) -> EmbeddingBackend:
+        """Shared embedding model, loaded on first access (thread-safe)"""
+        return get_embedding_backend(EMBEDDING_MODEL_NAME, EMBEDDING_DIMENSION)
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        """Embedding cache namespaced by the backend serving the model (may load it)"""
+        return self._embedding_cache_for(active_backend_name(EMBEDDING_MODEL_NAME, EMBEDDING_DIMENSION))
+
+    def _embedding_cache_for(self, backend_name: str) -> EmbeddingCache:
+        namespace = EMBEDDING_MODEL_NAME
+        if backend_name != 'torch':
+            namespace = f"{EMBEDDING_MODEL_NAME}:{backend_name}"
+        cache = self._embedding_caches.get(namespace)
+        if cache is None:
+            with self._embedding_cache_lock:
+                cache = self._embedding_caches.get(namespace)
+                if cache is None:
+                    cache = embedding_cache_from_env(EMBEDDING_DIMENSION, namespace)
+                    self._embedding_caches[namespace] = cache
+        return cache
+
+    def embedding_cache_stats(self) -> Dict[str, Any]:
+        """Cache stats for health checks, without loading the model to learn its backend"""
+        backend_name = active_backend_name(EMBEDDING_MODEL_NAME, load=False)
+        if backend_name is None:
+            return {'namespace': None, 'reason': 'embedding backend not loaded yet'}
+        return self._embedding_cache_for(backend_name).stats()
+
+    def warmup(self) -> Dict[str, Any]:
+        """
+        Load the embedding model and run one inference
+
+        The first forward pass initializes thread pools and allocator caches,
+        so doing it here keeps that cost off the first user request.
+
+        Returns:
+            Model stats including load time and warmup latency
+        """
+        backend = self.embedding_backend
+        started = time.perf_counter()
+        backend.encode(["Warming up the embedding model."])
+        stats = self.model_stats()
+        stats['warmup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return stats
+
+    def model_stats(self) -> Dict[str, Any]:
+        """Load state, load time and process memory for the embedding model"""
+        stats = embedding_backend_stats(EMBEDDING_MODEL_NAME)
+        stats['model'] = EMBEDDING_MODEL_NAME
+        return stats
+
+    def chunk_document(self, text: TextSource, doc_id: str, chunk_size: Optional[int] = None,
+                       use_model_tokenizer: Optional[bool] = None) -> List[Dict[str, Any]]:
         """
         Smart chunking that preserves narrative structure
         
         Args:
-            text: Document text
+            text: Document text (or a file-like object to read it from)
             doc_id: Document identifier
             chunk_size: Target chunk size in tokens
+            use_model_tokenizer: Count tokens with the embedding model's tokenizer
             
         Returns:
             List of chunks with metadata
         """
-        chunks = []
+        return list(self.iter_chunks(text, doc_id, chunk_size, use_model_tokenizer))
+
+    def iter_chunks(self, source: TextSource, doc_id: str, chunk_size: Optional[int] = None,
+                    use_model_tokenizer: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming chunker - yields chunk records as paragraphs are read
         
-        # Split by paragraphs first to maintain narrative boundaries
-        paragraphs = text.split('\n\n')
+        Chunk boundaries are content-defined: a chunk ends after a paragraph
+        whose hash picks it as a boundary (see _is_chunk_boundary) once the
+        chunk holds a quarter of the budget, or before a paragraph that would
+        overflow the budget. Because the choice depends on the paragraphs and
+        not on where the chunk started, an edit only changes the chunks around
+        it and the rest keep their content-addressed IDs. A chunk's text is
+        joined once when it is emitted, so the cost is linear in the input and
+        only the current chunk is held in memory.
         
-        current_chunk = ""
+        Args:
+            source: Document text or a file-like object with read()
+            doc_id: Document identifier
+            chunk_size: Token budget per chunk (512 words by default, or the
+                model's max sequence length when counting model tokens)
+            use_model_tokenizer: Count tokens with the embedding model's own
+                tokenizer instead of whitespace words (defaults to CHUNK_TOKEN_BUDGET)
+
+        Yields:
+            Chunk dicts with id, text, doc_id, chunk_index, token_count,
+            content_hash, char_start and char_end (character offsets)
+        """
+        if use_model_tokenizer is None:
+            use_model_tokenizer = self.use_model_tokenizer
+        if chunk_size is None:
+            chunk_size = self._model_max_tokens() if use_model_tokenizer else 512
+        count_tokens = self._count_model_tokens if use_model_tokenizer else self._count_words
+
+        min_tokens = chunk_size // 4
+        target_tokens = max(1, chunk_size // 2)
+
+        current_paras: List[str] = []
+        current_start = 0
         current_tokens = 0
         chunk_index = 0
-        
-        for para in paragraphs:
-            para_tokens = len(para.split())
-            
-            # If paragraph fits in current chunk, add it
-            if current_tokens + para_tokens <= chunk_size:
-                current_chunk += para + "\n\n"
-                current_tokens += para_tokens
-            else:
-                # Save current chunk if it has content
-                if current_chunk.strip():
-                    chunk_id = self._generate_chunk_id(doc_id, chunk_index)
-                    chunks.append({
-                        'id': chunk_id,
-                        'text': current_chunk.strip(),
-                        'doc_id': doc_id,
-                        'chunk_index': chunk_index,
-                        'token_count': current_tokens,
-                        'type': 'narrative'
-                    })
+        seen_hashes: Dict[str, int] = {}
+
+        # Split by paragraphs first to maintain narrative boundaries
+        for para, para_start in self._iter_paragraphs(source):
+            para_tokens = count_tokens(para)
+
+            # Never let a chunk overflow the budget (a single longer paragraph
+            # still becomes a chunk of its own)
+            if current_paras and current_tokens + para_tokens > chunk_size:
+                if any(p.strip() for p in current_paras):
+                    yield self._emit_chunk(current_paras, current_start, doc_id, chunk_index,
+                                           current_tokens, seen_hashes)
                     chunk_index += 1
-                
-                # Start new chunk with current paragraph
-                current_chunk = para + "\n\n"
-                current_tokens = para_tokens
-        
+                current_paras = []
+                current_tokens = 0
+
+            if not current_paras:
+                current_start = para_start
+            current_paras.append(para)
+            current_tokens += para_tokens
+
+            if current_tokens >= min_tokens and self._is_chunk_boundary(para, para_tokens, target_tokens):
+                if any(p.strip() for p in current_paras):
+                    yield self._emit_chunk(current_paras, current_start, doc_id, chunk_index,
+                                           current_tokens, seen_hashes)
+                    chunk_index += 1
+                current_paras = []
+                current_tokens = 0
+
         # Don't forget the last chunk
-        if current_chunk.strip():
-            chunk_id = self._generate_chunk_id(doc_id, chunk_index)
-            chunks.append({
-                'id': chunk_id,
-                'text': current_chunk.strip(),
-                'doc_id': doc_id,
-                'chunk_index': chunk_index,
-                'token_count': current_tokens,
-                'type': 'narrative'
-            })
+        if any(p.strip() for p in current_paras):
+            yield self._emit_chunk(current_paras, current_start, doc_id, chunk_index,
+                                   current_tokens, seen_hashes)
+
+    @staticmethod
+    def _is_chunk_boundary(para: str, para_tokens: int, target_tokens: int) -> bool:
+        """
+        Whether a chunk may end after this paragraph, decided by its text alone
+
+        The paragraph's hash is compared against its share of target_tokens, so
+        boundaries fall about once per target_tokens whatever the paragraph
+        lengths, and the same paragraph is always (or never) a boundary.
+        """
+        if not para_tokens:
+            return False
+        fingerprint = zlib.crc32(para.strip().encode('utf-8')) / 2 ** 32
+        return fingerprint < para_tokens / target_tokens
+
+    def _iter_paragraphs(self, source: TextSource, block_size: int = 65536) -> Iterator[Tuple[str, int]]:
+        """
+        Incrementally split a text stream on blank lines
+        
+        Produces exactly the pieces of text.split('\n\n') together with each
+        piece's character offset, without materializing the whole text.
+        """
+        if isinstance(source, str):
+            # Slicing a resident string is cheaper than re-reading it in blocks
+            offset = 0
+            while True:
+                idx = source.find('\n\n', offset)
+                if idx == -1:
+                    yield source[offset:], offset
+                    return
+                yield source[offset:idx], offset
+                offset = idx + 2
         
-        return chunks
+        pending: List[str] = []
+        para_start = 0
+        carry = ''
+        while True:
+            block = source.read(block_size)
+            if not block:
+                break
+            data = carry + block
+            carry = ''
+            pos = 0
+            while True:
+                idx = data.find('\n\n', pos)
+                if idx == -1:
+                    break
+                pending.append(data[pos:idx])
+                para = ''.join(pending)
+                pending = []
+                yield para, para_start
+                para_start += len(para) + 2
+                pos = idx + 2
+            rest = data[pos:]
+            # A trailing newline may pair with a leading one in the next block
+            if rest.endswith('\n'):
+                carry = '\n'
+                rest = rest[:-1]
+            if rest:
+                pending.append(rest)
+
+        pending.append(carry)
+        yield ''.join(pending), para_start
+
+    def _emit_chunk(self, paras: List[str], start: int, doc_id: str, chunk_index: int,
+                    token_count: int, seen_hashes: Dict[str, int]) -> Dict[str, Any]:
+        """Join a chunk's paragraphs once and attach its character offsets"""
+        joined = '\n\n'.join(paras)
+        text = joined.strip()
+        char_start = start + (len(joined) - len(joined.lstrip()))
+
+        chunk = self._make_chunk(text, doc_id, chunk_index, token_count, seen_hashes)
+        chunk['char_start'] = char_start
+        chunk['char_end'] = char_start + len(text)
+        return chunk
+
+    def _count_words(self, text: str) -> int:
+        return len(text.split())
+
+    def _count_model_tokens(self, text: str) -> int:
+        """Token count under the embedding model's own tokenizer"""
+        if not text.strip():
+            return 0
+        return self.embedding_backend.count_tokens(text)
+
+    def _model_max_tokens(self) -> int:
+        return self.embedding_backend.max_seq_length or 256
     
-    def add_document(self, text: str, doc_id: str, metadata: Optional[Dict] = None) -> List[str]:
+    def _make_chunk(self, text: str, doc_id: str, chunk_index: int, token_count: int,
+                    seen_hashes: Dict[str, int]) -> Dict[str, Any]:
+        """
+        Build a chunk record whose ID is derived from its content
+
+        Identical passages repeated inside one document (scene breaks, refrains)
+        get an occurrence counter so their IDs stay unique.
+        """
+        content_hash = self._hash_content(text)
+        occurrence = seen_hashes.get(content_hash, 0)
+        seen_hashes[content_hash] = occurrence + 1
+
+        return {
+            'id': self._generate_chunk_id(doc_id, content_hash, occurrence),
+            'text': text,
+            'doc_id': doc_id,
+            'chunk_index': chunk_index,
+            'token_count': token_count,
+            'content_hash': content_hash,
+            'type': 'narrative'
+        }
+    
+    def add_document(self, text: TextSource, doc_id: str, metadata: Optional[Dict] = None) -> List[str]:
         """
         Add a document to the vector store with smart chunking
         
+        Chunks are streamed from the chunker and embedded/inserted in fixed-size
+        batches, so memory stays bounded even for book-length manuscripts.
+
         Args:
-            text: Document text
+            text: Document text (or a file-like object to read it from)
             doc_id: Unique document identifier
             metadata: Additional metadata
             
         Returns:
             List of chunk IDs
         """
-        # Chunk the document
-        chunks = self.chunk_document(text, doc_id)
-        
-        # Prepare data for batch insertion
-        texts = []
-        embeddings = []
         ids = []
-        metadatas = []
+        batch = []
+        collection = self._collection_for_metadata(metadata)
         
-        for chunk in chunks:
-            texts.append(chunk['text'])
+        for chunk in self.iter_chunks(text, doc_id):
             ids.append(chunk['id'])
+            batch.append(chunk)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                self._insert_chunks(batch, doc_id, metadata, collection)
+                batch = []
+
+        if batch:
+            self._insert_chunks(batch, doc_id, metadata, collection)
+
+        self._set_doc_chunks(doc_id, ids, collection.name)
+        self._refresh_document_vector(doc_id, ids, collection, metadata)
+        return ids
+
+    def _insert_chunks(self, chunks: List[Dict[str, Any]], doc_id: str, metadata: Optional[Dict] = None,
+                       collection=None):
+        """Embed a batch of chunks and add them to the collection (routed by user_id by default)"""
+        metadatas = [self._build_chunk_metadata(chunk, doc_id, metadata) for chunk in chunks]
+        registered = []
+        if self.deduplicator is not None:
+            # Near-duplicates become references; only the rest are embedded
+            chunks, metadatas, registered = self._split_duplicates(chunks, metadatas)
+            if not chunks:
+                return
+        texts = [chunk['text'] for chunk in chunks]
+        
+        try:
+            # Generate embeddings in batch
+            embeddings = self._encode(texts).tolist()
             
-            # Combine chunk metadata with document metadata
-            chunk_meta = {
-                'doc_id': doc_id,
-                'chunk_index': chunk['chunk_index'],
-                'token_count': chunk['token_count'],
-                'type': chunk['type'],
-                'indexed_at': datetime.now().isoformat()
-            }
-            if metadata:
-                chunk_meta.update(metadata)
-            metadatas.append(chunk_meta)
+            # Add to collection
+            self._collection_add(
+                collection or self._collection_for_metadata(metadata),
+                ids=[chunk['id'] for chunk in chunks],
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=metadatas
+            )
+        except Exception:
+            # Never leave LSH entries pointing at chunks that were not stored
+            if registered:
+                self.deduplicator.remove_canonicals(registered)
+            raise
+
+    def _split_duplicates(self, chunks: List[Dict[str, Any]], metadatas: List[Dict[str, Any]]
+                          ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[str]]:
+        """
+        Store near-duplicates of existing chunks as references
         
-        # Generate embeddings in batch
-        embeddings = self.embedding_model.encode(texts).tolist()
+        Returns:
+            (chunks to embed, their metadatas, IDs newly registered as canonical)
+        """
+        self._ensure_dedup_scopes(metadatas)
+        kept, kept_metadatas, registered, references = [], [], [], []
+        for chunk, chunk_meta in zip(chunks, metadatas):
+            if self.deduplicator.is_canonical(chunk['id']):
+                kept.append(chunk)
+                kept_metadatas.append(chunk_meta)
+                continue
+            signature = self.deduplicator.signature(chunk['text'])
+            scope = self.deduplicator.scope_for(chunk_meta)
+            canonical_id = self.deduplicator.find_duplicate(signature, scope, exclude=chunk['id'])
+            if canonical_id is None:
+                # Registered before insertion so later chunks in the batch can match it
+                self.deduplicator.add_canonical(chunk['id'], signature, scope, persist=False)
+                registered.append(chunk['id'])
+                kept.append(chunk)
+                kept_metadatas.append(chunk_meta)
+            else:
+                references.append({'id': chunk['id'], 'canonical_id': canonical_id,
+                                   'document': chunk['text'], 'metadata': chunk_meta})
+
+        if registered:
+            self.deduplicator.persist_canonicals(registered)
+            # A chunk that was a reference before is canonical now
+            self.deduplicator.remove_references(registered)
+        if references:
+            self.deduplicator.add_references(references)
+            if self._keyword_index_live:
+                self.keyword_index.add([row['id'] for row in references],
+                                       [row['document'] for row in references],
+                                       [row['metadata'] for row in references])
+        return kept, kept_metadatas, registered
+
+    def _ensure_dedup_scopes(self, metadatas: List[Dict[str, Any]]):
+        """
+        Load the LSH index of each user the chunks belong to (once per user)
         
-        # Add to collection
-        self.collection.add(
+        Signatures come from the dedup side file. Only a user whose signatures
+        were never persisted (stores from before they were) has their own
+        chunks read back and hashed, once.
+        """
+        pending = {}
+        for chunk_meta in metadatas:
+            scope = self.deduplicator.scope_for(chunk_meta)
+            if scope not in pending and not self.deduplicator.scope_loaded(scope):
+                pending[scope] = (chunk_meta or {}).get('user_id')
+        for scope, user_id in pending.items():
+            with self._dedup_lock:
+                if self.deduplicator.load_scope(scope):
+                    continue
+                started = time.time()
+                where = {"user_id": user_id} if user_id is not None else None
+                page_size = 2000
+                for collection in self._collections_for_filter(where):
+                    offset = 0
+                    while True:
+                        page = collection.get(where=where, include=["documents", "metadatas"],
+                                              limit=page_size, offset=offset)
+                        rows = [(chunk_id, document, chunk_meta) for chunk_id, document, chunk_meta
+                                in zip(page['ids'], page['documents'], page['metadatas'])
+                                if self.deduplicator.scope_for(chunk_meta) == scope]
+                        if rows:
+                            self.deduplicator.add_canonicals(*map(list, zip(*rows)))
+                        if len(page['ids']) < page_size:
+                            break
+                        offset += page_size
+                self.deduplicator.mark_scope_built(scope)
+                logger.info(f"✅ Dedup index built for scope '{scope}' in {time.time() - started:.1f}s")
+
+    def _promote_references(self, collection, canonical_ids: List[str]):
+        """
+        Before canonical chunks are deleted, make one reference of each the new
+        canonical chunk (reusing the stored embedding) and re-point the rest
+        """
+        references = self.deduplicator.references_for_canonicals(canonical_ids)
+        if not references:
+            return
+
+        vectors = self._stored_vectors(collection, list(references))
+        successors = []
+        for canonical_id, rows in references.items():
+            successor = rows[0]
+            successors.append((successor, vectors.get(canonical_id)))
+            self.deduplicator.remove_references([successor['id']])
+            self.deduplicator.repoint(canonical_id, successor['id'])
+
+        missing = [row['document'] for row, vector in successors if vector is None]
+        if missing:
+            # Canonical vector already gone (e.g. an interrupted delete): re-embed
+            encoded = iter(self._encode(missing))
+            successors = [(row, vector if vector is not None else next(encoded)) for row, vector in successors]
+        
+        self._collection_add(
+            collection,
+            ids=[row['id'] for row, _ in successors],
+            embeddings=[np.asarray(vector, dtype=np.float32).tolist() for _, vector in successors],
+            documents=[row['document'] for row, _ in successors],
+            metadatas=[row['metadata'] for row, _ in successors]
+        )
+
+    def _stored_vectors(self, collection, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored embeddings by chunk ID (missing IDs are left out)"""
+        if self.quantized_index is not None:
+            index = self._quantized_for(collection)
+            present = [chunk_id for chunk_id in ids if chunk_id in index.id_to_row]
+            return dict(zip(present, index.get_vectors(present)))
+        fetched = collection.get(ids=ids, include=["embeddings"])
+        return {chunk_id: np.asarray(vector) for chunk_id, vector in zip(fetched['ids'], fetched['embeddings'])}
+
+    def _collection_add(self, collection, ids: List[str], embeddings: List[List[float]],
+                        documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Insert chunks, routing vectors to the quantized index in compact mode"""
+        if self.quantized_index is not None:
+            self._quantized_for(collection).add(ids, np.asarray(embeddings, dtype=np.float32))
+            embeddings = [[0.0]] * len(ids)
+        self._invalidate_filter_ids(collection)
+        collection.add(
             embeddings=embeddings,
-            documents=texts,
+            documents=documents,
             metadatas=metadatas,
             ids=ids
         )
-        
+        if self._keyword_index_live:
+            self.keyword_index.add(ids, documents, metadatas)
+        if self.deduplicator is not None:
+            # Persisted for every insert, so no user's index has to be rebuilt later
+            self.deduplicator.add_canonicals(ids, documents, metadatas)
+    
+    def _collection_delete(self, collection, ids: List[str]):
+        """Delete chunks (or dedup references) from the collection and the side indexes"""
+        if not ids:
+            return
+        if self._keyword_index_live:
+            self.keyword_index.remove(ids)
+        if self.deduplicator is not None:
+            # References only live in the side file; canonical chunks hand their
+            # embedding to a surviving reference before they go
+            removed = set(self.deduplicator.remove_references(ids))
+            ids = [chunk_id for chunk_id in ids if chunk_id not in removed]
+            if not ids:
+                return
+            self._promote_references(collection, ids)
+            self.deduplicator.remove_canonicals(ids)
+        self._invalidate_filter_ids(collection)
+        collection.delete(ids=ids)
+        if self.quantized_index is not None:
+            self._quantized_for(collection).remove(ids)
+
+    def _collection_update(self, collection, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Metadata-only update of chunks or dedup references"""
+        if self.deduplicator is not None:
+            references = self.deduplicator.get_references(ids)
+            if references:
+                pairs = list(zip(ids, metadatas))
+                self.deduplicator.update_reference_metadata(
+                    [chunk_id for chunk_id, _ in pairs if chunk_id in references],
+                    [chunk_meta for chunk_id, chunk_meta in pairs if chunk_id in references]
+                )
+                ids = [chunk_id for chunk_id, _ in pairs if chunk_id not in references]
+                metadatas = [chunk_meta for chunk_id, chunk_meta in pairs if chunk_id not in references]
+        if ids:
+            self._invalidate_filter_ids(collection)
+            collection.update(ids=ids, metadatas=metadatas)
+
+    def _quantized_for(self, collection, adopt: bool = True) -> QuantizedIndex:
+        """
+        Quantized index holding a collection's vectors
+
+        Partition indexes are opened on first use and kept for as many
+        partitions as the collection router keeps handles open. A new, empty
+        partition index adopts the partition's vectors from the base index,
+        where they were kept before indexes were per collection.
+        """
+        if collection.name == self.collection_router.base_name:
+            return self.quantized_index
+        with self._quantized_lock:
+            index = self._quantized_indexes.get(collection.name)
+            if index is not None:
+                self._quantized_indexes.move_to_end(collection.name)
+                return index
+            index = self._quantized_open.get(collection.name)
+            if index is None:
+                index = quantized_index_from_env(EMBEDDING_DIMENSION, self._quantized_directory, collection.name)
+                if adopt and not len(index) and len(self.quantized_index) and collection.count():
+                    self._adopt_quantized_vectors(collection, index, keep_in_base=False)
+                self._quantized_open[collection.name] = index
+            self._quantized_indexes[collection.name] = index
+            while len(self._quantized_indexes) > self.collection_router.max_open:
+                # Every write is flushed, so a closed index just reloads from disk
+                self._quantized_indexes.popitem(last=False)
+            return index
+
+    def _adopt_quantized_vectors(self, collection, index: QuantizedIndex, keep_in_base: bool,
+                                 page_size: int = 2000) -> int:
+        """Copy a collection's vectors from the base index into its own index"""
+        adopted = 0
+        offset = 0
+        while True:
+            page = collection.get(include=[], limit=page_size, offset=offset)
+            present = [chunk_id for chunk_id in page['ids'] if chunk_id in self.quantized_index]
+            if present:
+                index.add(present, self.quantized_index.get_vectors(present))
+                if not keep_in_base:
+                    self.quantized_index.remove(present)
+                adopted += len(present)
+            if len(page['ids']) < page_size:
+                break
+            # Removing from the base index leaves the collection itself unchanged
+            offset += page_size
+        if adopted:
+            logger.info(f"📦 Moved {adopted} quantized vectors into {collection.name}")
+        return adopted
+
+    def _filter_id_set(self, collection, where: Dict) -> Set[str]:
+        """IDs of a collection's chunks matching a metadata filter (cached until it changes)"""
+        key = (collection.name, json.dumps(where, sort_keys=True, default=str))
+        with self._filter_lock:
+            cached = self._filter_ids.get(key)
+            if cached is not None:
+                self._filter_ids.move_to_end(key)
+                return cached
+            generation = self._filter_generations.get(collection.name, 0)
+        ids = set(collection.get(where=where, include=[])['ids'])
+        with self._filter_lock:
+            if self._filter_generations.get(collection.name, 0) == generation:
+                self._filter_ids[key] = ids
+                while len(self._filter_ids) > self.max_filter_sets:
+                    self._filter_ids.popitem(last=False)
         return ids
+
+    def _invalidate_filter_ids(self, collection=None):
+        """Drop cached filter ID sets of a collection (all collections if None)"""
+        with self._filter_lock:
+            if collection is None:
+                self._filter_ids.clear()
+                for name in self._filter_generations:
+                    self._filter_generations[name] += 1
+                return
+            name = collection.name
+            self._filter_generations[name] = self._filter_generations.get(name, 0) + 1
+            for key in [key for key in self._filter_ids if key[0] == name]:
+                del self._filter_ids[key]
+
+    def _collection_query(self, collection, query_embeddings: List[List[float]], n_results: int,
+                          where: Optional[Dict], ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Nearest-neighbour query returning Chroma's response shape
+        
+        In compact mode the quantized index does candidate search and exact
+        re-rank; Chroma only resolves the metadata filter and the documents.
+        ids optionally restricts the search to those chunks.
+        """
+        if self.quantized_index is None:
+            if ids is not None:
+                return collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=n_results,
+                    where=where,
+                    ids=ids
+                )
+            return collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=where
+            )
+
+        allowed_ids = self._filter_id_set(collection, where) if where else None
+        if ids is not None:
+            allowed_ids = set(ids) if allowed_ids is None else allowed_ids & set(ids)
+
+        index = self._quantized_for(collection)
+        hits = [index.search(np.asarray(embedding), n_results, allowed_ids)
+                for embedding in query_embeddings]
+        hit_ids = sorted({chunk_id for query_hits in hits for chunk_id, _ in query_hits})
+        records = {}
+        if hit_ids:
+            fetched = collection.get(ids=hit_ids, include=["documents", "metadatas"])
+            records = {
+                chunk_id: (document, chunk_meta)
+                for chunk_id, document, chunk_meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])
+            }
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for query_hits in hits:
+            query_hits = [(chunk_id, score) for chunk_id, score in query_hits if chunk_id in records]
+            results['ids'].append([chunk_id for chunk_id, _ in query_hits])
+            results['documents'].append([records[chunk_id][0] for chunk_id, _ in query_hits])
+            results['metadatas'].append([records[chunk_id][1] for chunk_id, _ in query_hits])
+            results['distances'].append([1 - score for _, score in query_hits])
+        return results
     
     def search(self, query: str, n_results: int = 5, filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """
@@ -177,29 +789,487 @@ class VectorStore:
         Returns:
             List of results with text, metadata, and scores
         """
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(query).tolist()
+        return self.search_many([query], n_results=n_results, filters=filter_dict)[0]
+
+    def search_many(self, queries: List[str], n_results: int = 5,
+                    filters: Optional[Union[Dict, List[Optional[Dict]]]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Batched semantic search - one embedding pass for all queries
+
+        Args:
+            queries: Search queries
+            n_results: Number of results to return per query
+            filters: One metadata filter shared by every query, or a list with
+                     one filter (or None) per query
+
+        Returns:
+            Per-query result lists, in the same order as queries
+        """
+        if not queries:
+            return []
+
+        # Generate all query embeddings in a single batched forward pass
+        query_embeddings = self._encode(queries).tolist()
         
-        # Perform search
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=filter_dict
+        # Queries sharing a filter go to Chroma together in one query call
+        if filters is None or isinstance(filters, dict):
+            groups = [(filters, list(range(len(queries))))]
+        else:
+            if len(filters) != len(queries):
+                raise ValueError("filters must have one entry per query")
+            grouped: Dict[str, Tuple[Optional[Dict], List[int]]] = {}
+            for position, where in enumerate(filters):
+                key = json.dumps(where, sort_keys=True, default=str)
+                grouped.setdefault(key, (where, []))[1].append(position)
+            groups = list(grouped.values())
+
+        # With dedup on, over-fetch so collapsing near-duplicates still fills n_results
+        fetch = n_results * 2 if self.deduplicator is not None else n_results
+
+        all_results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for where, positions in groups:
+            # Partitioned storage: a user- or document-scoped filter hits one collection,
+            # anything broader fans out and the per-collection hits are merged
+            for collection in self._collections_for_filter(where):
+                results = self._collection_query(
+                    collection,
+                    [query_embeddings[position] for position in positions],
+                    fetch,
+                    where or None
+                )
+                for row, position in enumerate(positions):
+                    all_results[position].extend(self._format_query_results(results, row))
+
+            if self.deduplicator is not None:
+                self._add_reference_hits(where, positions, query_embeddings, fetch, all_results)
+
+        if self.collection_router.partitioned or self.deduplicator is not None:
+            for position, merged in enumerate(all_results):
+                merged.sort(key=lambda result: result['distance'])
+                if self.deduplicator is not None:
+                    merged = self.deduplicator.collapse(merged)
+                all_results[position] = merged[:n_results]
+
+        return all_results
+
+    def _add_reference_hits(self, where: Optional[Dict], positions: List[int], query_embeddings: List[List[float]],
+                            n_results: int, all_results: List[List[Dict[str, Any]]]):
+        """
+        Document-scoped search (doc_id equality or $in): a document's
+        deduplicated chunks have no row of their own, so search their
+        canonical chunks and report the hits as the document's chunks
+        """
+        doc_ids = _filter_values(where, 'doc_id')
+        if not doc_ids:
+            return
+        user_id = _filter_value(where, 'user_id')
+        references: Dict[str, Dict[str, Any]] = {}
+        for doc_id in doc_ids:
+            references.update(self.deduplicator.references_for_doc(doc_id))
+        if not references:
+            return
+
+        # Canonical chunks to search, per collection holding them
+        by_collection: Dict[str, Tuple[Any, Dict[str, List[Dict[str, Any]]]]] = {}
+        for row in references.values():
+            if user_id is not None and row['metadata'].get('user_id') != user_id:
+                continue
+            collection = self._collection_for_metadata(row['metadata'])
+            _, by_canonical = by_collection.setdefault(collection.name, (collection, {}))
+            by_canonical.setdefault(row['canonical_id'], []).append(row)
+
+        for collection, by_canonical in by_collection.values():
+            results = self._collection_query(
+                collection,
+                [query_embeddings[position] for position in positions],
+                min(n_results, len(by_canonical)),
+                None,
+                ids=list(by_canonical)
+            )
+            for row, position in enumerate(positions):
+                for hit in self._format_query_results(results, row):
+                    for reference in by_canonical.get(hit['id'], []):
+                        all_results[position].append({
+                            'id': reference['id'],
+                            'text': reference['document'],
+                            'metadata': reference['metadata'],
+                            'distance': hit['distance'],
+                            'score': hit['score'],
+                            'canonical_id': hit['id']
+                        })
+
+    def keyword_search(self, query: str, n_results: int = 5,
+                       filter_dict: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """
+        BM25 keyword search over the indexed chunks
+
+        Args:
+            query: Search query (exact terms, e.g. character names)
+            n_results: Number of results to return
+            filter_dict: Equality filter on doc_id / user_id
+
+        Returns:
+            List of results with text, metadata, and BM25 scores, best first
+        """
+        if self.keyword_index is None:
+            return []
+        self._ensure_keyword_index()
+        hits = self.keyword_index.search(query, n_results, filter_dict)
+        if not hits:
+            return []
+
+        hit_ids = [chunk_id for chunk_id, _ in hits]
+        records = {}
+        for collection in self._collections_for_filter(filter_dict):
+            fetched = collection.get(ids=hit_ids, include=["documents", "metadatas"])
+            for chunk_id, document, chunk_meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas']):
+                records[chunk_id] = (document, chunk_meta)
+            if len(records) == len(hit_ids):
+                break
+        if self.deduplicator is not None and len(records) < len(hit_ids):
+            for chunk_id, row in self.deduplicator.get_references(
+                    [chunk_id for chunk_id in hit_ids if chunk_id not in records]).items():
+                records[chunk_id] = (row['document'], row['metadata'])
+
+        results = [
+            {'id': chunk_id, 'text': records[chunk_id][0], 'metadata': records[chunk_id][1], 'score': score}
+            for chunk_id, score in hits if chunk_id in records
+        ]
+        if self.deduplicator is not None:
+            results = self.deduplicator.collapse(results)
+        return results
+
+    def _ensure_keyword_index(self):
+        """Load every stored chunk into the BM25 index (once)"""
+        if self._keyword_index_ready:
+            return
+        with self._keyword_index_lock:
+            if self._keyword_index_ready:
+                return
+            self._keyword_index_live = True
+            page_size = 2000
+            for collection in self.collection_router.all_collections():
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                    self.keyword_index.add(page['ids'], page['documents'], page['metadatas'])
+                    if len(page['ids']) < page_size:
+                        break
+                    offset += page_size
+            if self.deduplicator is not None:
+                # Deduplicated chunks still need exact-term (and doc-scoped) matches
+                references = self.deduplicator.all_references()
+                self.keyword_index.add([row['id'] for row in references],
+                                       [row['document'] for row in references],
+                                       [row['metadata'] for row in references])
+            self._keyword_index_ready = True
+            logger.info(f"✅ Keyword index built: {self.keyword_index.stats()}")
+
+    def rank_documents(self, query: str, user_id: Any, n_results: int = 10) -> List[Dict[str, Any]]:
+        """
+        Rank all of a user's documents against a query by document embedding
+        
+        Args:
+            query: Search query
+            user_id: Owner of the documents
+            n_results: Number of documents to return
+
+        Returns:
+            List of {'doc_id', 'score', 'title', 'chunks'}, best first
+        """
+        self._ensure_document_index()
+        if not self.document_index.documents(user_id):
+            return []
+        query_embedding = self._encode([query])[0]
+        return self.document_index.rank(query_embedding, user_id, n_results)
+
+    def has_documents(self, user_id: Any) -> bool:
+        """Whether any of the user's documents are in the vector index"""
+        self._ensure_document_index()
+        return bool(self.document_index.documents(user_id))
+
+    def _refresh_document_vector(self, doc_id: str, chunk_ids: List[str], collection,
+                                 metadata: Optional[Dict]):
+        """Recompute a document's embedding from its stored chunk vectors"""
+        if not self._document_index_live:
+            return
+        vectors = self._stored_vectors(collection, chunk_ids) if chunk_ids else {}
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in vectors]
+        if missing and self.deduplicator is not None:
+            # Deduplicated chunks share their canonical chunk's vector
+            references = self.deduplicator.get_references(missing)
+            canonical = self._stored_vectors(collection, sorted({row['canonical_id'] for row in references.values()}))
+            for chunk_id, row in references.items():
+                if row['canonical_id'] in canonical:
+                    vectors[chunk_id] = canonical[row['canonical_id']]
+        self.document_index.set(
+            doc_id,
+            (metadata or {}).get('user_id'),
+            centroid(np.asarray(list(vectors.values()))) if vectors else None,
+            _document_info(metadata, len(chunk_ids))
         )
+
+    def _ensure_document_index(self):
+        """Build document embeddings from every stored chunk vector (once)"""
+        if self._document_index_ready:
+            return
+        with self._document_index_lock:
+            if self._document_index_ready:
+                return
+            self._document_index_live = True
+            # doc_id -> [vector sum, chunk count, metadata of one chunk]
+            sums: Dict[str, List[Any]] = {}
+
+            def accumulate(doc_vectors, metadatas):
+                for vector, chunk_meta in zip(doc_vectors, metadatas):
+                    entry = sums.setdefault(chunk_meta.get('doc_id'), [np.zeros(EMBEDDING_DIMENSION, np.float32), 0, chunk_meta])
+                    entry[0] += np.asarray(vector, dtype=np.float32)
+                    entry[1] += 1
+
+            page_size = 2000
+            # Deduplicated chunks count with their canonical chunk's vector
+            references = self.deduplicator.all_references() if self.deduplicator is not None else []
+            wanted = {row['canonical_id'] for row in references}
+            canonical_vectors: Dict[str, np.ndarray] = {}
+            for collection in self.collection_router.all_collections():
+                offset = 0
+                while True:
+                    if self.quantized_index is None:
+                        page = collection.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+                        page_vectors = page['embeddings']
+                    else:
+                        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+                        page_vectors = self._quantized_for(collection).get_vectors(page['ids'])
+                    accumulate(page_vectors, page['metadatas'])
+                    if wanted:
+                        canonical_vectors.update((chunk_id, np.asarray(vector))
+                                                 for chunk_id, vector in zip(page['ids'], page_vectors)
+                                                 if chunk_id in wanted)
+                    if len(page['ids']) < page_size:
+                        break
+                    offset += page_size
+            if references:
+                references = [row for row in references if row['canonical_id'] in canonical_vectors]
+                accumulate([canonical_vectors[row['canonical_id']] for row in references],
+                           [row['metadata'] for row in references])
+
+            for doc_id, (total, count, chunk_meta) in sums.items():
+                if doc_id is None or doc_id in self.document_index:
+                    # Written while the scan ran; that vector is newer
+                    continue
+                self.document_index.set(doc_id, chunk_meta.get('user_id'),
+                                        centroid(total[None, :] / count), _document_info(chunk_meta, count))
+            self._document_index_ready = True
+            logger.info(f"✅ Document index built: {self.document_index.stats()}")
+
+    def _collection_for_metadata(self, metadata: Optional[Dict]):
+        """Collection a document's chunks are written to, by its user_id"""
+        return self.collection_router.collection_for_user((metadata or {}).get('user_id'))
+
+    def _collection_for_doc(self, doc_id: str):
+        """Collection currently holding a document's chunks (None if unknown)"""
+        if not self.collection_router.partitioned:
+            return self.collection
+        with self._chunk_index_lock:
+            self._ensure_chunk_index()
+            name = self._doc_collections.get(doc_id)
+        return self.collection_router.get(name) if name else None
+
+    def _collections_for_filter(self, where: Optional[Dict]) -> List[Any]:
+        """Collections a query with this metadata filter has to search"""
+        if not self.collection_router.partitioned:
+            return [self.collection]
+        user_id = _filter_value(where, 'user_id')
+        if user_id is not None:
+            return [self.collection_router.collection_for_user(user_id)]
+        doc_id = _filter_value(where, 'doc_id')
+        if doc_id is not None:
+            collection = self._collection_for_doc(doc_id)
+            return [collection] if collection is not None else []
+        return self.collection_router.all_collections()
+
+    def export_snapshot(self, batch_size: int = 2000) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Collect every stored chunk for an index snapshot
+
+        Returns:
+            (meta, sections): 'vectors' is a float32 (n, dim) array and 'chunks'
+            holds the matching ids, documents and metadatas
+        """
+        ids, documents, metadatas, vectors = [], [], [], []
+        include = ["documents", "metadatas"] if self.quantized_index is not None else \
+            ["embeddings", "documents", "metadatas"]
+        for collection in self.collection_router.all_collections():
+            offset = 0
+            while True:
+                page = collection.get(include=include, limit=batch_size, offset=offset)
+                if page['ids']:
+                    ids.extend(page['ids'])
+                    documents.extend(page['documents'])
+                    metadatas.extend(page['metadatas'])
+                    if self.quantized_index is not None:
+                        # Chroma only holds placeholders; full vectors live in the side file
+                        vectors.append(self._quantized_for(collection).get_vectors(page['ids']))
+                    else:
+                        vectors.append(np.asarray(page['embeddings'], dtype=np.float32))
+                if len(page['ids']) < batch_size:
+                    break
+                offset += batch_size
+
+        meta = {
+            'model': EMBEDDING_MODEL_NAME,
+            'dimension': EMBEDDING_DIMENSION,
+            'chunks': len(ids)
+        }
+        sections = {
+            'vectors': np.concatenate(vectors) if vectors else np.zeros((0, EMBEDDING_DIMENSION), np.float32),
+            'chunks': {'ids': ids, 'documents': documents, 'metadatas': metadatas}
+        }
+        if self.deduplicator is not None:
+            sections['chunk_refs'] = self.deduplicator.all_references()
+            meta['chunk_refs'] = len(sections['chunk_refs'])
+        return meta, sections
+
+    def restore_snapshot(self, snapshot, batch_size: int = 1000) -> int:
+        """
+        Load chunks and vectors from an IndexSnapshot without re-embedding
+
+        Only restores into an empty store; chunks are routed with the current
+        partitioning, so a snapshot taken under another strategy still loads.
+
+        Returns:
+            Number of chunks restored
+        """
+        if snapshot.meta.get('model') != EMBEDDING_MODEL_NAME or \
+                snapshot.meta.get('dimension') != EMBEDDING_DIMENSION:
+            logger.warning(f"⚠️ Snapshot vectors are from {snapshot.meta.get('model')}, "
+                           f"not {EMBEDDING_MODEL_NAME}; skipping vector restore")
+            return 0
+        if any(collection.count() for collection in self.collection_router.all_collections()):
+            logger.info("Vector store already has data; skipping snapshot restore")
+            return 0
+
+        chunks = snapshot.json('chunks')
+        vectors = snapshot.array('vectors')
+        references = snapshot.json('chunk_refs') if 'chunk_refs' in snapshot else []
+        restored = len(chunks['ids'])
+
+        # Group rows by destination collection, then insert in batches
+        by_collection: Dict[str, List[int]] = {}
+        for row, chunk_meta in enumerate(chunks['metadatas']):
+            by_collection.setdefault(self._collection_for_metadata(chunk_meta).name, []).append(row)
+
+        if references and self.deduplicator is None:
+            # Dedup is off here: store the references as chunks with their canonical's vector
+            row_of = {chunk_id: row for row, chunk_id in enumerate(chunks['ids'])}
+            references = [reference for reference in references if reference['canonical_id'] in row_of]
+            chunks['ids'].extend(reference['id'] for reference in references)
+            chunks['documents'].extend(reference['document'] for reference in references)
+            chunks['metadatas'].extend(reference['metadata'] for reference in references)
+            vector_rows = list(range(restored)) + [row_of[reference['canonical_id']] for reference in references]
+            for row in range(restored, len(chunks['ids'])):
+                by_collection.setdefault(self._collection_for_metadata(chunks['metadatas'][row]).name, []).append(row)
+            restored = len(chunks['ids'])
+            references = []
+        else:
+            vector_rows = None
+
+        for name, rows in by_collection.items():
+            collection = self.collection_router.get(name)
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                source_rows = batch if vector_rows is None else [vector_rows[row] for row in batch]
+                self._collection_add(
+                    collection,
+                    ids=[chunks['ids'][row] for row in batch],
+                    embeddings=np.asarray(vectors[source_rows], dtype=np.float32).tolist(),
+                    documents=[chunks['documents'][row] for row in batch],
+                    metadatas=[chunks['metadatas'][row] for row in batch]
+                )
+
+        if references:
+            self.deduplicator.add_references(references)
+            restored += len(references)
+
+        with self._chunk_index_lock:
+            # Rebuilt from the restored collections on next use
+            self._doc_chunks = None
+            self._chunk_positions = {}
+            self._doc_collections = {}
+        with self._document_index_lock:
+            self._document_index_ready = False
+            self._document_index_live = False
+            self.document_index.clear()
+        return restored
+
+    def dedup_stats(self, user_id: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+        """Storage saved by near-duplicate deduplication, overall or for one user"""
+        if self.deduplicator is None:
+            return None
+        if user_id is not None:
+            self._ensure_dedup_scopes([{'user_id': user_id}])
+        return self.deduplicator.stats(user_id)
+
+    def migrate_to_partitions(self, batch_size: int = 500, delete_source: bool = True) -> Dict[str, Any]:
+        """
+        Move chunks from the single base collection into per-user partitions
         
-        # Format results
+        Args:
+            batch_size: Chunks copied per page
+            delete_source: Remove migrated chunks from the base collection
+
+        Returns:
+            Migration counts (see CollectionRouter.migrate_single_collection)
+        """
+        result = self.collection_router.migrate_single_collection(batch_size, delete_source)
+        self._invalidate_filter_ids()
+        if self.quantized_index is not None:
+            # Chroma only copied placeholders; the vectors follow their chunks
+            for name in result['partitions']:
+                collection = self.collection_router.get(name)
+                self._adopt_quantized_vectors(collection, self._quantized_for(collection, adopt=False),
+                                              keep_in_base=not delete_source)
+        with self._chunk_index_lock:
+            # Chunks changed collections; rebuild the doc -> collection map on next use
+            self._doc_chunks = None
+            self._chunk_positions = {}
+            self._doc_collections = {}
+        return result
+
+    def _format_query_results(self, results: Dict[str, Any], row: int) -> List[Dict[str, Any]]:
+        """Format one query's rows from a Chroma query response"""
         formatted_results = []
-        for i in range(len(results['ids'][0])):
+        for i in range(len(results['ids'][row])):
             formatted_results.append({
-                'id': results['ids'][0][i],
-                'text': results['documents'][0][i],
-                'metadata': results['metadatas'][0][i],
-                'distance': results['distances'][0][i],
-                'score': 1 - results['distances'][0][i]  # Convert distance to similarity score
+                'id': results['ids'][row][i],
+                'text': results['documents'][row][i],
+                'metadata': results['metadatas'][row][i],
+                'distance': results['distances'][row][i],
+                'score': 1 - results['distances'][row][i]  # Convert distance to similarity score
             })
-        
         return formatted_results
     
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, only running the model for cache misses"""
+        return self.embedding_cache.encode(texts, self._encode_uncached)
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """
+        Run the model on cache misses
+
+        When an embedding worker is attached and we are off its event loop
+        (e.g. inside asyncio.to_thread), the texts join the worker's shared
+        micro-batch; otherwise the model runs inline.
+        """
+        worker = self.embedding_worker
+        if worker is not None and worker.can_serve_current_thread():
+            return worker.encode_threadsafe(texts)
+        return self.embedding_backend.encode(texts)
+
+    def attach_embedding_worker(self, worker: Optional[EmbeddingWorker]):
+        """Route model calls through a micro-batching EmbeddingWorker (None detaches)"""
+        self.embedding_worker = worker
+
     def get_context_window(self, chunk_id: str, window_size: int = 2) -> List[Dict[str, Any]]:
         """
         Get surrounding chunks for expanded context
@@ -211,49 +1281,157 @@ class VectorStore:
         Returns:
             List of chunks in order
         """
-        # Get the chunk metadata
-        result = self.collection.get(ids=[chunk_id])
-        if not result['ids']:
-            return []
+        return self.get_context_windows([chunk_id], window_size)[chunk_id]
+
+    def get_context_windows(self, chunk_ids: List[str], window_size: int = 2) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Batched neighbour expansion for many hits
         
-        metadata = result['metadatas'][0]
-        doc_id = metadata['doc_id']
-        chunk_index = metadata['chunk_index']
-        
-        # Calculate range
-        start_index = max(0, chunk_index - window_size)
-        end_index = chunk_index + window_size
-        
-        # Query for chunks in range
-        chunks = self.collection.get(
-            where={
-                "$and": [
-                    {"doc_id": doc_id},
-                    {"chunk_index": {"$gte": start_index}},
-                    {"chunk_index": {"$lte": end_index}}
-                ]
-            }
-        )
+        Neighbour IDs come from the in-memory chunk order index (a list slice per
+        hit); every window is then filled from a single fetch per collection.
         
-        # Format and sort by chunk index
-        formatted_chunks = []
-        for i in range(len(chunks['ids'])):
-            formatted_chunks.append({
-                'id': chunks['ids'][i],
-                'text': chunks['documents'][i],
-                'metadata': chunks['metadatas'][i]
-            })
+        Args:
+            chunk_ids: Central chunk IDs (e.g. the top search hits)
+            window_size: Number of chunks before/after to retrieve
+
+        Returns:
+            Dict mapping each chunk ID to its window of chunks, in document order
+        """
+        windows = {}
+        with self._chunk_index_lock:
+            self._ensure_chunk_index()
+            for chunk_id in chunk_ids:
+                position = self._chunk_positions.get(chunk_id)
+                if position is None:
+                    windows[chunk_id] = []
+                    continue
+                doc_id, index = position
+                ordered = self._doc_chunks[doc_id]
+                windows[chunk_id] = ordered[max(0, index - window_size):index + window_size + 1]
         
-        # Sort by chunk index
-        formatted_chunks.sort(key=lambda x: x['metadata']['chunk_index'])
+            # Group the neighbours by the collection holding their document
+            needed: Dict[str, List[str]] = {}
+            for chunk_id, window in windows.items():
+                if window:
+                    doc_id = self._chunk_positions[chunk_id][0]
+                    name = self._doc_collections.get(doc_id, self.collection.name)
+                    needed.setdefault(name, []).extend(window)
+
+        by_id = {}
+        for name, ids in needed.items():
+            fetched = self.collection_router.get(name).get(
+                ids=list(dict.fromkeys(ids)), include=["documents", "metadatas"]
+            )
+            for i in range(len(fetched['ids'])):
+                by_id[fetched['ids'][i]] = {
+                    'id': fetched['ids'][i],
+                    'text': fetched['documents'][i],
+                    'metadata': fetched['metadatas'][i]
+                }
         
-        return formatted_chunks
+        if self.deduplicator is not None:
+            # Deduplicated neighbours come from the reference store
+            missing = [chunk_id for ids in needed.values() for chunk_id in ids if chunk_id not in by_id]
+            for chunk_id, row in self.deduplicator.get_references(list(dict.fromkeys(missing))).items():
+                by_id[chunk_id] = {'id': chunk_id, 'text': row['document'], 'metadata': row['metadata']}
+
+        return {
+            chunk_id: [by_id[neighbour] for neighbour in window if neighbour in by_id]
+            for chunk_id, window in windows.items()
+        }
+
+    def _ensure_chunk_index(self):
+        """Build the doc_id -> ordered chunk IDs index from the collection(s) (once)"""
+        with self._chunk_index_lock:
+            if self._doc_chunks is not None:
+                return
+
+            indexed: Dict[str, List[Tuple[int, str]]] = {}
+            doc_collections: Dict[str, str] = {}
+            page_size = 5000
+            for collection in self.collection_router.all_collections():
+                offset = 0
+                while True:
+                    page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+                    for chunk_id, meta in zip(page['ids'], page['metadatas']):
+                        if meta and 'doc_id' in meta:
+                            indexed.setdefault(meta['doc_id'], []).append((meta.get('chunk_index', 0), chunk_id))
+                            doc_collections[meta['doc_id']] = collection.name
+                    if len(page['ids']) < page_size:
+                        break
+                    offset += page_size
+
+            if self.deduplicator is not None:
+                for row in self.deduplicator.all_references():
+                    meta = row['metadata']
+                    if 'doc_id' in meta:
+                        indexed.setdefault(meta['doc_id'], []).append((meta.get('chunk_index', 0), row['id']))
+                        doc_collections.setdefault(meta['doc_id'], self._collection_for_metadata(meta).name)
+
+            self._doc_chunks = {}
+            self._chunk_positions = {}
+            self._doc_collections = {}
+            for doc_id, entries in indexed.items():
+                entries.sort()
+                self._set_doc_chunks(doc_id, [chunk_id for _, chunk_id in entries], doc_collections[doc_id])
+
+    def _set_doc_chunks(self, doc_id: str, chunk_ids: Optional[List[str]],
+                        collection_name: Optional[str] = None):
+        """Replace a document's entry in the chunk order index (None removes it)"""
+        with self._chunk_index_lock:
+            if self._doc_chunks is None:
+                # Not built yet; the first lookup reads the current state from Chroma
+                return
+            for chunk_id in self._doc_chunks.pop(doc_id, []):
+                self._chunk_positions.pop(chunk_id, None)
+            self._doc_collections.pop(doc_id, None)
+            if chunk_ids:
+                self._doc_chunks[doc_id] = list(chunk_ids)
+                self._doc_collections[doc_id] = collection_name or self.collection.name
+                for index, chunk_id in enumerate(chunk_ids):
+                    self._chunk_positions[chunk_id] = (doc_id, index)
+    
+    def _build_chunk_metadata(self, chunk: Dict[str, Any], doc_id: str,
+                              metadata: Optional[Dict] = None) -> Dict[str, Any]:
+        """Combine chunk metadata with document metadata"""
+        chunk_meta = {
+            'doc_id': doc_id,
+            'chunk_index': chunk['chunk_index'],
+            'token_count': chunk['token_count'],
+            'content_hash': chunk['content_hash'],
+            'char_start': chunk.get('char_start', 0),
+            'char_end': chunk.get('char_end', len(chunk['text'])),
+            'type': chunk['type'],
+            'indexed_at': datetime.now().isoformat()
+        }
+        if metadata:
+            chunk_meta.update(metadata)
+        return chunk_meta
     
-    def _generate_chunk_id(self, doc_id: str, chunk_index: int) -> str:
-        """Generate unique chunk ID"""
-        content = f"{doc_id}_{chunk_index}"
+    def _hash_content(self, text: str) -> str:
+        """Stable hash of a chunk's text"""
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _generate_chunk_id(self, doc_id: str, content_hash: str, occurrence: int = 0) -> str:
+        """
+        Generate a content-addressed chunk ID
+
+        The ID depends on the chunk's text rather than its position, so inserting
+        a paragraph near the top of a manuscript leaves later chunk IDs untouched.
+        """
+        content = f"{doc_id}_{content_hash}_{occurrence}"
         return hashlib.md5(content.encode()).hexdigest()
     
+    def document_owner(self, doc_id: str) -> Optional[Any]:
+        """user_id stored on a document's chunks (None if it has none indexed)"""
+        collection = self._collection_for_doc(doc_id)
+        collections = [collection] if collection is not None else self.collection_router.all_collections()
+        for collection in collections:
+            results = collection.get(where={"doc_id": doc_id}, limit=1, include=['metadatas'])
+            if results['ids']:
+                return (results['metadatas'][0] or {}).get('user_id')
+        return None
+
     def delete_document(self, doc_id: str) -> int:
         """
         Delete all chunks for a document
@@ -264,18 +1442,31 @@ class VectorStore:
         Returns:
             Number of chunks deleted
         """
-        # Get all chunks for the document
-        results = self.collection.get(where={"doc_id": doc_id})
+        # Get all chunks for the document (checking every partition if its home is unknown)
+        collection = self._collection_for_doc(doc_id)
+        collections = [collection] if collection is not None else self.collection_router.all_collections()
+        self._set_doc_chunks(doc_id, None)
+        self.document_index.remove(doc_id)
+        
+        deleted = 0
+        if self.deduplicator is not None:
+            # Deduplicated chunks first, so they are not promoted to canonical below
+            reference_ids = list(self.deduplicator.references_for_doc(doc_id))
+            if reference_ids:
+                self._collection_delete(collections[0], reference_ids)
+                deleted += len(reference_ids)
         
-        if results['ids']:
-            self.collection.delete(ids=results['ids'])
-            return len(results['ids'])
+        for collection in collections:
+            results = collection.get(where={"doc_id": doc_id}, include=[])
+            if results['ids']:
+                self._collection_delete(collection, results['ids'])
+                deleted += len(results['ids'])
         
-        return 0
+        return deleted
     
-    def update_document(self, text: str, doc_id: str, metadata: Optional[Dict] = None) -> List[str]:
+    def update_document(self, text: TextSource, doc_id: str, metadata: Optional[Dict] = None) -> List[str]:
         """
-        Update a document by deleting old chunks and adding new ones
+        Update a document, re-embedding only the chunks whose content changed
         
         Args:
             text: New document text
@@ -283,10 +1474,114 @@ class VectorStore:
             metadata: Updated metadata
             
         Returns:
-            List of new chunk IDs
+            List of chunk IDs for the new version, in document order
+        """
+        return self.sync_document(text, doc_id, metadata)['chunk_ids']
+    
+    def sync_document(self, text: TextSource, doc_id: str, metadata: Optional[Dict] = None,
+                      chunks: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
-        # Delete old chunks
-        self.delete_document(doc_id)
+        Diff a document's new chunk list against the stored one and apply the delta
+
+        Because chunk IDs are content-addressed, an unchanged chunk keeps its ID
+        wherever it moves. Only new chunks are embedded, vanished chunks are
+        deleted, and surviving chunks get a metadata-only update when their
+        position or document metadata changed.
         
-        # Add new chunks
-        return self.add_document(text, doc_id, metadata) 
\ No newline at end of file
+        Args:
+            text: New document text
+            doc_id: Document identifier
+            metadata: Updated metadata
+            chunks: The document already split by chunk_document() (skips re-chunking)
+            
+        Returns:
+            Dict with the new chunk IDs and added/removed/moved/unchanged counts
+        """
+        if metadata and metadata.get('user_id') is not None:
+            collection = self._collection_for_metadata(metadata)
+        else:
+            collection = self._collection_for_doc(doc_id) or self.collection
+        
+        existing = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+        stored = dict(zip(existing['ids'], existing['metadatas']))
+        if self.deduplicator is not None:
+            # Deduplicated chunks are stored too, just without their own embedding
+            for chunk_id, row in self.deduplicator.references_for_doc(doc_id).items():
+                stored[chunk_id] = row['metadata']
+
+        chunk_ids = []
+        new_batch = []
+        added = 0
+        moved_ids = []
+        moved_metadatas = []
+
+        for chunk in chunks if chunks is not None else self.iter_chunks(text, doc_id):
+            chunk_ids.append(chunk['id'])
+
+            if chunk['id'] not in stored:
+                new_batch.append(chunk)
+                if len(new_batch) >= EMBED_BATCH_SIZE:
+                    self._insert_chunks(new_batch, doc_id, metadata, collection)
+                    added += len(new_batch)
+                    new_batch = []
+                continue
+
+            # Surviving chunks only need their metadata refreshed if something moved
+            chunk_meta = self._build_chunk_metadata(chunk, doc_id, metadata)
+            old_meta = stored[chunk['id']] or {}
+            if any(old_meta.get(key) != value for key, value in chunk_meta.items() if key != 'indexed_at'):
+                moved_ids.append(chunk['id'])
+                moved_metadatas.append(chunk_meta)
+
+        if new_batch:
+            self._insert_chunks(new_batch, doc_id, metadata, collection)
+            added += len(new_batch)
+
+        removed_ids = list(set(stored) - set(chunk_ids))
+        if removed_ids:
+            self._collection_delete(collection, removed_ids)
+
+        if moved_ids:
+            self._collection_update(collection, moved_ids, moved_metadatas)
+
+        self._set_doc_chunks(doc_id, chunk_ids, collection.name)
+        if added or removed_ids or doc_id not in self.document_index:
+            self._refresh_document_vector(doc_id, chunk_ids, collection, metadata)
+        else:
+            self.document_index.update_info(doc_id, _document_info(metadata, len(chunk_ids)))
+        return {
+            'chunk_ids': chunk_ids,
+            'added': added,
+            'removed': len(removed_ids),
+            'moved': len(moved_ids),
+            'unchanged': len(chunk_ids) - added - len(moved_ids)
+        }
+
+
+def _document_info(metadata: Optional[Dict], chunks: int) -> Dict[str, Any]:
+    """Document details kept next to its embedding in the document index"""
+    return {'title': (metadata or {}).get('title'), 'chunks': chunks}
+
+
+def _filter_value(where: Optional[Dict], key: str) -> Optional[Any]:
+    """Equality value for key in a Chroma where filter (top level or inside $and)"""
+    values = _filter_values(where, key)
+    return values[0] if values is not None and len(values) == 1 else None
+
+
+def _filter_values(where: Optional[Dict], key: str) -> Optional[List[Any]]:
+    """Values key is restricted to by a where filter (equality, $eq or $in; top level or inside $and)"""
+    if not where:
+        return None
+    if key in where:
+        value = where[key]
+        if not isinstance(value, dict):
+            return [value]
+        if '$in' in value:
+            return list(value['$in'])
+        return [value['$eq']] if '$eq' in value else None
+    for clause in where.get('$and', []):
+        values = _filter_values(clause, key)
+        if values is not None:
+            return values
+    return None
@@ -74,6 +74,15 @@ fi
 export PYTHONPATH="${PYTHONPATH}:$(pwd)"
 echo "🐍 PYTHONPATH set to: $PYTHONPATH"
 
+# One worker only: Chroma runs embedded (PersistentClient on a local persist
+# directory), which is not multi-process safe - several workers writing the
+# same sqlite files and embedding cache corrupt them. Scale with more
+# instances (each with its own volume) until Chroma moves to a server.
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    echo "⚠️ WEB_CONCURRENCY=$WEB_CONCURRENCY ignored: embedded Chroma needs a single worker process"
+fi
+
 # Start the application with Railway-optimized settings
 # Use hypercorn with the correct module path
 echo "🚀 Starting server with hypercorn..."